@@ -0,0 +1,281 @@
+"""Agent which runs on each slave node and takes its orders from the
+controller over the control channel.
+
+The agent connects to the controller once and keeps the connection open,
+reconnecting with a backoff if it drops. When a job arrives it waits until the
+job's start time, runs the load generator in process and sends the results
+straight back, so the controller does not need to poll the node for them.
+Results which could not be sent are kept and sent again as soon as the agent
+has reconnected. A job which fails sends back its error in place of its
+results, so the controller does not wait for results which will never come.
+This includes a job which arrives after its start time, as it would not
+start together with the other nodes.
+While the job runs, the requests of each second are sent to the controller as
+they happen, so it can show the benchmark live. These are only of use while
+they are fresh, so any which cannot be sent are dropped.
+
+Usage:
+    python3 agent.py --controller 10.0.0.1:7700 --id 10.0.0.2 \
+        --token-file agent.token
+
+The token can also be given in the `AGENT_TOKEN` environment variable. It is
+not taken on the command line, where other users of the node could read it.
+"""
+
+import typing as _t
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import control_channel
+import load_generator
+
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+# Seconds before the start time to stop sleeping and spin instead, as sleeps
+# can overshoot.
+SPIN_TIME = 0.005
+# Seconds a job can arrive after its start time and still be run. A job which
+# arrives later than this is rejected, as the node would not start together
+# with the others.
+LATE_START_TOLERANCE = 0.05
+
+
+class LateStart(Exception):
+    """A job arrived after the time it was to start at."""
+
+
+def wait_until(ts: float) -> None:
+    """Waits until an epoch timestamp with sub-millisecond precision.
+    Args:
+        ts (float): Epoch timestamp to wait until
+    """
+    delay = ts - time.time()
+    if delay > SPIN_TIME:
+        time.sleep(delay - SPIN_TIME)
+    while time.time() < ts:
+        pass
+
+
+class Agent:
+    """Connects to the controller and runs the jobs it sends."""
+
+    def __init__(self, controller: str, agent_id: str, token: str):
+        """Creates an agent.
+        Args:
+            controller (str): `host:port` of the controller's control server
+            agent_id (str): ID of the agent
+            token (str): Token to authenticate with
+        """
+        host, _, port = controller.rpartition(':')
+        self.controller = (host, int(port))
+        self.agent_id = agent_id
+        self.token = token
+        self.sock: _t.Optional[socket.socket] = None
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Results which have not been sent yet, by job ID.
+        self._unsent: _t.Dict[int, _t.Dict[str, _t.Any]] = {}
+        self._unsent_lock = threading.Lock()
+
+    def send(self, message: _t.Dict[str, _t.Any]) -> None:
+        """Sends a message to the controller."""
+        control_channel.send_message(self.sock, message, self._write_lock)
+
+    def run_forever(self) -> None:
+        """Keeps connected to the controller until stopped."""
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                self.serve()
+                delay = RECONNECT_DELAY
+            except OSError as e:
+                print(f'Control channel error: {e}', file=sys.stderr)
+            self._stop.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def stop(self) -> None:
+        """Stops the agent."""
+        self._stop.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def serve(self) -> None:
+        """Connects to the controller and handles messages until the
+        connection closes.
+        """
+        self.sock = socket.create_connection(self.controller)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        reader = control_channel.MessageReader(self.sock)
+        try:
+            self.sock.settimeout(control_channel.HELLO_TIMEOUT)
+            challenge = reader.read()
+            self.sock.settimeout(None)
+            if challenge is None or challenge.get('type') != 'challenge':
+                raise ConnectionError('The controller sent no challenge')
+            self.send({
+                'type': 'hello',
+                'agent_id': self.agent_id,
+                'proof': control_channel.token_proof(
+                    self.token,
+                    challenge['nonce']
+                ),
+            })
+            self.send_results()
+            while True:
+                message = reader.read()
+                if message is None:
+                    return
+                self.handle(message)
+        finally:
+            reader.close()
+            self.sock.close()
+
+    def handle(self, message: _t.Dict[str, _t.Any]) -> None:
+        """Handles a message from the controller."""
+        if message['type'] == 'job':
+            threading.Thread(
+                target=self.run_job,
+                args=(message,),
+                daemon=True
+            ).start()
+        elif message['type'] == 'ping':
+            self.send({
+                'type': 'pong',
+                'sent_at': message.get('sent_at'),
+                'time': time.time(),
+            })
+
+    def run_job(self, job: _t.Dict[str, _t.Any]) -> None:
+        """Runs a benchmark and sends its results back, or its error if it
+        fails.
+        Args:
+            job (dict): The `job` message
+        """
+        try:
+            results = self._run_job(job)
+        except Exception as e:
+            traceback.print_exc()
+            results = {'error': f'{type(e).__name__}: {e}'}
+        with self._unsent_lock:
+            self._unsent[job['job_id']] = results
+        self.send_results()
+
+    def _run_job(self, job: _t.Dict[str, _t.Any]) -> _t.Dict[str, _t.Any]:
+        """Runs a benchmark.
+        Args:
+            job (dict): The `job` message
+        Returns:
+            dict: The results
+        """
+        # The start time is by the controller's clock.
+        offset = job.get('clock_offset') or 0
+        late = time.time() - (job['start_at'] + offset)
+        if late > LATE_START_TOLERANCE:
+            raise LateStart(
+                f'The job arrived {late * 1000:.0f} ms after its start time'
+            )
+        wait_until(job['start_at'] + offset)
+
+        stats = asyncio.run(load_generator.run(
+            job['url'],
+            job['num_requests'],
+            job.get('concurrency') or load_generator.DEFAULT_CONCURRENCY,
+            job.get('pipeline') or load_generator.DEFAULT_PIPELINE,
+            on_metrics=lambda metrics: self.send_metrics(
+                job['job_id'],
+                metrics
+            ),
+        ))
+        # Keep a copy on disk to help when debugging a node.
+        load_generator.write_results(stats)
+        results = stats.as_dict()
+        # Report when the run actually started by the controller's clock, so
+        # the controller can work out the skew between the nodes.
+        results['started_at'] = stats.started_at - offset
+        return results
+
+    def send_metrics(
+        self,
+        job_id: int,
+        metrics: _t.Dict[str, _t.Any]
+    ) -> None:
+        """Sends the live metrics of a job, dropping them if they cannot be
+        sent.
+        Args:
+            job_id (int): ID of the job
+            metrics (dict): The requests since the last metrics, see
+                `LoadStats.take_window`
+        """
+        try:
+            self.send({
+                'type': 'metrics',
+                'job_id': job_id,
+                'metrics': metrics,
+            })
+        except OSError:
+            pass
+
+    def send_results(self) -> None:
+        """Sends the results which have not been sent yet. Any which fail to
+        send are kept until the agent reconnects.
+        """
+        with self._unsent_lock:
+            for job_id, results in list(self._unsent.items()):
+                try:
+                    self.send({
+                        'type': 'result',
+                        'job_id': job_id,
+                        'results': results,
+                    })
+                except OSError as e:
+                    print(f'Failed to send results: {e}', file=sys.stderr)
+                    return
+                del self._unsent[job_id]
+
+
+def parse_args(args: _t.Optional[_t.List[str]] = None) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--controller', default=os.getenv('CONTROL_CHANNEL_ADDRESS'),
+        help='host:port of the controller'
+    )
+    parser.add_argument(
+        '--id', default=os.getenv('AGENT_ID'), help='ID of the agent'
+    )
+    parser.add_argument(
+        '--token-file', default=os.getenv('AGENT_TOKEN_FILE'),
+        help='File holding the token to authenticate with'
+    )
+    args = parser.parse_args(args)
+    args.token = os.getenv('AGENT_TOKEN')
+    if args.token_file:
+        with open(args.token_file) as f:
+            args.token = f.read().strip()
+    if not (args.controller and args.id and args.token):
+        parser.error(
+            '--controller, --id and --token-file or AGENT_TOKEN are required'
+        )
+    return args
+
+
+def main(args: _t.Optional[_t.List[str]] = None) -> int:
+    """Entry point when run as a script."""
+    args = parse_args(args)
+    if load_generator.uvloop is not None:
+        load_generator.uvloop.install()
+    Agent(args.controller, args.id, args.token).run_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,63 +1,304 @@
+import typing as _t
+import asyncio
+import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import threading
+import time
+import redis
 import controller
 import job_queue
 
 connection = job_queue.connection
 benchmark_queue = job_queue.Queue()
 
+STREAMS = ('benchmark_new', 'benchmark_done')
+
+# Every controller reads the streams as part of the same consumer group, so
+# each event is handled by only one of them. The consumer name must be unique
+# to each controller process, and is also the name its leases are held under.
+CONSUMER_GROUP = os.environ.get('CONSUMER_GROUP', 'controllers')
+CONSUMER_NAME = job_queue.LEASE_OWNER
+
+# Milliseconds to wait for new events before checking for events to reclaim.
+BLOCK_TIMEOUT = 5000
+
+# Milliseconds an event can go unacknowledged before it is reclaimed from the
+# controller which read it, on the basis that the controller has crashed.
+CLAIM_IDLE_TIME = int(os.environ.get('CONSUMER_CLAIM_IDLE_TIME', 60 * 1000))
+
+# Seconds between each check for events to reclaim.
+CLAIM_INTERVAL = 30
+
+# Number of benchmarks a controller runs at once. Each one runs on a thread
+# from a fixed pool, and no more benchmarks are admitted while every thread
+# is busy, so the other controllers can take them instead.
+MAX_WORKERS = int(os.environ.get('CONSUMER_MAX_WORKERS', 8))
+
+# Number of benchmarks which can be waiting in the queue before the
+# controllers stop reading new benchmarks from the stream, leaving them there
+# until the queue has drained, and the site is told to stop accepting them.
+MAX_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_MAX_DEPTH', 500))
+
+# Key which is set while the queue is full, to tell the site to stop
+# accepting benchmarks. It expires after `BACKPRESSURE_TTL` seconds unless a
+# controller refreshes it, so the site does not keep refusing benchmarks if
+# every controller is down.
+BACKPRESSURE_KEY = 'benchmark.backpressure'
+BACKPRESSURE_TTL = 30
+
+# Hash of each controller's metrics by consumer name.
+METRICS_KEY = 'benchmark.consumers'
+
 
 class BenchmarkConsumer:
+    """Handles the events sent to the controllers. Each event is only
+    acknowledged once it has been handled, so an event read by a controller
+    which crashes before handling it is reclaimed and handled by another.
+    Events may therefore be handled more than once, which the handlers allow
+    for.
+    """
     connection = job_queue.connection
     queue = job_queue.Queue()
 
-    def __init__(self):
-        self.consumer = self.connection.pubsub()
-        for channel in ['benchmark_new', 'benchmark_done']:
-            self.consumer.subscribe(channel)
+    def __init__(
+        self,
+        connection: _t.Optional[redis.Redis] = None,
+        queue: _t.Optional[job_queue.Queue] = None,
+        group: str = CONSUMER_GROUP,
+        name: str = CONSUMER_NAME,
+        max_workers: int = MAX_WORKERS,
+        max_queue_depth: int = MAX_QUEUE_DEPTH,
+    ):
+        """Joins the consumer group, creating it if needed.
+        Args:
+            connection: Connection to the event bus.
+            queue: The job queue.
+            group: Name of the consumer group.
+            name: Name of this consumer within the group.
+            max_workers: Number of benchmarks to run at once.
+            max_queue_depth: Number of benchmarks which can be waiting in the
+                queue before new benchmarks are left on the stream.
+        """
+        if connection is not None:
+            self.connection = connection
+        if queue is not None:
+            self.queue = queue
+        self.group = group
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='benchmark'
+        )
+        self._stop = threading.Event()
+        self._last_claim = 0.0
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.started = 0
+        self.finished = 0
+        self.failed = 0
+        for stream in STREAMS:
+            try:
+                self.connection.xgroup_create(
+                    stream,
+                    self.group,
+                    id='0',
+                    mkstream=True
+                )
+            except redis.ResponseError as e:
+                # The group already exists.
+                if 'BUSYGROUP' not in str(e):
+                    raise
 
     def run(self):
         """Runs the consumer."""
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - self._last_claim >= CLAIM_INTERVAL:
+                    self.reclaim()
+                self.poll()
+                # Picks up the nodes freed by leases which have expired.
+                self.run_next_job()
+                self.report_failed()
+                self.report()
+        finally:
+            self.executor.shutdown(wait=True)
 
-        # Listen for new messages and action.
-        for message in self.consumer.listen():
-            if message['type'] != 'message':
-                continue
-            try:
-                data = json.loads(message['data'] or b'{}')
-            except json.JSONDecodeError:
-                logging.error(
-                    'Could not decode message: {}'.format(message['data'])
-                )
-                continue
+    def stop(self):
+        """Stops the consumer after the current poll."""
+        self._stop.set()
 
-            fn = getattr(self, message['channel'].decode('utf-8'), None)
-            if fn is None:
-                logging.error(
-                    'Could not find method for channel: {}'.format(
-                        message['channel']
-                    )
+    def saturated(self) -> bool:
+        """Returns True if the queue is too deep to take more benchmarks."""
+        return self.queue.size() >= self.max_queue_depth
+
+    def metrics(self) -> _t.Dict[str, _t.Any]:
+        """Returns the consumer's metrics."""
+        return {
+            'in_flight': self.in_flight,
+            'max_workers': self.max_workers,
+            'started': self.started,
+            'finished': self.finished,
+            'failed': self.failed,
+            'queue_depth': self.queue.size(),
+            'max_queue_depth': self.max_queue_depth,
+            'updated_at': time.time(),
+        }
+
+    def report(self) -> None:
+        """Publishes the consumer's metrics, and tells the site whether to
+        accept new benchmarks.
+        """
+        metrics = self.metrics()
+        self.connection.hset(METRICS_KEY, self.name, json.dumps(metrics))
+        if metrics['queue_depth'] >= self.max_queue_depth:
+            self.connection.set(
+                BACKPRESSURE_KEY,
+                json.dumps({
+                    'queue_depth': metrics['queue_depth'],
+                    'max_queue_depth': self.max_queue_depth,
+                }),
+                ex=BACKPRESSURE_TTL
+            )
+        else:
+            self.connection.delete(BACKPRESSURE_KEY)
+
+    def report_failed(self) -> int:
+        """Tells the site about the benchmarks which were given up on after
+        being tried too many times, so they do not stay pending.
+        Returns:
+            The number of benchmarks reported.
+        """
+        count = 0
+        while True:
+            job = self.queue.take_failed()
+            if job is None:
+                return count
+            logging.error(
+                'Benchmark {} was given up on after {} attempts'.format(
+                    job['benchmark_id'],
+                    job.get('attempts')
                 )
-                continue
+            )
+            controller.fail_benchmark(
+                job['benchmark_id'],
+                job['num_servers'],
+                job['num_requests']
+            )
+            count += 1
 
-            try:
-                t = threading.Thread(target=fn, kwargs=data)
-                t.start()
-            except Exception as e:
-                logging.error(
-                    'Could not run thread for channel: {}'.format(
-                        message['channel']
-                    )
+    def poll(self, block: _t.Optional[int] = BLOCK_TIMEOUT) -> int:
+        """Reads and handles new events.
+        Args:
+            block: Milliseconds to wait for an event, or None to not wait.
+        Returns:
+            The number of events read.
+        """
+        # New benchmarks are left on the stream while the queue is full.
+        streams = STREAMS
+        if self.saturated():
+            streams = tuple(s for s in STREAMS if s != 'benchmark_new')
+        response = self.connection.xreadgroup(
+            self.group,
+            self.name,
+            {stream: '>' for stream in streams},
+            count=100,
+            block=block
+        )
+        count = 0
+        for stream, entries in response or []:
+            for entry_id, fields in entries:
+                self.process(stream, entry_id, fields)
+                count += 1
+        return count
+
+    def reclaim(self, min_idle_time: int = CLAIM_IDLE_TIME) -> int:
+        """Takes over and handles the events which other consumers read but
+        did not acknowledge in time.
+        Args:
+            min_idle_time: Milliseconds an event must have gone
+                unacknowledged for.
+        Returns:
+            The number of events reclaimed.
+        """
+        self._last_claim = time.monotonic()
+        count = 0
+        for stream in STREAMS:
+            start_id = '0-0'
+            while True:
+                response = self.connection.xautoclaim(
+                    stream,
+                    self.group,
+                    self.name,
+                    min_idle_time,
+                    start_id=start_id,
+                    count=100
                 )
-                logging.error(e)
+                start_id, entries = response[0], response[1]
+                for entry_id, fields in entries:
+                    if fields is None:
+                        continue
+                    logging.warning(
+                        'Reclaimed event {} from {}'.format(entry_id, stream)
+                    )
+                    self.process(stream, entry_id, fields)
+                    count += 1
+                if start_id in (b'0-0', '0-0'):
+                    break
+        return count
+
+    def process(
+        self,
+        stream: _t.Union[bytes, str],
+        entry_id: _t.Union[bytes, str],
+        fields: _t.Dict[bytes, bytes],
+    ) -> None:
+        """Handles an event and acknowledges it. An event which fails to be
+        handled is left unacknowledged to be reclaimed later, while one which
+        can never be handled is acknowledged and dropped.
+        """
+        if isinstance(stream, bytes):
+            stream = stream.decode('utf-8')
+        try:
+            data = json.loads(fields.get(b'data') or b'{}')
+        except json.JSONDecodeError:
+            logging.error(
+                'Could not decode message: {}'.format(fields.get(b'data'))
+            )
+            self.connection.xack(stream, self.group, entry_id)
+            return
+
+        fn = getattr(self, stream, None)
+        if fn is None:
+            logging.error(
+                'Could not find method for channel: {}'.format(stream)
+            )
+            self.connection.xack(stream, self.group, entry_id)
+            return
+
+        try:
+            fn(**data)
+        except Exception as e:
+            logging.error(
+                'Could not handle event {} from {}'.format(entry_id, stream)
+            )
+            logging.error(e)
+            return
+        self.connection.xack(stream, self.group, entry_id)
 
     def benchmark_new(
         self,
         benchmark_id: int,
         domain: str,
         num_servers: int,
-        num_requests: int
+        num_requests: int,
+        estimated_runtime: _t.Optional[float] = None,
+        priority: int = job_queue.PRIORITY_PAID,
+        account_id: _t.Optional[int] = None,
+        weight: float = 1,
     ) -> None:
         """Processes messages received via the `benchmark_new` channel.
         The method will add a benchmark to the queue and run if it is possible.
@@ -67,34 +308,144 @@ class BenchmarkConsumer:
             domain: The domain to benchmark.
             num_servers: The number of servers to use.
             num_requests: The number of requests to run per server.
+            estimated_runtime: Seconds the benchmark is expected to take,
+                estimated from previous benchmarks.
+            priority: The priority class of the account's package.
+            account_id: The ID of the account which requested the benchmark.
+            weight: The account's share of the queue within its priority
+                class.
         """
-        self.queue.push(benchmark_id, domain, num_servers, num_requests)
+        # The benchmark is not queued again if the event is redelivered.
+        self.queue.push(
+            benchmark_id,
+            domain,
+            num_servers,
+            num_requests,
+            estimated_runtime,
+            priority,
+            account_id,
+            weight
+        )
         self.run_next_job()
 
-    def benchmark_done(self, num_servers: int) -> None:
+    def benchmark_done(
+        self,
+        num_servers: int,
+        benchmark_id: _t.Optional[int] = None,
+        owner: _t.Optional[str] = None,
+    ) -> None:
         """Processes messages received via the `benchmark_done` channel.
-        Releases the number of active nodes and runs the next benchmark in the
-        queue.
+        Releases the benchmark's lease on its nodes and runs the next
+        benchmark in the queue.
 
         Args:
             num_servers: The number of servers that can be released back into
                 the pool.
+            benchmark_id: The ID of the benchmark which finished. Without it
+                the nodes are freed once the benchmark's lease expires.
+            owner: Name of the controller which ran the benchmark. Its lease
+                is not released if another controller has since taken it.
         """
-        self.queue.remove_active_nodes(num_servers)
+        # The nodes are only released once if the event is redelivered.
+        if benchmark_id is not None:
+            self.queue.release(benchmark_id, owner)
         self.run_next_job()
 
     def run_next_job(self):
-        """Runs the next benchmark in the queue."""
-        if not self.queue.can_run_next_job():
-            return
-        next_job = self.queue.pop()
-        controller.run_benchmark(
-            next_job['benchmark_id'],
-            next_job['domain'],
-            next_job['num_servers'],
-            next_job['num_requests']
-        )
+        """Runs the benchmarks in the queue for which there are enough nodes
+        available, as long as there is a free worker to run them on.
+        """
+        while True:
+            with self._lock:
+                if self.in_flight >= self.max_workers:
+                    return
+                next_job = self.queue.admit()
+                if next_job is None:
+                    return
+                self.in_flight += 1
+                self.started += 1
+            self.executor.submit(self._run_job, next_job)
+
+    def _run_job(self, job: _t.Dict[str, _t.Any]) -> None:
+        """Runs a benchmark on a worker, then frees the worker and runs the
+        next benchmark. A benchmark which fails, other than by losing its
+        lease, is reported to the site as failed so it does not stay pending.
+        """
+        try:
+            self.run_job(job)
+        except job_queue.LeaseLost as e:
+            # The benchmark has been put back on the queue to be run again.
+            logging.error(str(e))
+            with self._lock:
+                self.failed += 1
+        except Exception as e:
+            logging.error(
+                'Benchmark {} failed: {}'.format(job['benchmark_id'], e)
+            )
+            with self._lock:
+                self.failed += 1
+            try:
+                controller.fail_benchmark(
+                    job['benchmark_id'],
+                    job['num_servers'],
+                    job['num_requests']
+                )
+            except Exception as e:
+                logging.error(
+                    'Could not report benchmark {} as failed: {}'.format(
+                        job['benchmark_id'],
+                        e
+                    )
+                )
+        else:
+            with self._lock:
+                self.finished += 1
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if not self._stop.is_set():
+            self.run_next_job()
+
+    def run_job(self, job: _t.Dict[str, _t.Any]) -> None:
+        """Runs a benchmark which has been admitted, keeping the lease on its
+        nodes renewed until it finishes. If the lease is lost the benchmark
+        is cancelled, as it has been put back on the queue to be run again.
+
+        Args:
+            job: The benchmark as returned by `Queue.admit`.
+        Raises:
+            LeaseLost: The lease was lost and the benchmark cancelled.
+        """
+        asyncio.run(self.run_job_async(job))
+
+    async def run_job_async(self, job: _t.Dict[str, _t.Any]) -> None:
+        """Runs a benchmark from an event loop, see `run_job`."""
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(controller.run_benchmark_async(
+            job['benchmark_id'],
+            job['domain'],
+            job['num_servers'],
+            job['num_requests'],
+        ))
+        with self.queue.lease(
+            job['benchmark_id'],
+            on_lost=lambda: loop.call_soon_threadsafe(task.cancel)
+        ) as lost:
+            try:
+                await task
+            except asyncio.CancelledError:
+                if not lost.is_set():
+                    raise
+                raise job_queue.LeaseLost(
+                    'Benchmark {} was cancelled as its lease was lost'
+                    .format(job['benchmark_id'])
+                )
 
 
 if __name__ == '__main__':
-    BenchmarkConsumer().run()
+    controller.node_pool.start()
+    try:
+        BenchmarkConsumer().run()
+    finally:
+        controller.node_pool.stop()
+        controller.node_pool.drain()
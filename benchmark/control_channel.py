@@ -0,0 +1,575 @@
+"""A persistent control channel between the controller and the node agents.
+
+Each node runs `agent.py`, which opens a single long-lived TCP connection to
+the controller's `ControlServer` and keeps it open for as long as the node is
+alive. Jobs are sent down that connection and the results are streamed back
+up it as soon as the load generator finishes, so scheduling a benchmark and
+collecting its results no longer needs a fresh SSH or SCP connection.
+
+Messages are JSON objects, one per line. Every message has a `type`:
+
+    challenge controller -> agent  Nonce for the agent to prove itself
+                                   with, sent as soon as it connects.
+    hello   agent -> controller  Identifies the agent, must be sent in
+                                 reply to the challenge.
+    job     controller -> agent  Benchmark to run.
+    result  agent -> controller  Results of a job, or an `error` if the
+                                 job failed.
+    metrics agent -> controller  Requests made by a running job since its
+                                 last metrics.
+    ping    either way           Liveness check, answered with a `pong`
+                                 which carries the sender's clock.
+
+Agents prove who they are with a token derived from a secret shared with the
+controller, see `agent_token`. The token itself is never sent. Instead the
+agent answers a nonce picked by the controller for each connection with an
+HMAC of the nonce keyed with its token, see `token_proof`, so a hello which is
+overheard cannot be replayed.
+
+This module only depends on the standard library as it is copied onto the
+nodes alongside `agent.py`.
+"""
+
+import typing as _t
+import asyncio
+import hashlib
+import hmac
+import collections
+import itertools
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+
+
+CONTROL_CHANNEL_BIND = os.getenv('CONTROL_CHANNEL_BIND', '0.0.0.0')
+CONTROL_CHANNEL_PORT = int(os.getenv('CONTROL_CHANNEL_PORT', 7700))
+# Address the agents connect to, i.e. how the nodes reach the controller.
+CONTROL_CHANNEL_ADDRESS = os.getenv(
+    'CONTROL_CHANNEL_ADDRESS',
+    f'127.0.0.1:{CONTROL_CHANNEL_PORT}'
+)
+
+# Number of pings used to estimate an agent's clock offset.
+CLOCK_SAMPLES = 5
+
+# Seconds to wait for an agent to connect once its node is up.
+AGENT_CONNECT_TIMEOUT = int(os.getenv('AGENT_CONNECT_TIMEOUT', 120))
+HELLO_TIMEOUT = 10
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Number of metrics kept for each job until they are taken, any older ones
+# are dropped.
+MAX_METRICS = 60
+
+# Job IDs are unique across every connection, and across restarts of the
+# controller, so that results an agent sends again after reconnecting can
+# only ever be matched to their own job.
+_job_ids = itertools.count(int(time.time() * 1000))
+
+
+def control_channel_secret() -> str:
+    """Returns the secret the agent tokens are derived from."""
+    return os.getenv('CONTROL_CHANNEL_SECRET') or os.environ['JWT_SECRET_KEY']
+
+
+def agent_token(agent_id: str, secret: _t.Optional[str] = None) -> str:
+    """Returns the token an agent authenticates itself with.
+    Args:
+        agent_id (str): ID of the agent
+        secret (str): Shared secret. Defaults to `control_channel_secret()`
+    Returns:
+        str: The token
+    """
+    secret = secret or control_channel_secret()
+    return hmac.new(
+        secret.encode(),
+        agent_id.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def token_proof(token: str, nonce: str) -> str:
+    """Returns the proof that an agent holds its token, for the nonce of a
+    challenge.
+    Args:
+        token (str): The agent's token
+        nonce (str): Nonce sent by the controller
+    Returns:
+        str: The proof
+    """
+    return hmac.new(token.encode(), nonce.encode(), hashlib.sha256).hexdigest()
+
+
+def send_message(
+    sock: socket.socket,
+    message: _t.Dict[str, _t.Any],
+    lock: _t.Optional[threading.Lock] = None,
+) -> None:
+    """Sends a message over a socket.
+    Args:
+        sock (socket.socket): Socket to write to
+        message (dict): Message to send
+        lock (threading.Lock): Lock held while writing, for sockets that are
+            shared between threads
+    """
+    data = json.dumps(message, separators=(',', ':')).encode() + b'\n'
+    if lock is None:
+        sock.sendall(data)
+        return
+    with lock:
+        sock.sendall(data)
+
+
+class MessageReader:
+    """Reads newline delimited messages from a socket."""
+
+    def __init__(self, sock: socket.socket):
+        self.file = sock.makefile('rb')
+
+    def read(self) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Returns the next message, or None once the connection is closed.
+        """
+        line = self.file.readline(MAX_MESSAGE_SIZE + 1)
+        if not line:
+            return None
+        if len(line) > MAX_MESSAGE_SIZE:
+            raise ValueError('Message too large')
+        return json.loads(line)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class AgentConnection:
+    """The controller's end of the connection to a single agent."""
+
+    def __init__(self, agent_id: str, sock: socket.socket):
+        self.agent_id = agent_id
+        self.sock = sock
+        self.connected = True
+        self._write_lock = threading.Lock()
+        self._results: _t.Dict[int, _t.Dict[str, _t.Any]] = {}
+        self._pongs: _t.Dict[float, _t.Tuple[float, float]] = {}
+        self._metrics: _t.Dict[int, _t.Deque[_t.Dict[str, _t.Any]]] = {}
+        self._condition = threading.Condition()
+        # Called whenever results arrive or the agent disconnects, to wake up
+        # anything waiting on the connection from an event loop.
+        self._listeners: _t.Set[_t.Callable[[], None]] = set()
+        self.last_job_id: _t.Optional[int] = None
+        # Seconds the agent's clock is ahead of the controller's clock.
+        self.clock_offset = 0.0
+        # Seconds a message takes to reach the agent and come back.
+        self.rtt = 0.0
+
+    def send(self, message: _t.Dict[str, _t.Any]) -> None:
+        """Sends a message to the agent."""
+        send_message(self.sock, message, self._write_lock)
+
+    def send_job(
+        self,
+        start_at: float,
+        num_requests: int,
+        url: str,
+        concurrency: _t.Optional[int] = None,
+        pipeline: _t.Optional[int] = None,
+    ) -> int:
+        """Sends a benchmark for the agent to run.
+        Args:
+            start_at (float): Epoch timestamp, by the controller's clock, to
+                start the benchmark at
+            num_requests (int): Number of requests to run
+            url (str): URL to benchmark
+            concurrency (int): Number of concurrent connections to use
+            pipeline (int): Number of requests to pipeline per connection
+        Returns:
+            int: ID of the job
+        """
+        job_id = next(_job_ids)
+        self.last_job_id = job_id
+        self.send({
+            'type': 'job',
+            'job_id': job_id,
+            'start_at': start_at,
+            'clock_offset': self.clock_offset,
+            'num_requests': num_requests,
+            'url': url,
+            'concurrency': concurrency,
+            'pipeline': pipeline,
+        })
+        return job_id
+
+    def result(
+        self,
+        job_id: _t.Optional[int] = None,
+        timeout: _t.Optional[float] = 0,
+    ) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Returns the results of a job once the agent has sent them back.
+        The results are only returned once.
+        Args:
+            job_id (int): ID of the job. Defaults to the last job sent.
+            timeout (float): Seconds to wait for the results, None to wait
+                until they arrive or the agent disconnects
+        Returns:
+            dict: The results, or None if they have not arrived
+        """
+        job_id = job_id or self.last_job_id
+        with self._condition:
+            self._condition.wait_for(
+                lambda: job_id in self._results or not self.connected,
+                timeout
+            )
+            return self._results.pop(job_id, None)
+
+    async def wait_result(
+        self,
+        job_id: _t.Optional[int] = None,
+        timeout: float = 0,
+    ) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Waits for the results of a job without blocking the event loop or
+        tying up a thread, see `result`.
+        Args:
+            job_id (int): ID of the job. Defaults to the last job sent.
+            timeout (float): Seconds to wait for the results
+        Returns:
+            dict: The results, or None if they have not arrived
+        """
+        job_id = job_id or self.last_job_id
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def listener():
+            loop.call_soon_threadsafe(changed.set)
+
+        deadline = loop.time() + timeout
+        with self._condition:
+            self._listeners.add(listener)
+        try:
+            while True:
+                changed.clear()
+                with self._condition:
+                    if job_id in self._results or not self.connected:
+                        return self._results.pop(job_id, None)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._listeners.discard(listener)
+
+    def take_metrics(self, job_id: int) -> _t.List[_t.Dict[str, _t.Any]]:
+        """Returns the metrics sent for a job since the last call.
+        Args:
+            job_id (int): ID of the job
+        Returns:
+            List[dict]: The metrics, oldest first
+        """
+        with self._condition:
+            return list(self._metrics.pop(job_id, ()))
+
+    def _notify(self) -> None:
+        """Wakes up everything waiting on the connection. Must be called with
+        the condition held.
+        """
+        self._condition.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def handle(self, message: _t.Dict[str, _t.Any]) -> None:
+        """Handles a message received from the agent."""
+        if message['type'] == 'result':
+            with self._condition:
+                self._results[message['job_id']] = message['results']
+                self._notify()
+        elif message['type'] == 'metrics':
+            with self._condition:
+                self._metrics.setdefault(
+                    message['job_id'],
+                    collections.deque(maxlen=MAX_METRICS)
+                ).append(message['metrics'])
+        elif message['type'] == 'ping':
+            self.send({
+                'type': 'pong',
+                'sent_at': message.get('sent_at'),
+                'time': time.time(),
+            })
+        elif message['type'] == 'pong':
+            with self._condition:
+                self._pongs[message['sent_at']] = (
+                    message['time'],
+                    time.time()
+                )
+                self._condition.notify_all()
+
+    def ping(self, timeout: float = HELLO_TIMEOUT) -> _t.Tuple[float, float]:
+        """Pings the agent.
+        Args:
+            timeout (float): Seconds to wait for the reply
+        Returns:
+            Tuple[float, float]: Round trip time and the offset of the
+                agent's clock from the controller's clock, in seconds
+        """
+        sent_at = time.time()
+        self.send({'type': 'ping', 'sent_at': sent_at})
+        with self._condition:
+            replied = self._condition.wait_for(
+                lambda: sent_at in self._pongs or not self.connected,
+                timeout
+            )
+            if not replied or sent_at not in self._pongs:
+                raise TimeoutError(f'Agent {self.agent_id} did not reply')
+            agent_time, received_at = self._pongs.pop(sent_at)
+        # Assume that the reply was sent halfway through the round trip.
+        return (
+            received_at - sent_at,
+            agent_time - (sent_at + received_at) / 2
+        )
+
+    def measure_clock_offset(self, samples: int = CLOCK_SAMPLES) -> float:
+        """Estimates how far the agent's clock is ahead of the controller's
+        clock, keeping the sample with the shortest round trip as it has the
+        least uncertainty. The round trip time is kept from the same sample.
+        Args:
+            samples (int): Number of pings to send
+        Returns:
+            float: Offset in seconds
+        """
+        self.rtt, self.clock_offset = min(
+            self.ping() for _ in range(samples)
+        )
+        return self.clock_offset
+
+    def disconnected(self) -> None:
+        """Marks the connection as closed, waking up anything waiting on it.
+        """
+        with self._condition:
+            self.connected = False
+            self._notify()
+
+    def close(self) -> None:
+        """Closes the connection."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ControlServer:
+    """Accepts connections from the node agents."""
+
+    def __init__(
+        self,
+        host: str = CONTROL_CHANNEL_BIND,
+        port: int = CONTROL_CHANNEL_PORT,
+        secret: _t.Optional[str] = None,
+    ):
+        """Creates a control server.
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on, 0 to pick a free port
+            secret (str): Shared secret the agent tokens are derived from
+        """
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.agents: _t.Dict[str, AgentConnection] = {}
+        self._condition = threading.Condition()
+        self._sock: _t.Optional[socket.socket] = None
+        self._thread: _t.Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        """Address the agents can connect to when running on this machine.
+        """
+        return f'127.0.0.1:{self.port}'
+
+    def start(self) -> 'ControlServer':
+        """Starts accepting connections in a background thread."""
+        if self._sock is not None:
+            return self
+        self._sock = socket.create_server((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the server and closes every agent connection."""
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+        with self._condition:
+            agents = list(self.agents.values())
+            self.agents = {}
+        for agent in agents:
+            agent.close()
+
+    def agent(
+        self,
+        agent_id: str,
+        timeout: _t.Optional[float] = AGENT_CONNECT_TIMEOUT,
+    ) -> AgentConnection:
+        """Returns the connection to an agent, waiting for it to connect.
+        Args:
+            agent_id (str): ID of the agent
+            timeout (float): Seconds to wait for the agent to connect
+        Returns:
+            AgentConnection: Connection to the agent
+        """
+        with self._condition:
+            connected = self._condition.wait_for(
+                lambda: agent_id in self.agents,
+                timeout
+            )
+            if not connected:
+                raise TimeoutError(f'Agent {agent_id} did not connect')
+            return self.agents[agent_id]
+
+    def _accept(self) -> None:
+        """Accepts connections until the server is stopped."""
+        sock = self._sock
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._serve,
+                args=(conn,),
+                daemon=True
+            ).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        """Authenticates an agent then handles its messages until it
+        disconnects.
+        """
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        reader = MessageReader(conn)
+        nonce = secrets.token_hex(16)
+        try:
+            conn.settimeout(HELLO_TIMEOUT)
+            send_message(conn, {'type': 'challenge', 'nonce': nonce})
+            hello = reader.read()
+            conn.settimeout(None)
+        except (OSError, ValueError):
+            hello = None
+        if not self._authenticate(hello, nonce):
+            reader.close()
+            conn.close()
+            return
+
+        agent = AgentConnection(hello['agent_id'], conn)
+        with self._condition:
+            previous = self.agents.get(agent.agent_id)
+            self.agents[agent.agent_id] = agent
+            self._condition.notify_all()
+        if previous is not None:
+            previous.close()
+
+        try:
+            while True:
+                message = reader.read()
+                if message is None:
+                    break
+                agent.handle(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._condition:
+                if self.agents.get(agent.agent_id) is agent:
+                    del self.agents[agent.agent_id]
+            agent.disconnected()
+            reader.close()
+            conn.close()
+
+    def _authenticate(
+        self,
+        hello: _t.Optional[_t.Dict[str, _t.Any]],
+        nonce: str,
+    ) -> bool:
+        """Checks that the hello message proves its agent holds a valid
+        token, for the nonce of this connection's challenge.
+        """
+        if not isinstance(hello, dict) or hello.get('type') != 'hello':
+            return False
+        agent_id = str(hello.get('agent_id', ''))
+        if not agent_id:
+            return False
+        return hmac.compare_digest(
+            token_proof(agent_token(agent_id, self.secret), nonce),
+            str(hello.get('proof', ''))
+        )
+
+
+_server: _t.Optional[ControlServer] = None
+_server_lock = threading.Lock()
+
+
+def get_server() -> ControlServer:
+    """Returns the controller's control server, starting it on first use."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ControlServer().start()
+        return _server
+
+
+def wait_for_agents(
+    server: ControlServer,
+    agent_ids: _t.List[str],
+    timeout: float = AGENT_CONNECT_TIMEOUT,
+) -> _t.List[AgentConnection]:
+    """Waits for several agents to connect.
+    Args:
+        server (ControlServer): Server the agents connect to
+        agent_ids (List[str]): IDs of the agents
+        timeout (float): Seconds to wait for all of the agents
+    Returns:
+        List[AgentConnection]: Connections in the same order as the IDs
+    """
+    deadline = time.monotonic() + timeout
+    return [
+        server.agent(agent_id, max(0, deadline - time.monotonic()))
+        for agent_id in agent_ids
+    ]
+
+
+def measure_clock_offsets(agents: _t.List[AgentConnection]) -> None:
+    """Measures the clock offset of several agents at once.
+    Args:
+        agents (List[AgentConnection]): Agents to measure
+    Raises:
+        TimeoutError: The clock of an agent could not be measured, so a start
+            time shared with it could not be kept to. Raised once every agent
+            has been measured.
+    """
+    errors: _t.Dict[str, Exception] = {}
+
+    def measure(agent: AgentConnection) -> None:
+        try:
+            agent.measure_clock_offset()
+        except Exception as e:
+            errors[agent.agent_id] = e
+
+    threads = [
+        threading.Thread(target=measure, args=(agent,), daemon=True)
+        for agent in agents
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise TimeoutError(
+            'Could not measure the clock of {}'.format(', '.join(
+                f'{agent_id} ({e})' for agent_id, e in errors.items()
+            ))
+        ) from next(iter(errors.values()))
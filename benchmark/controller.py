@@ -3,61 +3,234 @@ needed to benchmark a site.
 """
 
 import typing as _t
+import asyncio
 import os
-import subprocess
-import threading
-import time
 import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 try:
-    from . import ec2
     from . import site_api
     from . import job_queue
+    from . import providers
+    from .node_pool import NodePool
+    from .histogram import LatencyHistogram
+    from .timeseries import ThroughputSeries
 except ImportError:
-    import ec2
     import site_api
     import job_queue
+    import providers
+    from node_pool import NodePool
+    from histogram import LatencyHistogram
+    from timeseries import ThroughputSeries
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Instances are leased from and returned to the pool rather than being
+# created and terminated for each benchmark. The provider is picked with the
+# `NODE_PROVIDER` environment variable.
+node_pool = NodePool(providers.get_provider())
+
+# The nodes start the benchmark at a common instant, which must leave enough
+# time to send every node its job. The lead is the slowest round trip to a
+# node, measured when its agent connected, plus the time to send the jobs to
+# all of the nodes and a margin for the controller and the agents to get to
+# them.
+START_MARGIN = float(os.getenv('START_MARGIN', 0.25))
+# Seconds to allow for sending the job to each node.
+SEND_TIME_PER_NODE = 0.005
+
+# Seconds after the start of a benchmark to wait for a node's results before
+# treating its requests as failed.
+RESULTS_TIMEOUT = int(os.getenv('RESULTS_TIMEOUT', 15 * 60))
+
+# Seconds each step of a benchmark can take before it is cancelled.
+SPAWN_TIMEOUT = int(os.getenv('SPAWN_TIMEOUT', 15 * 60))
+CONNECT_TIMEOUT = int(os.getenv('CONNECT_TIMEOUT', 5 * 60))
+SCHEDULE_TIMEOUT = 30
+SITE_API_TIMEOUT = 60
+
+# Blocking calls made by the benchmarks, to boto3, the site API and the
+# sockets, run on these pools so the number of threads stays fixed however
+# many nodes and benchmarks there are. Bringing nodes up and down can take
+# many minutes, so it has a pool of its own and cannot hold up the short
+# calls, such as sending the jobs before their start time, of the benchmarks
+# which are already running.
+BLOCKING_THREADS = int(os.getenv('CONTROLLER_BLOCKING_THREADS', 32))
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_THREADS,
+    thread_name_prefix='controller'
+)
+PROVISIONING_THREADS = int(os.getenv('CONTROLLER_PROVISIONING_THREADS', 32))
+_provisioning_executor = ThreadPoolExecutor(
+    max_workers=PROVISIONING_THREADS,
+    thread_name_prefix='controller-provisioning'
+)
+
+# Seconds between each publish of the live metrics of a running benchmark.
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', 1))
+# The live metrics are published to their own stream for the site to relay to
+# the browser. They are only of use while fresh, so the stream is kept short.
+METRICS_STREAM = 'benchmark_metrics'
+METRICS_STREAM_MAX_LENGTH = 1000
+
+# Maps the result fields to the percentile they report.
+PERCENTILES = {
+    'p50_time': 50,
+    'p90_time': 90,
+    'p99_time': 99,
+    'p999_time': 99.9,
+}
+
+
+async def run_blocking(
+    fn: _t.Callable,
+    *args,
+    timeout: _t.Optional[float] = None,
+    cleanup: _t.Optional[_t.Callable[[_t.Any], None]] = None,
+    provisioning: bool = False,
+) -> _t.Any:
+    """Runs a blocking call on a blocking pool without blocking the event
+    loop.
+
+    A thread cannot be interrupted, so if the call times out or the caller is
+    cancelled it is left to finish, and `cleanup` is then called with its
+    result. This is used to give back any nodes leased by a call which was
+    abandoned.
+
+    Args:
+        fn (Callable): Function to call
+        *args: Arguments to call it with
+        timeout (float): Seconds to wait for the call, None to wait for as
+            long as it takes
+        cleanup (Callable): Called with the result of an abandoned call
+        provisioning (bool): Whether the call brings nodes up or down, which
+            runs it on the provisioning pool
+    Returns:
+        Any: The result of the call
+    """
+    executor = _provisioning_executor if provisioning else _blocking_executor
+    future = executor.submit(fn, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except BaseException:
+        if cleanup is not None:
+            def done(future: Future):
+                if not future.cancelled() and future.exception() is None:
+                    cleanup(future.result())
+            future.add_done_callback(done)
+        raise
+
 
 class SlaveNode:
     """Represents a node that is used to carry out a benchmark."""
 
-    def __init__(self, instance):
+    def __init__(self, instance, provider: providers.NodeProvider):
         """Creates a slave node.
         Args:
-            instance (boto3.resources.ec2.Instance): Instance to use
+            instance: Instance created by the provider
+            provider (NodeProvider): Provider which created the instance
         """
         self.instance = instance
-        self.host = instance.public_ip_address
-
-    def schedule_benchmark(self, ts: datetime, num_requests: int, url: str):
+        self.provider = provider
+        self.host = provider.host(instance)
+        self.job_id: _t.Optional[int] = None
+        # Whether a job may be running on the node, from the moment it is
+        # sent until its results arrive.
+        self.busy = False
+
+    def schedule_benchmark(
+        self,
+        ts: datetime,
+        num_requests: int,
+        url: str,
+        concurrency: _t.Optional[int] = None,
+        pipeline: _t.Optional[int] = None,
+    ):
         """Schedules a benchmark on the node.
         Args:
             ts (datetime): Time to start the benchmark
             num_requests (int): Number of requests to run
             url (str): URL to benchmark
+            concurrency (int): Number of concurrent connections to use
+            pipeline (int): Number of requests to pipeline per connection
         """
-        subprocess.call([
+        self.busy = True
+        self.job_id = self.provider.schedule_benchmark(
+            self.instance,
+            ts,
+            num_requests,
+            url,
+            concurrency,
+            pipeline
+        )
 
+    def benchmark_results(self, timeout: float = 0) -> int:
+        """Waits for the results of the benchmark to arrive.
+        Args:
+            timeout (float): Seconds to wait for the results
+        Returns:
+            int: 0 if the results arrived, otherwise non-zero
+        """
+        status = self.provider.fetch_results(
+            self.instance,
+            self.job_id,
+            timeout
+        )
+        self.busy = self.busy and status != 0
+        return status
 
-            'bash',
-            os.path.join(BASE_DIR, 'benchmark_setup.sh'),
-            self.host,
-            ts.strftime('%m%d%H%M'),
-            str(num_requests),
-            url
-        ])
+    def reusable(self) -> bool:
+        """Returns True if the node can be given to another benchmark, which
+        is when its agent is connected and not running a job.
+        """
+        return not self.busy and self.provider.agent_connected(self.instance)
 
-    def benchmark_results(self):
-        """Returns the results of the benchmark."""
-        return subprocess.call([
-            'bash',
-            os.path.join(BASE_DIR, 'benchmark_results.sh'),
-            self.host
-        ])
+    def round_trip_time(self) -> float:
+        """Returns the seconds a message takes to reach the node's agent and
+        come back.
+        """
+        return self.provider.round_trip_time(self.instance)
+
+    def take_metrics(self) -> _t.List[_t.Dict[str, _t.Any]]:
+        """Returns the live metrics the node has sent for its benchmark since
+        the last call.
+        """
+        return self.provider.take_metrics(self.instance, self.job_id)
+
+    async def schedule_benchmark_async(
+        self,
+        ts: datetime,
+        num_requests: int,
+        url: str,
+        concurrency: _t.Optional[int] = None,
+        pipeline: _t.Optional[int] = None,
+    ):
+        """Schedules a benchmark on the node from an event loop, see
+        `schedule_benchmark`.
+        """
+        await run_blocking(
+            self.schedule_benchmark,
+            ts,
+            num_requests,
+            url,
+            concurrency,
+            pipeline,
+            timeout=SCHEDULE_TIMEOUT
+        )
+
+    async def benchmark_results_async(self, timeout: float = 0) -> int:
+        """Waits for the results of the benchmark from an event loop, see
+        `benchmark_results`.
+        """
+        status = await self.provider.fetch_results_async(
+            self.instance,
+            self.job_id,
+            timeout
+        )
+        self.busy = self.busy and status != 0
+        return status
 
 
 class MasterNode:
@@ -68,7 +241,10 @@ class MasterNode:
     def __init__(self, benchmark_id: int, url: str, num_nodes: int = 1,
                  requests_per_node: int = 1,
                  instance_type: _t.Optional[str] = None,
-                 key_name: _t.Optional[str] = None):
+                 key_name: _t.Optional[str] = None,
+                 concurrency: _t.Optional[int] = None,
+                 pipeline: _t.Optional[int] = None,
+                 pool: _t.Optional[NodePool] = None):
         """Creates a master node.
         Args:
             benchmark_id (int): ID of the benchmark
@@ -77,6 +253,10 @@ class MasterNode:
             requests_per_node (int): Number of requests to run per node
             instance_type (str): Instance type to create
             key_name (str): Key name to use
+            concurrency (int): Number of concurrent connections per node
+            pipeline (int): Number of requests to pipeline per connection
+            pool (NodePool): Pool to lease the nodes from. Defaults to the
+                module's pool.
         """
 
         # Log the benchmark start time.
@@ -90,6 +270,9 @@ class MasterNode:
         self.requests_per_node = requests_per_node
         self.instance_type = instance_type
         self.key_name = key_name
+        self.concurrency = concurrency
+        self.pipeline = pipeline
+        self.node_pool = node_pool if pool is None else pool
 
         self.nodes: _t.List[SlaveNode] = []
 
@@ -122,13 +305,26 @@ class MasterNode:
     def __enter__(self):
         """Enters the context manager."""
         self.spawn_nodes()
-        self.server_ssh_setup()
+        self.connect_nodes()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         """Exits the context manager."""
         self.terminate_nodes()
 
+    async def __aenter__(self):
+        """Enters the context manager from an event loop."""
+        try:
+            await self.bring_up_nodes_async()
+        except BaseException:
+            await run_blocking(self.terminate_nodes, provisioning=True)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Exits the context manager from an event loop."""
+        await run_blocking(self.terminate_nodes, provisioning=True)
+
     def __iter__(self):
         """Iterates over the nodes."""
         return iter(self.nodes)
@@ -144,99 +340,254 @@ class MasterNode:
     def spawn_nodes(self) -> None:
         """Spawns a collection of nodes."""
         self.benchmark_status_next_step()
-        instances = ec2.create_instances(num_instances=self.num_nodes)
+        instances = self.node_pool.lease(self.num_nodes)
         for instance in instances:
-            self.nodes.append(SlaveNode(instance))
-
-    def server_ssh_setup(self) -> None:
-        """Adds the hosts to the known hosts file."""
-        ip_addresses = [instance.public_ip_address
-                        for instance in self.instances()]
-        subprocess.call([
-            'bash',
-            os.path.join(BASE_DIR, 'server_ssh_setup.sh'),
-            *ip_addresses
-        ])
+            self.nodes.append(SlaveNode(instance, self.node_pool.provider))
+
+    def connect_nodes(self) -> None:
+        """Waits for the agent on each node to connect to the controller."""
+        self.node_pool.provider.wait_until_ready(self.instances())
+
+    async def bring_up_nodes_async(self) -> None:
+        """Brings up the nodes from an event loop. Each node is set up and
+        connected as soon as it has launched, independently of the others,
+        so the nodes which are quick to start are ready while the slowest
+        is still being set up. If any node fails to come up the others are
+        cancelled.
+        """
+        await run_blocking(
+            self.benchmark_status_next_step,
+            timeout=SITE_API_TIMEOUT
+        )
+        ready, launched = await run_blocking(
+            self.node_pool.lease_pipelined,
+            self.num_nodes,
+            timeout=SPAWN_TIMEOUT,
+            cleanup=lambda leased: self.node_pool.release(sum(leased, [])),
+            provisioning=True
+        )
+        # Track the nodes straight away so they are returned to the pool
+        # whatever happens.
+        self.nodes += [
+            SlaveNode(instance, self.node_pool.provider)
+            for instance in ready + launched
+        ]
+        tasks = [
+            asyncio.ensure_future(
+                self.bring_up_node(node, node.instance in launched)
+            )
+            for node in self.nodes
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def bring_up_node(self, node: SlaveNode, setup: bool) -> None:
+        """Brings up a single node, setting it up if it has just launched and
+        waiting for its agent to connect.
+        Args:
+            node (SlaveNode): Node to bring up
+            setup (bool): Whether the node needs setting up
+        """
+        provider = self.node_pool.provider
+        if setup:
+            try:
+                await run_blocking(
+                    provider.setup_instance,
+                    node.instance,
+                    timeout=SPAWN_TIMEOUT,
+                    provisioning=True
+                )
+            except BaseException:
+                # A node which was not set up is no use to the pool.
+                self.nodes.remove(node)
+                await run_blocking(
+                    provider.terminate_instances,
+                    [node.instance],
+                    provisioning=True
+                )
+                raise
+        await run_blocking(
+            provider.wait_until_ready,
+            [node.instance],
+            timeout=CONNECT_TIMEOUT,
+            provisioning=True
+        )
 
     def terminate_nodes(self) -> None:
-        """Terminates all the nodes."""
-        ec2.terminate_instances(self.instances())
-        job_queue.connection.publish(
-            'benchmark_done',
-            json.dumps({'num_servers': len(self)})
-        )
+        """Returns the nodes to the pool, which terminates any that are not
+        needed to keep the pool warm. Nodes which cannot be reused, because
+        their agent is not connected or may still be running a job, are
+        terminated.
+        """
+        reusable = [node.reusable() for node in self.nodes]
+        self.node_pool.release([
+            node.instance
+            for node, ok in zip(self.nodes, reusable) if ok
+        ])
+        self.node_pool.discard([
+            node.instance
+            for node, ok in zip(self.nodes, reusable) if not ok
+        ])
+        job_queue.publish('benchmark_done', {
+            'benchmark_id': self.benchmark_id,
+            'num_servers': len(self),
+            'owner': job_queue.LEASE_OWNER,
+        })
         self.nodes = []
 
+    def start_lead(self) -> float:
+        """Returns the seconds needed to send the jobs to every node before
+        they start, see `START_MARGIN`.
+        """
+        round_trip_time = max(
+            (node.round_trip_time() for node in self.nodes),
+            default=0
+        )
+        return (
+            START_MARGIN
+            + round_trip_time
+            + SEND_TIME_PER_NODE * len(self.nodes)
+        )
+
     def benchmark_start_ts(self) -> datetime:
-        """Lazy getter for when the benchmark run should start."""
+        """Lazy getter for when the benchmark run should start. Every node
+        starts at this instant, corrected for its own clock.
+        """
         if not hasattr(self, '_benchmark_start_ts'):
-            # Assume that it takes 1.5 seconds to schedule the benchmark.
-            ms_to_setup = 2000
             self._benchmark_start_ts = datetime.now() + timedelta(
-                milliseconds=len(self.nodes) * ms_to_setup
+                seconds=self.start_lead()
             )
         return self._benchmark_start_ts
 
     def execute_tasks(self) -> None:
         """Executes a set of tasks on all node."""
-        self.benchmark_status_next_step()
-        threads = []
-        for node in self.nodes:
-            t = threading.Thread(
-                target=self.execute_tasks_on_node,
-                args=(node,)
-            )
-            t.start()
-            threads.append(t)
+        asyncio.run(self.execute_tasks_async())
 
-        for t in threads:
-            t.join()
+    async def execute_tasks_async(self) -> None:
+        """Executes a set of tasks on all nodes concurrently. If the tasks on
+        any node fail, or this is cancelled, the tasks on the other nodes are
+        cancelled.
+        """
+        await run_blocking(
+            self.benchmark_status_next_step,
+            timeout=SITE_API_TIMEOUT
+        )
+        # Fix the start time before the tasks read it.
+        self.benchmark_start_ts()
+        tasks = [
+            asyncio.ensure_future(self.execute_tasks_on_node(node))
+            for node in self.nodes
+        ]
+        self._metrics_published_at = asyncio.get_running_loop().time()
+        streamer = asyncio.ensure_future(self.stream_metrics_async())
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            streamer.cancel()
+            await asyncio.gather(streamer, return_exceptions=True)
+        # The nodes send the metrics for the end of their run just before
+        # their results.
+        await self.publish_metrics_async()
+
+    async def stream_metrics_async(self) -> None:
+        """Publishes the live metrics of the benchmark every
+        `METRICS_INTERVAL` seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            await self.publish_metrics_async()
 
-    def execute_tasks_on_node(self, node) -> None:
+    async def publish_metrics_async(self) -> None:
+        """Publishes the live metrics sent by the nodes since they were last
+        published, see `publish_metrics`.
+        """
+        now = asyncio.get_running_loop().time()
+        interval = now - self._metrics_published_at
+        self._metrics_published_at = now
+        try:
+            await run_blocking(
+                self.publish_metrics,
+                interval,
+                timeout=SCHEDULE_TIMEOUT
+            )
+        except Exception as e:
+            # The metrics are only for show, so a missed publish is not worth
+            # failing the benchmark over.
+            print(f'Failed to publish live metrics: {e}')
+
+    def publish_metrics(self, interval: float) -> bool:
+        """Merges the live metrics sent by the nodes since the last call and
+        publishes them to `METRICS_STREAM`.
+        Args:
+            interval (float): Seconds since the last call
+        Returns:
+            bool: True if any metrics were published
+        """
+        windows = []
+        for node in self.nodes:
+            windows += node.take_metrics()
+        metrics = merge_metrics(windows, interval)
+        if metrics is None:
+            return False
+        job_queue.publish(
+            METRICS_STREAM,
+            {
+                'benchmark_id': self.benchmark_id,
+                'time': time.time(),
+                **metrics,
+            },
+            maxlen=METRICS_STREAM_MAX_LENGTH
+        )
+        return True
+
+    async def execute_tasks_on_node(self, node: SlaveNode) -> None:
         """Executes the tasks on a single node."""
         tasks = [
             self._execute_task_schedule_benchmark,
             self._execute_task_benchmark_results
         ]
         for task in tasks:
-            task(node)
+            await task(node)
 
-    def _execute_task_schedule_benchmark(self, node: SlaveNode) -> None:
+    async def _execute_task_schedule_benchmark(self, node: SlaveNode) -> None:
         """Executes the task to schedule the benchmark."""
-        node.schedule_benchmark(
+        await node.schedule_benchmark_async(
             self.benchmark_start_ts(),
             self.requests_per_node,
-            self.url
+            self.url,
+            self.concurrency,
+            self.pipeline
         )
 
-    def _execute_task_benchmark_results(self, node: SlaveNode) -> None:
-        """Executes the task to get the benchmark results.
+    async def _execute_task_benchmark_results(self, node: SlaveNode) -> None:
+        """Executes the task to get the benchmark results. The node pushes
+        its results as soon as it finishes, so this only waits as long as the
+        benchmark takes, up to `RESULTS_TIMEOUT` after the start time.
         Args:
             node (SlaveNode): Node to execute the task on
         Returns:
             None
         """
-        # Check that the benchmark has finished (base this on the scheduled
-        # start time). Add a buffer of 35 seconds, this is to account for
-        # the timeout param in the benchmark script.
-        start_time = self.benchmark_start_ts() + timedelta(minutes=1)
-        if datetime.now() < start_time:
-            sleep_time = start_time - datetime.now()
-            print(
-                f'[{datetime.now().strftime("%H:%M")}] Results not ready, sleeping for {sleep_time}'  # noqa E501
-            )
-            time.sleep(sleep_time.total_seconds())
-
-        max_tries = 5
-        for _ in range(max_tries):
-            exit_code = node.benchmark_results()
-            if exit_code == 0:
-                break
+        deadline = self.benchmark_start_ts() + timedelta(
+            seconds=RESULTS_TIMEOUT
+        )
+        timeout = max(0, (deadline - datetime.now()).total_seconds())
+        if await node.benchmark_results_async(timeout) != 0:
             print(
-                f'\033[91m[{datetime.now().strftime("%H:%M")}] Failed to get '
-                'benchmark results, retrying in 1 minute\033[0m'
+                f'\033[91m[{datetime.now().strftime("%H:%M")}] No benchmark '
+                f'results from {node.host} within {RESULTS_TIMEOUT} '
+                'seconds\033[0m'
             )
-            time.sleep(60)
 
     def calculate_results(self) -> _t.Dict[str, _t.Any]:
         """Given the benchmark results from each node, calculates an overall
@@ -254,7 +605,7 @@ class MasterNode:
         # Extract the results from each node.
         results = []
         for node in self.nodes:
-            results_fp = os.path.join(BASE_DIR, 'results', f'{node.host}.json')
+            results_fp = providers.results_path(node.host)
             if not os.path.exists(results_fp):
                 failed_requests += self.requests_per_node
                 sys_error_requests += self.requests_per_node
@@ -270,25 +621,193 @@ class MasterNode:
             failed_requests += result['failed_requests']
             results.append(result)
 
-        # Blend the results calculating the min, max and average.
-        min_time = min(result['min_time'] for result in results)
-        max_time = max(result['max_time'] for result in results)
-        mean_time = sum(
-            result['mean_time'] for result in results
-        ) / len(results)
+        series = ThroughputSeries()
+        for result in results:
+            if result.get('timeseries'):
+                series.merge(ThroughputSeries.from_dict(result['timeseries']))
+        if len(series):
+            site_api.send_timeseries(
+                benchmark_id=self.benchmark_id,
+                timeseries=series.to_dict()
+            )
 
         results = {
-            'min_time': min_time,
-            'max_time': max_time,
-            'mean_time': mean_time,
+            **blend_results(results),
             'completed_requests': complete_requests,
             'failed_requests': failed_requests,
             'sys_error_requests': sys_error_requests,
+            'start_skew_ms': start_skew(results),
         }
 
         site_api.send_results(benchmark_id=self.benchmark_id, **results)
         return results
 
+    async def calculate_results_async(self) -> _t.Dict[str, _t.Any]:
+        """Calculates the overall result from an event loop, see
+        `calculate_results`.
+        """
+        return await run_blocking(
+            self.calculate_results,
+            timeout=SITE_API_TIMEOUT
+        )
+
+
+def merge_metrics(
+    windows: _t.List[_t.Dict[str, _t.Any]],
+    interval: float,
+) -> _t.Optional[_t.Dict[str, _t.Any]]:
+    """Merges the live metrics sent by the nodes over an interval.
+    Args:
+        windows (List[dict]): The metrics from each node, see
+            `LoadStats.take_window`
+        interval (float): Seconds the metrics cover
+    Returns:
+        dict: The requests per second (`rps`), the share of the requests
+            which failed (`error_rate`) and the 50th and 99th percentile
+            times in milliseconds, or None if there were no metrics
+    """
+    if not windows:
+        return None
+    histogram = LatencyHistogram()
+    num_requests = failed_requests = 0
+    for window in windows:
+        histogram.merge(LatencyHistogram.from_dict(window['histogram']))
+        num_requests += window['requests']
+        failed_requests += window['failed_requests']
+
+    def to_ms(value: _t.Optional[int]) -> _t.Optional[int]:
+        return None if value is None else round(value / 1000)
+
+    return {
+        'rps': round(num_requests / max(interval, 1e-3), 1),
+        'error_rate': round(
+            failed_requests / num_requests if num_requests else 0,
+            4
+        ),
+        'p50_time': to_ms(histogram.percentile(50)),
+        'p99_time': to_ms(histogram.percentile(99)),
+    }
+
+
+def blend_results(
+    results: _t.List[_t.Dict[str, _t.Any]]
+) -> _t.Dict[str, _t.Any]:
+    """Blends the timings reported by each node into an overall result.
+
+    When every node reports a latency histogram, the histograms are merged so
+    that the percentiles are exact across the whole cluster. Otherwise the
+    mean is weighted by the number of requests each node completed and the
+    percentiles are left unset.
+
+    Args:
+        results (List[Dict[str, Any]]): Results read from each node
+    Returns:
+        Dict[str, Any]: Min, max, mean and percentile times in milliseconds
+    """
+    blended = {
+        'min_time': None,
+        'max_time': None,
+        'mean_time': None,
+        **{field: None for field in PERCENTILES},
+    }
+    if not results:
+        return blended
+
+    blended['min_time'] = min(result['min_time'] for result in results)
+    blended['max_time'] = max(result['max_time'] for result in results)
+
+    if all(result.get('histogram') for result in results):
+        histogram = LatencyHistogram()
+        for result in results:
+            histogram.merge(LatencyHistogram.from_dict(result['histogram']))
+        if histogram.count:
+            blended['mean_time'] = round(histogram.mean / 1000)
+            for field, percentile in PERCENTILES.items():
+                blended[field] = round(histogram.percentile(percentile) / 1000)
+        return blended
+
+    complete_requests = sum(result['complete_requests'] for result in results)
+    if complete_requests:
+        blended['mean_time'] = round(sum(
+            result['mean_time'] * result['complete_requests']
+            for result in results
+        ) / complete_requests)
+    return blended
+
+
+def start_skew(
+    results: _t.List[_t.Dict[str, _t.Any]]
+) -> _t.Optional[int]:
+    """Returns how far apart the nodes actually started, which shows how
+    comparable the run is.
+    Args:
+        results (List[Dict[str, Any]]): Results read from each node
+    Returns:
+        int: Milliseconds between the first and last node starting, or None
+            if no node reported its start time
+    """
+    starts = [
+        result['started_at'] for result in results
+        if result.get('started_at') is not None
+    ]
+    if not starts:
+        return None
+    return round((max(starts) - min(starts)) * 1000)
+
+
+async def run_benchmark_async(
+    benchmark_id: int,
+    url: str,
+    num_nodes: int,
+    requests_per_node: int
+) -> _t.Dict[str, _t.Any]:
+    """Runs the benchmark from an event loop. Cancelling it stops the
+    benchmark and returns the nodes to the pool.
+    Args:
+        benchmark_id (int): ID of the benchmark
+        url (str): URL of the site to benchmark
+        num_nodes (int): Number of nodes to create
+        requests_per_node (int): Number of requests to run per node
+    Returns:
+        Dict[str, Any]: Result of the benchmark
+    """
+    # Creating the master node sends its progress to the site.
+    master = await run_blocking(
+        MasterNode,
+        benchmark_id,
+        url,
+        num_nodes,
+        requests_per_node,
+        timeout=SITE_API_TIMEOUT
+    )
+    async with master:
+        await master.execute_tasks_async()
+        return await master.calculate_results_async()
+
+
+def fail_benchmark(
+    benchmark_id: int,
+    num_nodes: int,
+    requests_per_node: int
+) -> None:
+    """Reports a benchmark which could not be run to the site, with every
+    request failed, so it does not stay pending.
+    Args:
+        benchmark_id (int): ID of the benchmark
+        num_nodes (int): Number of nodes it was to run on
+        requests_per_node (int): Number of requests it was to run per node
+    """
+    num_requests = num_nodes * requests_per_node
+    site_api.send_results(
+        benchmark_id=benchmark_id,
+        min_time=None,
+        max_time=None,
+        mean_time=None,
+        completed_requests=0,
+        failed_requests=num_requests,
+        sys_error_requests=num_requests,
+    )
+
 
 def run_benchmark(
     benchmark_id: int,
@@ -303,15 +822,13 @@ def run_benchmark(
         num_nodes (int): Number of nodes to create
         requests_per_node (int): Number of requests to run per node
     """
-    with MasterNode(
+    results = asyncio.run(run_benchmark_async(
         benchmark_id,
         url,
         num_nodes,
         requests_per_node
-    ) as master:
-        master.execute_tasks()
-        results = master.calculate_results()
-        print(json.dumps(results, indent=2))
+    ))
+    print(json.dumps(results, indent=2))
 
 
 if __name__ == '__main__':
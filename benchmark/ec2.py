@@ -5,12 +5,19 @@ import os
 import subprocess
 import threading
 import boto3
+try:
+    from . import control_channel
+    from . import image_builder
+except ImportError:
+    import control_channel
+    import image_builder
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVER_SETUP_SCRIPT = os.path.join(BASE_DIR, 'server_setup.sh')
 
 IMAGE_ID = 'ami-0015a39e4b7c0966f'  # Ubuntu Server 20.04 LTS
 INSTANCE_TYPE = 't2.micro'
+KEY_NAME = 'ec2-key-pair'
 SECURITY_GROUPS = ['sg-0181cc2e6e7afc2d3']
 
 ec2 = boto3.resource('ec2')
@@ -18,31 +25,30 @@ ec2 = boto3.resource('ec2')
 
 def create_instances(
     num_instances=1,
-    image_id=IMAGE_ID,
+    image_id=None,
     instance_type=INSTANCE_TYPE,
-    key_name='ec2-key-pair'
+    key_name=KEY_NAME
 ) -> _t.List:
     """Creates EC2 instances
     Args:
         num_instances (int): Number of instances to create
-        image_id (str): AMI ID
+        image_id (str): AMI ID. Defaults to the newest node image.
         instance_type (str): Instance type
         key_name (str): Name of the key pair
     Returns:
         list: List of instances
     """
-    instances = ec2.create_instances(
-        ImageId=image_id,
-        InstanceType=instance_type,
-        MinCount=num_instances,
-        MaxCount=num_instances,
-        KeyName=key_name,
+    instances = launch_instances(
+        num_instances,
+        image_id,
+        instance_type,
+        key_name
     )
 
     # Setup each instance in a separate thread
     threads = []
     for instance in instances:
-        t = threading.Thread(target=_setup_instance, args=(instance,))
+        t = threading.Thread(target=setup_instance, args=(instance,))
         t.start()
         threads.append(t)
 
@@ -53,6 +59,49 @@ def create_instances(
     return instances
 
 
+def launch_instances(
+    num_instances=1,
+    image_id=None,
+    instance_type=INSTANCE_TYPE,
+    key_name=KEY_NAME
+) -> _t.List:
+    """Launches EC2 instances without waiting for them to start. Each needs
+    to be passed to `setup_instance` before it can be used.
+    Args:
+        num_instances (int): Number of instances to launch
+        image_id (str): AMI ID. Defaults to the newest node image built by
+            `image_builder`, or the plain Ubuntu image if there is none.
+        instance_type (str): Instance type
+        key_name (str): Name of the key pair
+    Returns:
+        list: List of instances
+    """
+    if image_id is None:
+        image_id = node_image_id()
+    return ec2.create_instances(
+        ImageId=image_id,
+        InstanceType=instance_type,
+        MinCount=num_instances,
+        MaxCount=num_instances,
+        KeyName=key_name,
+    )
+
+
+def node_image_id() -> str:
+    """Returns the ID of the AMI to launch nodes from, preferring the newest
+    node image.
+    """
+    latest = image_builder.latest_ami(ec2)
+    if latest is None:
+        return IMAGE_ID
+    if latest[1] != image_builder.image_version():
+        print(
+            f'\033[93m{latest[0]} is out of date, nodes launched from it '
+            'will be set up in full\033[0m'
+        )
+    return latest[0]
+
+
 def terminate_instances(instances) -> None:
     """Terminates the instances
     Args:
@@ -69,8 +118,24 @@ def terminate_instances(instances) -> None:
     print('\033[92mTerminated instances\033[0m')
 
 
-def _setup_instance(instance) -> None:
-    """Setups the instance by running a setup script once it is ready.
+def instance_running(instance) -> bool:
+    """Checks whether an instance is still running.
+    Args:
+        instance (boto3.resources.ec2.Instance): Instance to check
+    Returns:
+        bool: True if the instance is running
+    """
+    try:
+        instance.reload()
+    except Exception:
+        return False
+    return instance.state['Name'] == 'running'
+
+
+def setup_instance(instance) -> None:
+    """Setups the instance by running a setup script once it is ready. The
+    installation is skipped if the instance was launched from a node image of
+    the current version.
     Args:
         instance (boto3.resources.ec2.Instance): Instance to setup
     Returns:
@@ -82,12 +147,21 @@ def _setup_instance(instance) -> None:
     # Add the instance to a security group that allows SSH access
     instance.modify_attribute(Groups=SECURITY_GROUPS)
 
-    # Run the setup script
-    exit_code = subprocess.call([
+    # Run the setup script, which also starts the agent. The token is passed
+    # in the environment rather than as an argument, which any user could
+    # read.
+    args = [
         'bash',
         SERVER_SETUP_SCRIPT,
-        instance.public_ip_address
-    ])
+        instance.public_ip_address,
+        control_channel.CONTROL_CHANNEL_ADDRESS,
+    ]
+    if image_builder.is_current(instance.image_id, ec2):
+        args.append('prebaked')
+    exit_code = subprocess.call(args, env={
+        **os.environ,
+        'AGENT_TOKEN': control_channel.agent_token(instance.public_ip_address),
+    })
     if exit_code != 0:
         raise Exception(
             f'\033[91m{instance.id} setup failed with exit code {exit_code}\033[0m'  # noqa: E501
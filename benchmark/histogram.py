@@ -0,0 +1,166 @@
+"""A compact, mergeable latency histogram.
+
+Values are bucketed in the same way as an HDR histogram: each power of two is
+split into `2 ** SUB_BUCKET_BITS` linear sub-buckets, which bounds the
+relative error of any reported value while keeping the number of buckets
+logarithmic in the range of values recorded. Only non-empty buckets are
+stored, so a histogram for a run with a handful of distinct latencies is only
+a few bytes once serialised.
+
+Histograms from different nodes use the same bucket boundaries, so merging
+them is exact: the counts for each bucket are simply added together.
+
+This module only depends on the standard library as it is copied onto the
+nodes alongside `load_generator.py`.
+"""
+
+import typing as _t
+import math
+
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value: int) -> int:
+    """Returns the index of the bucket a value falls into.
+    Args:
+        value (int): Non-negative value to bucket
+    Returns:
+        int: Bucket index
+    """
+    shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+    return shift * SUB_BUCKET_COUNT + (value >> shift)
+
+
+def bucket_bounds(index: int) -> _t.Tuple[int, int]:
+    """Returns the lowest and highest values that map to a bucket.
+    Args:
+        index (int): Bucket index
+    Returns:
+        Tuple[int, int]: Inclusive lower and upper bound of the bucket
+    """
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index, index
+    shift = index // SUB_BUCKET_COUNT - 1
+    top = index - shift * SUB_BUCKET_COUNT
+    return top << shift, ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Histogram of latencies recorded in microseconds."""
+
+    def __init__(self):
+        """Creates an empty histogram."""
+        self.counts: _t.Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        """Returns the number of values recorded."""
+        return self.count
+
+    def record(self, value: int, count: int = 1) -> None:
+        """Records a value.
+        Args:
+            value (int): Value in microseconds
+            count (int): Number of times the value occurred
+        """
+        value = max(0, int(value))
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """Adds the values from another histogram into this one.
+        Args:
+            other (LatencyHistogram): Histogram to merge in
+        Returns:
+            LatencyHistogram: This histogram
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(
+                self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(
+                self.max, other.max)
+        return self
+
+    @property
+    def mean(self) -> _t.Optional[float]:
+        """Mean of the recorded values."""
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percentile: float) -> _t.Optional[int]:
+        """Returns the value at or below which the given percentage of
+        recorded values fall.
+        Args:
+            percentile (float): Percentile between 0 and 100
+        Returns:
+            int: Highest value equivalent to the percentile's bucket, clamped
+                to the recorded min and max.
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return max(self.min, min(self.max, bucket_bounds(index)[1]))
+        return self.max
+
+    def to_dict(self) -> _t.Dict[str, _t.Any]:
+        """Serialises the histogram.
+
+        Buckets are stored as a flat list of `[index delta, count, ...]` pairs
+        where each index is relative to the previous one.
+        """
+        buckets = []
+        previous = 0
+        for index in sorted(self.counts):
+            buckets += [index - previous, self.counts[index]]
+            previous = index
+        return {
+            'sub_bucket_bits': SUB_BUCKET_BITS,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': buckets,
+        }
+
+    @classmethod
+    def from_dict(cls, data: _t.Dict[str, _t.Any]) -> 'LatencyHistogram':
+        """Creates a histogram from the output of `to_dict`.
+        Args:
+            data (dict): Serialised histogram
+        Returns:
+            LatencyHistogram: The deserialised histogram
+        """
+        if data.get('sub_bucket_bits', SUB_BUCKET_BITS) != SUB_BUCKET_BITS:
+            raise ValueError('Histogram has incompatible bucket boundaries')
+        histogram = cls()
+        index = 0
+        buckets = data['buckets']
+        for i in range(0, len(buckets), 2):
+            index += buckets[i]
+            histogram.counts[index] = buckets[i + 1]
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
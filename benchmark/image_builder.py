@@ -0,0 +1,259 @@
+"""Builds the images the slave nodes are launched from, with Python and the
+agent already installed.
+
+Setting up a node from a plain Ubuntu image means updating its packages and
+copying the agent onto it every time it is launched, which is slow and gives
+a different node each time the packages change. Instead a golden image is
+built once per version of the agent, either as an AMI for the `ec2` provider
+or as a container image for the `docker` provider.
+
+The version of an image is a hash of the agent files and the setup script
+baked into it, so a new image is only needed when one of them changes. Nodes
+launched from an image whose version matches the current version skip the
+setup and only start the agent.
+
+Usage:
+    python image_builder.py ami
+    python image_builder.py docker
+    python image_builder.py version
+"""
+
+import typing as _t
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+try:
+    from . import providers
+except ImportError:
+    import providers
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NODE_SETUP_SCRIPT = os.path.join(BASE_DIR, 'node_setup.sh')
+
+IMAGE_NAME = 'cloud-swarm-node'
+# Tag holding the version of an AMI.
+VERSION_TAG = 'cloud-swarm-node-version'
+DOCKER_BASE_IMAGE = 'python:3.9-slim'
+
+# Versions of the AMIs looked up so far, by AMI ID.
+_ami_versions: _t.Dict[str, _t.Optional[str]] = {}
+
+
+def image_version(
+    files: _t.Optional[_t.List[str]] = None
+) -> str:
+    """Returns the version of the image which would be built now.
+    Args:
+        files (list): Files baked into the image. Defaults to the agent files
+            and the setup script.
+    Returns:
+        str: Short hash of the files
+    """
+    if files is None:
+        files = providers.AGENT_FILES + [NODE_SETUP_SCRIPT]
+    digest = hashlib.sha256()
+    for fp in files:
+        digest.update(os.path.basename(fp).encode())
+        with open(fp, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:12]
+
+
+def _ec2():
+    """Returns the EC2 resource, imported on first use as importing it
+    connects to AWS.
+    """
+    try:
+        from .ec2 import ec2
+    except ImportError:
+        from ec2 import ec2
+    return ec2
+
+
+def latest_ami(ec2=None) -> _t.Optional[_t.Tuple[str, str]]:
+    """Finds the newest node AMI owned by this account.
+    Args:
+        ec2: EC2 resource. Defaults to the `ec2` module's resource.
+    Returns:
+        tuple: The ID and version of the AMI, or None if there is none
+    """
+    ec2 = ec2 or _ec2()
+    images = ec2.images.filter(
+        Owners=['self'],
+        Filters=[
+            {'Name': 'tag-key', 'Values': [VERSION_TAG]},
+            {'Name': 'state', 'Values': ['available']},
+        ]
+    )
+    images = sorted(images, key=lambda image: image.creation_date)
+    if not images:
+        return None
+    image = images[-1]
+    return image.id, _tag(image, VERSION_TAG)
+
+
+def ami_version(image_id: str, ec2=None) -> _t.Optional[str]:
+    """Returns the version an AMI was built from, or None if it is not a node
+    AMI. The versions are cached as an AMI cannot be changed once built.
+    Args:
+        image_id (str): ID of the AMI
+        ec2: EC2 resource. Defaults to the `ec2` module's resource.
+    Returns:
+        str: Version of the AMI
+    """
+    if image_id not in _ami_versions:
+        ec2 = ec2 or _ec2()
+        try:
+            version = _tag(ec2.Image(image_id), VERSION_TAG)
+        except Exception:
+            return None
+        _ami_versions[image_id] = version
+    return _ami_versions[image_id]
+
+
+def is_current(image_id: str, ec2=None) -> bool:
+    """Returns True if an AMI was built from the current agent files, so
+    nodes launched from it do not need setting up.
+    """
+    return ami_version(image_id, ec2) == image_version()
+
+
+def build_ami(
+    base_image_id: str,
+    instance_type: str,
+    key_name: str,
+    security_groups: _t.List[str],
+    ec2=None,
+) -> str:
+    """Builds a node AMI for the current version, unless it already exists.
+    Args:
+        base_image_id (str): AMI to build the image from
+        instance_type (str): Instance type to build the image on
+        key_name (str): Name of the key pair
+        security_groups (list): Security groups which allow SSH access
+        ec2: EC2 resource. Defaults to the `ec2` module's resource.
+    Returns:
+        str: ID of the AMI
+    """
+    ec2 = ec2 or _ec2()
+    version = image_version()
+    latest = latest_ami(ec2)
+    if latest is not None and latest[1] == version:
+        return latest[0]
+
+    builder, = ec2.create_instances(
+        ImageId=base_image_id,
+        InstanceType=instance_type,
+        MinCount=1,
+        MaxCount=1,
+        KeyName=key_name,
+    )
+    try:
+        builder.wait_until_running()
+        builder.modify_attribute(Groups=security_groups)
+        builder.reload()
+        subprocess.run(
+            [
+                'bash',
+                NODE_SETUP_SCRIPT,
+                builder.public_ip_address,
+                *providers.AGENT_FILES,
+            ],
+            check=True,
+        )
+        image = builder.create_image(
+            Name=f'{IMAGE_NAME}-{version}',
+            TagSpecifications=[{
+                'ResourceType': 'image',
+                'Tags': [{'Key': VERSION_TAG, 'Value': version}],
+            }],
+        )
+        ec2.meta.client.get_waiter('image_available').wait(
+            ImageIds=[image.id]
+        )
+    finally:
+        builder.terminate()
+    print(f'\033[92mBuilt {image.id} for version {version}\033[0m')
+    return image.id
+
+
+def docker_tag(version: _t.Optional[str] = None) -> str:
+    """Returns the tag of the node container image for a version."""
+    return f'{IMAGE_NAME}:{version or image_version()}'
+
+
+def docker_image_exists(tag: str) -> bool:
+    """Returns True if a container image has been built locally."""
+    try:
+        return subprocess.call(
+            ['docker', 'image', 'inspect', tag],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) == 0
+    except OSError:
+        return False
+
+
+def build_docker_image(base_image: str = DOCKER_BASE_IMAGE) -> str:
+    """Builds the node container image for the current version, unless it
+    already exists.
+    Args:
+        base_image (str): Image with Python 3 installed to build on
+    Returns:
+        str: Tag of the image
+    """
+    tag = docker_tag()
+    if docker_image_exists(tag):
+        return tag
+    with tempfile.TemporaryDirectory() as context:
+        for fp in providers.AGENT_FILES:
+            shutil.copy(fp, context)
+        with open(os.path.join(context, 'Dockerfile'), 'w') as f:
+            f.write(
+                f'FROM {base_image}\n'
+                f'WORKDIR {providers.DockerProvider.NODE_DIR}\n'
+                'COPY *.py ./\n'
+                'CMD ["python3", "agent.py"]\n'
+            )
+        subprocess.run(['docker', 'build', '-t', tag, context], check=True)
+    print(f'\033[92mBuilt {tag}\033[0m')
+    return tag
+
+
+def _tag(resource, key: str) -> _t.Optional[str]:
+    """Returns the value of a tag on an EC2 resource."""
+    for tag in resource.tags or []:
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
+
+
+def main(args: _t.Optional[_t.List[str]] = None) -> None:
+    """Entry point when run as a script."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('target', choices=['ami', 'docker', 'version'])
+    args = parser.parse_args(args)
+
+    if args.target == 'version':
+        print(image_version())
+    elif args.target == 'docker':
+        print(build_docker_image())
+    else:
+        try:
+            from . import ec2
+        except ImportError:
+            import ec2
+        print(build_ami(
+            ec2.IMAGE_ID,
+            ec2.INSTANCE_TYPE,
+            ec2.KEY_NAME,
+            ec2.SECURITY_GROUPS
+        ))
+
+
+if __name__ == '__main__':
+    main()
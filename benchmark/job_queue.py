@@ -1,4 +1,10 @@
+import typing as _t
+import contextlib
 import os
+import logging
+import socket
+import threading
+import time
 import redis
 import json
 
@@ -11,20 +17,450 @@ connection = redis.Redis(
 
 MAX_NODES = 32
 
+# The site and the controllers send each other events on Redis streams, which
+# keep each event until a controller has acknowledged it, so no event is lost
+# while the controllers are down. Each stream is capped at roughly this many
+# events.
+STREAM_MAX_LENGTH = 10000
+
+# Seconds a benchmark ID is remembered after it was queued, so that an event
+# which is delivered more than once does not queue the benchmark twice.
+SEEN_TTL = 7 * 24 * 60 * 60
+
+# How the next benchmark to run is picked:
+#   fifo      Strictly in order, the head of the queue blocks everything
+#             behind it until there are enough free nodes for it.
+#   backfill  EASY backfilling. The head of the queue gets a reservation for
+#             the earliest time enough nodes will be free for it, and smaller
+#             benchmarks behind it are run in the idle nodes as long as they
+#             will not delay that reservation.
+SCHEDULER = os.environ.get('JOB_QUEUE_SCHEDULER', 'fifo')
+
+# Seconds a lease on the nodes of a running benchmark lasts unless it is
+# renewed. Leases are renewed three times per TTL, so this only needs to cover
+# the controller's clock being out and a missed renewal or two.
+LEASE_TTL = int(os.environ.get('JOB_QUEUE_LEASE_TTL', 60))
+
+# Number of times a benchmark is run before it is given up on when the
+# controllers running it keep dying. Benchmarks which are given up on are
+# added to the failed benchmarks list to be reported to the site.
+MAX_ATTEMPTS = 3
+
+# Name the leases taken by this controller are held under.
+LEASE_OWNER = os.environ.get(
+    'CONSUMER_NAME',
+    f'{socket.gethostname()}-{os.getpid()}'
+)
+
+# Number of benchmarks behind the head of the queue considered for backfill.
+BACKFILL_DEPTH = 100
+
+# Seconds a benchmark is assumed to take when it has no estimated runtime.
+DEFAULT_ESTIMATED_RUNTIME = 5 * 60
+
+# Priority classes, from the highest to the lowest. Each class has its own
+# queue and a benchmark is only taken from a class once the classes above it
+# are empty.
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+PRIORITIES = (PRIORITY_PAID, PRIORITY_FREE)
+
+# Within a priority class the benchmarks are ordered by start-time fair
+# queuing across the accounts which submitted them. Each account has a
+# virtual finish time, which goes up by the cost of each benchmark it submits
+# (the number of nodes multiplied by the estimated runtime) divided by the
+# account's weight. A benchmark is queued at the later of its account's
+# finish time and the class's virtual time, which is the start tag of the
+# last benchmark taken from the class. So an account which submits a burst of
+# benchmarks has them interleaved with the other accounts' benchmarks rather
+# than queued in front of them.
+#
+# The state is kept in a hash with the fields:
+#   vtime:<class>             Virtual time of the class
+#   finish:<class>:<account>  Virtual finish time of the account
+#   work:<class>              Total cost of the benchmarks queued in the class
+#
+# A benchmark which has been queued before is ignored.
+#
+# KEYS[1]: jobs hash, KEYS[2]: state hash, KEYS[3]: queue of the class,
+# KEYS[4]: key marking the benchmark as seen
+# ARGV[1]: member, ARGV[2]: benchmark, ARGV[3]: class, ARGV[4]: account,
+# ARGV[5]: cost, ARGV[6]: weight, ARGV[7]: seconds to remember the benchmark
+# Returns 1 if the benchmark was queued, otherwise 0.
+PUSH_SCRIPT = """
+if not redis.call('SET', KEYS[4], 1, 'NX', 'EX', ARGV[7]) then
+    return 0
+end
+local vtime = tonumber(
+    redis.call('HGET', KEYS[2], 'vtime:' .. ARGV[3]) or '0'
+)
+local finish_field = 'finish:' .. ARGV[3] .. ':' .. ARGV[4]
+local finish = tonumber(redis.call('HGET', KEYS[2], finish_field) or '0')
+local start = math.max(vtime, finish)
+redis.call(
+    'HSET', KEYS[2], finish_field,
+    tostring(start + tonumber(ARGV[5]) / tonumber(ARGV[6]))
+)
+redis.call('HINCRBYFLOAT', KEYS[2], 'work:' .. ARGV[3], ARGV[5])
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], start, ARGV[1])
+return 1
+"""
+
+# Each benchmark taken off the queue holds a lease on its nodes, kept in the
+# running benchmarks hash, which must be renewed before it expires by the
+# controller running the benchmark. The number of nodes in use is the total
+# of the live leases, so when a controller dies without releasing its leases
+# the nodes are counted as free again once the leases expire, and the
+# benchmarks are put back at the front of their queue to be run again, up to
+# `MAX_ATTEMPTS` times, after which they are added to the failed benchmarks
+# list. There is a lease for each running benchmark and every
+# benchmark uses at least one node, so the hash never has more than
+# `max_nodes` entries and reading all of it stays cheap.
+#
+# Each lease is stored as JSON with the fields:
+#   num_servers   Number of nodes the benchmark uses
+#   expected_end  Epoch time the benchmark is expected to end
+#   expires       Epoch time the lease expires unless renewed
+#   owner         Name of the controller running the benchmark
+#   job           The benchmark as it was queued
+#
+# Functions shared by the scripts which take benchmarks off the queues.
+#
+# KEYS[1]: jobs hash, KEYS[2]: state hash, KEYS[3]: running benchmarks,
+# KEYS[4]: failed benchmarks, KEYS[5...]: queue of each class in order
+# ARGV[1]: current epoch time, ARGV[2]: lease TTL, ARGV[3]: owner,
+# ARGV[4]: default estimated runtime, ARGV[5]: maximum attempts
+QUEUE_FUNCTIONS = """
+local now = tonumber(ARGV[1])
+local num_classes = #KEYS - 4
+
+local function runtime(job)
+    local estimate = job['estimated_runtime']
+    if estimate == nil or estimate == cjson.null then
+        return tonumber(ARGV[4])
+    end
+    return tonumber(estimate)
+end
+
+local function head(class)
+    local entry = redis.call('ZRANGE', KEYS[4 + class], 0, 0, 'WITHSCORES')
+    if #entry == 0 then
+        return nil
+    end
+    return entry[1], tonumber(entry[2])
+end
+
+local function first_class()
+    for class = 1, num_classes do
+        local member = head(class)
+        if member then
+            return class
+        end
+    end
+    return nil
+end
+
+-- Removes the expired leases, puts their benchmarks back at the front of
+-- their queue, or on the failed list once they have been tried too many
+-- times, and returns the live leases.
+local function live_leases()
+    local leases = {}
+    local entries = redis.call('HGETALL', KEYS[3])
+    for i = 1, #entries, 2 do
+        local lease = cjson.decode(entries[i + 1])
+        if lease['expires'] > now then
+            table.insert(leases, lease)
+        else
+            redis.call('HDEL', KEYS[3], entries[i])
+            local job = lease['job']
+            job['attempts'] = (job['attempts'] or 1) + 1
+            if job['attempts'] <= tonumber(ARGV[5]) then
+                local class = job['priority'] + 1
+                local name = tostring(job['priority'])
+                local member = string.format('%012d', job['benchmark_id'])
+                local vtime = tonumber(
+                    redis.call('HGET', KEYS[2], 'vtime:' .. name) or '0'
+                )
+                redis.call('HSET', KEYS[1], member, cjson.encode(job))
+                redis.call(
+                    'HINCRBYFLOAT', KEYS[2], 'work:' .. name, job['cost']
+                )
+                redis.call('ZADD', KEYS[4 + class], vtime, member)
+            else
+                redis.call('RPUSH', KEYS[4], cjson.encode(job))
+            end
+        end
+    end
+    return leases
+end
+
+local function used_nodes(leases)
+    local used = 0
+    for _, lease in ipairs(leases) do
+        used = used + lease['num_servers']
+    end
+    return used
+end
+
+local function take(class, member)
+    local queue = KEYS[4 + class]
+    local name = tostring(class - 1)
+    local raw = redis.call('HGET', KEYS[1], member)
+    local job = cjson.decode(raw)
+    local start = tonumber(redis.call('ZSCORE', queue, member))
+    local vtime = tonumber(
+        redis.call('HGET', KEYS[2], 'vtime:' .. name) or '0'
+    )
+    redis.call('ZREM', queue, member)
+    redis.call('HDEL', KEYS[1], member)
+    redis.call(
+        'HSET', KEYS[2], 'vtime:' .. name, tostring(math.max(vtime, start))
+    )
+    if redis.call('ZCARD', queue) == 0 then
+        redis.call('HSET', KEYS[2], 'work:' .. name, 0)
+    else
+        redis.call('HINCRBYFLOAT', KEYS[2], 'work:' .. name, -job['cost'])
+    end
+    redis.call('HSET', KEYS[3], job['benchmark_id'], cjson.encode({
+        num_servers = job['num_servers'],
+        expected_end = now + runtime(job),
+        expires = now + tonumber(ARGV[2]),
+        owner = ARGV[3],
+        job = job,
+    }))
+    return raw
+end
+"""
+
+# Admits a benchmark if there are enough free nodes for it. The check, the
+# removal from the queue and the lease on the nodes all happen in a single
+# step on the server, so concurrent callers can never admit more than
+# `max_nodes` between them. The backfill uses the time each running benchmark
+# is expected to end to work out when nodes will be free.
+#
+# KEYS: see `QUEUE_FUNCTIONS`
+# ARGV[1...5]: see `QUEUE_FUNCTIONS`, ARGV[6]: max nodes, ARGV[7]: 1 to
+# backfill, ARGV[8]: backfill depth
+# Returns the admitted benchmark or nil.
+ADMIT_SCRIPT = QUEUE_FUNCTIONS + """
+local max_nodes = tonumber(ARGV[6])
+local running = live_leases()
+local free = max_nodes - used_nodes(running)
+
+local head_class = first_class()
+if not head_class then
+    return nil
+end
+local head_member = head(head_class)
+local head_job = cjson.decode(redis.call('HGET', KEYS[1], head_member))
+if head_job['num_servers'] <= free then
+    return take(head_class, head_member)
+end
+if ARGV[7] ~= '1' or free <= 0 then
+    return nil
+end
+
+-- Find the earliest time enough nodes will be free for the head of the
+-- queue (the shadow time) and how many nodes will be spare at that time.
+local shadow = nil
+local extra = 0
+if head_job['num_servers'] > max_nodes then
+    -- The head can never run, so it cannot be delayed either.
+    shadow = math.huge
+    extra = max_nodes
+else
+    table.sort(running, function(a, b)
+        return a['expected_end'] < b['expected_end']
+    end)
+    local available = free
+    for _, lease in ipairs(running) do
+        available = available + lease['num_servers']
+        if available >= head_job['num_servers'] then
+            shadow = math.max(now, lease['expected_end'])
+            extra = available - head_job['num_servers']
+            break
+        end
+    end
+end
+
+-- Run the first benchmark that fits in the free nodes and either ends
+-- before the shadow time or only uses nodes which are spare at that time.
+-- The classes above the head's class are empty, so only its class and the
+-- ones below it are searched.
+local depth = tonumber(ARGV[8])
+for class = head_class, num_classes do
+    if depth <= 0 then
+        break
+    end
+    local first = 0
+    if class == head_class then
+        first = 1
+    end
+    local members = redis.call(
+        'ZRANGE', KEYS[4 + class], first, first + depth - 1
+    )
+    depth = depth - #members
+    for _, member in ipairs(members) do
+        local job = cjson.decode(redis.call('HGET', KEYS[1], member))
+        local num_servers = job['num_servers']
+        if num_servers <= free and (
+            now + runtime(job) <= shadow or num_servers <= extra
+        ) then
+            return take(class, member)
+        end
+    end
+end
+return nil
+"""
+
+# Pops the benchmark at the head of the queue and takes a lease on its nodes
+# in one step, whether or not there is room for it.
+#
+# KEYS, ARGV: see `QUEUE_FUNCTIONS`
+POP_SCRIPT = QUEUE_FUNCTIONS + """
+live_leases()
+local class = first_class()
+if not class then
+    return nil
+end
+return take(class, head(class))
+"""
+
+# Renews the lease of a running benchmark, as long as it is still held by the
+# same controller.
+#
+# KEYS[1]: running benchmarks
+# ARGV[1]: benchmark ID, ARGV[2]: current epoch time, ARGV[3]: lease TTL,
+# ARGV[4]: owner
+# Returns 1 if the lease was renewed, or 0 if it has been lost.
+RENEW_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then
+    return 0
+end
+local lease = cjson.decode(raw)
+if lease['owner'] ~= ARGV[4] or lease['expires'] <= tonumber(ARGV[2]) then
+    return 0
+end
+lease['expires'] = tonumber(ARGV[2]) + tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(lease))
+return 1
+"""
+
+# Releases the lease of a benchmark, as long as it is still held by the same
+# controller, so a controller which lost its lease cannot release the lease
+# another controller has since taken.
+#
+# KEYS[1]: running benchmarks
+# ARGV[1]: benchmark ID, ARGV[2]: owner
+# Returns 1 if the lease was released, or 0 if it was not held.
+RELEASE_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw or cjson.decode(raw)['owner'] ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Works out how many benchmarks are ahead of a queued benchmark and when it is
+# expected to start. Only the counts of the queues and the total cost queued
+# in each class are read, along with the running benchmarks (of which there
+# can be no more than there are nodes), so the cost does not grow with the
+# length of the queue. The cost of the benchmarks ahead in its own class is
+# taken to be the class's average.
+#
+# KEYS[1]: state hash, KEYS[2]: running benchmarks, KEYS[3...]: queue of each
+# class in order
+# ARGV[1]: member, ARGV[2]: current epoch time, ARGV[3]: max nodes
+# Returns {number of benchmarks ahead, expected epoch start time} or nil.
+STATUS_SCRIPT = """
+local now = tonumber(ARGV[2])
+local ahead = 0
+local work = 0
+local found = false
+for class = 1, #KEYS - 2 do
+    local queue = KEYS[2 + class]
+    local class_work = tonumber(
+        redis.call('HGET', KEYS[1], 'work:' .. tostring(class - 1)) or '0'
+    )
+    local rank = redis.call('ZRANK', queue, ARGV[1])
+    if rank then
+        ahead = ahead + rank
+        work = work + rank * class_work / redis.call('ZCARD', queue)
+        found = true
+        break
+    end
+    ahead = ahead + redis.call('ZCARD', queue)
+    work = work + class_work
+end
+if not found then
+    return nil
+end
+for _, raw in ipairs(redis.call('HVALS', KEYS[2])) do
+    local lease = cjson.decode(raw)
+    if lease['expires'] > now then
+        work = work + lease['num_servers'] * math.max(
+            0, lease['expected_end'] - now
+        )
+    end
+end
+return {ahead, tostring(now + math.max(0, work) / tonumber(ARGV[3]))}
+"""
+
+
+class LeaseLost(Exception):
+    """The lease on the nodes of a running benchmark was lost."""
+
 
 class Queue:
-    """A simple queue which ensures that the benchmarks are ran one at time.
+    """Queues benchmarks by priority class, ordered by fair share across
+    the accounts in each class, and admits them while enough nodes are free,
+    so several benchmarks can run at once.
     """
 
-    def __init__(self, max_nodes: int = MAX_NODES, **kwargs):
-        """Initializes the queue."""
+    def __init__(
+        self,
+        max_nodes: int = MAX_NODES,
+        connection: redis.Redis = connection,
+        scheduler: str = SCHEDULER,
+        lease_ttl: float = LEASE_TTL,
+        owner: str = LEASE_OWNER,
+        **kwargs
+    ):
+        """Initializes the queue.
+        Args:
+            max_nodes (int): Maximum number of nodes in use at once
+            connection (redis.Redis): Connection to the event bus
+            scheduler (str): `fifo` or `backfill`, see `SCHEDULER`
+            lease_ttl (float): Seconds a lease lasts unless it is renewed
+            owner (str): Name the leases taken through this queue are held
+                under, which must be unique to each controller
+        """
+        if scheduler not in ('fifo', 'backfill'):
+            raise ValueError(f'Unknown scheduler: {scheduler}')
         self.max_nodes = max_nodes
-        if kwargs.pop('test', False):
-            self.queue_name = 'benchmark.queue.test'
-            self.nodes_count_name = 'benchmark.active_nodes_count.test'
-        else:
-            self.queue_name = 'benchmark.queue'
-            self.nodes_count_name = 'benchmark.active_nodes_count'
+        self.connection = connection
+        self.scheduler = scheduler
+        self.lease_ttl = lease_ttl
+        self.owner = owner
+        self._push = connection.register_script(PUSH_SCRIPT)
+        self._admit = connection.register_script(ADMIT_SCRIPT)
+        self._pop = connection.register_script(POP_SCRIPT)
+        self._renew = connection.register_script(RENEW_SCRIPT)
+        self._release = connection.register_script(RELEASE_SCRIPT)
+        self._status = connection.register_script(STATUS_SCRIPT)
+        suffix = '.test' if kwargs.pop('test', False) else ''
+        self.queue_name = 'benchmark.queue' + suffix
+        self.jobs_name = 'benchmark.queue.jobs' + suffix
+        self.state_name = 'benchmark.queue.state' + suffix
+        self.running_name = 'benchmark.running' + suffix
+        self.seen_name = 'benchmark.seen' + suffix
+        self.failed_name = 'benchmark.failed' + suffix
+        self.queue_names = [
+            f'{self.queue_name}.{priority}' for priority in PRIORITIES
+        ]
 
     def __len__(self):
         """Returns the size of the queue."""
@@ -43,34 +479,165 @@ class Queue:
         """Returns a string representation of the queue."""
         return 'Queue({})'.format(self.size())
 
+    @staticmethod
+    def member(benchmark_id: int) -> str:
+        """Returns the member a benchmark is stored as in the queues. It is
+        padded so that benchmarks with the same start tag are ordered by ID.
+        """
+        return str(benchmark_id).zfill(12)
+
+    def _keys(self) -> _t.List[str]:
+        """Returns the keys taken by the scripts which take benchmarks off the
+        queues.
+        """
+        return [
+            self.jobs_name,
+            self.state_name,
+            self.running_name,
+            self.failed_name,
+        ] + self.queue_names
+
+    def _args(self, now: _t.Optional[float] = None) -> _t.List:
+        """Returns the arguments taken by the scripts which take benchmarks
+        off the queues.
+        """
+        return [
+            time.time() if now is None else now,
+            self.lease_ttl,
+            self.owner,
+            DEFAULT_ESTIMATED_RUNTIME,
+            MAX_ATTEMPTS,
+        ]
+
     def push(
         self,
         benchmark_id: int,
         url: str,
         num_nodes: int,
-        requests_per_node: int
-    ):
-        """Pushes a new benchmark to the queue."""
-
-        connection.rpush(
-            self.queue_name,
-            json.dumps({
-                'benchmark_id': benchmark_id,
-                'domain': url,
-                'num_servers': num_nodes,
-                'num_requests': requests_per_node
-            })
-        )
+        requests_per_node: int,
+        estimated_runtime: _t.Optional[float] = None,
+        priority: int = PRIORITY_PAID,
+        account_id: _t.Optional[int] = None,
+        weight: float = 1,
+    ) -> bool:
+        """Pushes a new benchmark to the queue, unless it has been pushed
+        before.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            url (str): URL of the site to benchmark
+            num_nodes (int): Number of nodes to run the benchmark on
+            requests_per_node (int): Number of requests to run per node
+            estimated_runtime (float): Seconds the benchmark is expected to
+                take, used by the backfill scheduler
+            priority (int): Priority class, one of `PRIORITIES`
+            account_id (int): ID of the account which requested the
+                benchmark. Benchmarks without an account are treated as
+                coming from a single account.
+            weight (float): Share of the queue the account is entitled to
+                relative to the other accounts in the same class
+        Returns:
+            bool: False if the benchmark has already been pushed
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        if weight <= 0:
+            raise ValueError('The weight must be positive')
+        cost = num_nodes * (estimated_runtime or DEFAULT_ESTIMATED_RUNTIME)
+        return bool(self._push(
+            keys=[
+                self.jobs_name,
+                self.state_name,
+                self.queue_names[priority],
+                f'{self.seen_name}.{benchmark_id}',
+            ],
+            args=[
+                self.member(benchmark_id),
+                json.dumps({
+                    'benchmark_id': benchmark_id,
+                    'domain': url,
+                    'num_servers': num_nodes,
+                    'num_requests': requests_per_node,
+                    'estimated_runtime': estimated_runtime,
+                    'priority': priority,
+                    'account_id': account_id,
+                    'cost': cost,
+                }),
+                priority,
+                '' if account_id is None else account_id,
+                cost,
+                weight,
+                SEEN_TTL,
+            ]
+        ))
 
     def pop(self):
-        """Pops a benchmark from the queue."""
-        job = json.loads(connection.lpop(self.queue_name))
-        self.add_active_nodes(job['num_servers'])
-        return job
+        """Pops a benchmark from the queue and takes a lease on its nodes."""
+        job = self._pop(keys=self._keys(), args=self._args())
+        if job is None:
+            return None
+        return json.loads(job)
+
+    def admit(self, now: _t.Optional[float] = None):
+        """Removes the next benchmark to run from the queue and takes a lease
+        on its nodes, if there are enough nodes available for it. With the
+        backfill scheduler this may be a benchmark behind the head of the
+        queue. This is atomic, so it is safe to call from several threads or
+        processes at once.
+        Args:
+            now (float): Current epoch time. Defaults to the system clock.
+        Returns:
+            dict: The benchmark, or None if no benchmark can run yet
+        """
+        job = self._admit(
+            keys=self._keys(),
+            args=self._args(now) + [
+                self.max_nodes,
+                int(self.scheduler == 'backfill'),
+                BACKFILL_DEPTH,
+            ]
+        )
+        if job is None:
+            return None
+        return json.loads(job)
+
+    def status(
+        self,
+        benchmark_id: int,
+        now: _t.Optional[float] = None
+    ) -> _t.Optional[_t.Dict[str, float]]:
+        """Returns where a benchmark is in the queue without reading the
+        benchmarks ahead of it, so it is cheap enough to call on every
+        dashboard refresh.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            now (float): Current epoch time. Defaults to the system clock.
+        Returns:
+            dict: `ahead`, the number of benchmarks ahead of it, and
+                `estimated_start`, the epoch time it is expected to start.
+                None if the benchmark is not queued.
+        """
+        status = self._status(
+            keys=[self.state_name, self.running_name] + self.queue_names,
+            args=[
+                self.member(benchmark_id),
+                time.time() if now is None else now,
+                self.max_nodes,
+            ]
+        )
+        if status is None:
+            return None
+        ahead, estimated_start = status
+        return {
+            'ahead': int(ahead),
+            'estimated_start': float(estimated_start),
+        }
 
     def size(self):
         """Returns the size of the queue."""
-        return connection.llen(self.queue_name)
+        with self.connection.pipeline() as pipe:
+            for name in self.queue_names:
+                pipe.zcard(name)
+            return sum(pipe.execute())
 
     def is_empty(self):
         """Returns True if the queue is empty."""
@@ -78,33 +645,180 @@ class Queue:
 
     def clear(self):
         """Clears the queue."""
-        connection.delete(self.queue_name)
-        connection.delete(self.nodes_count_name)
+        self.connection.delete(
+            self.jobs_name,
+            self.state_name,
+            self.running_name,
+            self.failed_name,
+            *self.queue_names,
+            *self.connection.scan_iter(f'{self.seen_name}.*')
+        )
+
+    def leases(
+        self,
+        now: _t.Optional[float] = None
+    ) -> _t.Dict[int, _t.Dict[str, _t.Any]]:
+        """Returns the live leases by benchmark ID."""
+        now = time.time() if now is None else now
+        leases = {}
+        for benchmark_id, raw in self.connection.hgetall(
+            self.running_name
+        ).items():
+            lease = json.loads(raw)
+            if lease['expires'] > now:
+                leases[int(benchmark_id)] = lease
+        return leases
+
+    def active_nodes(self, now: _t.Optional[float] = None) -> int:
+        """Returns the number of nodes held by live leases."""
+        return sum(
+            lease['num_servers'] for lease in self.leases(now).values()
+        )
+
+    def renew(self, benchmark_id: int, now: _t.Optional[float] = None) -> bool:
+        """Renews the lease on the nodes of a running benchmark.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            now (float): Current epoch time. Defaults to the system clock.
+        Returns:
+            bool: False if the lease has expired or is held by another
+                controller, in which case the benchmark has been put back on
+                the queue.
+        """
+        return bool(self._renew(
+            keys=[self.running_name],
+            args=[
+                benchmark_id,
+                time.time() if now is None else now,
+                self.lease_ttl,
+                self.owner,
+            ]
+        ))
 
-    def active_nodes(self) -> int:
-        """Returns the number of active nodes."""
-        nodes = connection.get(self.nodes_count_name)
-        if nodes is None:
-            connection.set(self.nodes_count_name, 0)
-            return 0
-        return int(nodes)
+    def release(
+        self,
+        benchmark_id: int,
+        owner: _t.Optional[str] = None
+    ) -> bool:
+        """Releases the lease on the nodes of a benchmark which finished. A
+        benchmark is only released once, however many times it is called.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            owner (str): Name of the controller which ran the benchmark.
+                Defaults to the owner of this queue.
+        Returns:
+            bool: False if the benchmark was not running, or its lease is
+                held by another controller
+        """
+        return bool(self._release(
+            keys=[self.running_name],
+            args=[benchmark_id, owner or self.owner]
+        ))
 
-    def add_active_nodes(self, num_nodes: int):
-        """Adds the number of active nodes."""
-        connection.incrby(self.nodes_count_name, num_nodes)
+    @contextlib.contextmanager
+    def lease(
+        self,
+        benchmark_id: int,
+        on_lost: _t.Optional[_t.Callable[[], None]] = None,
+    ) -> _t.Iterator[threading.Event]:
+        """Keeps the lease on the nodes of a benchmark renewed while it runs
+        and releases it once it finishes.
 
-    def remove_active_nodes(self, num_nodes: int):
-        """Removes the number of active nodes."""
-        connection.decrby(self.nodes_count_name, num_nodes)
+        The lease is lost if it is taken by another controller or cannot be
+        renewed before it expires. The benchmark has then been put back on
+        the queue to be run again, so `on_lost` is called, from another
+        thread, to stop this run.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            on_lost (Callable): Called once the lease has been lost
+        Yields:
+            threading.Event: Set once the lease has been lost
+        """
+        stopped = threading.Event()
+        lost = threading.Event()
+
+        def heartbeat():
+            renewed_at = time.monotonic()
+            while not stopped.wait(self.lease_ttl / 3):
+                try:
+                    if self.renew(benchmark_id):
+                        renewed_at = time.monotonic()
+                        continue
+                    logging.error(
+                        'The lease of benchmark {} has expired or been '
+                        'taken by another controller'.format(benchmark_id)
+                    )
+                except redis.RedisError as e:
+                    logging.error(
+                        'Could not renew the lease of benchmark {}: {}'
+                        .format(benchmark_id, e)
+                    )
+                    if time.monotonic() - renewed_at < self.lease_ttl:
+                        continue
+                lost.set()
+                if on_lost is not None:
+                    on_lost()
+                return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stopped.set()
+            thread.join()
+            self.release(benchmark_id)
+
+    def take_failed(self) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Removes a benchmark which was given up on, after being tried
+        `MAX_ATTEMPTS` times, from the failed benchmarks list.
+        Returns:
+            dict: The benchmark as it was queued, or None if there are none
+        """
+        job = self.connection.lpop(self.failed_name)
+        return job and json.loads(job)
 
     def available_nodes(self) -> int:
         """Returns the number of available nodes."""
         return self.max_nodes - self.active_nodes()
 
+    def peek(self) -> _t.Optional[_t.Dict[str, _t.Any]]:
+        """Returns the benchmark at the head of the queue without removing
+        it.
+        """
+        for name in self.queue_names:
+            members = self.connection.zrange(name, 0, 0)
+            if members:
+                job = self.connection.hget(self.jobs_name, members[0])
+                return job and json.loads(job)
+        return None
+
     def can_run_next_job(self) -> bool:
-        """Returns True if the next benchmark can be run."""
-        next_job = connection.lindex(self.queue_name, 0)
+        """Returns True if the next benchmark can be run. The answer may be
+        stale by the time it is acted on, use `admit` to run the benchmark.
+        """
+        next_job = self.peek()
         if next_job is None:
             return False
-        next_job = json.loads(next_job)
         return self.available_nodes() >= next_job['num_servers']
+
+
+def publish(
+    stream: str,
+    message: _t.Dict[str, _t.Any],
+    connection: redis.Redis = connection,
+    maxlen: int = STREAM_MAX_LENGTH,
+) -> None:
+    """Adds an event to a stream.
+    Args:
+        stream (str): Name of the stream
+        message (dict): The event
+        connection (redis.Redis): Connection to the event bus
+        maxlen (int): Rough number of events to cap the stream at
+    """
+    connection.xadd(
+        stream,
+        {'data': json.dumps(message)},
+        maxlen=maxlen,
+        approximate=True
+    )
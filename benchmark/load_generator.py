@@ -0,0 +1,474 @@
+"""Asynchronous HTTP load generator which runs on each slave node.
+
+The node's agent runs it in process when a job arrives, but it can also be run
+on its own. Requests are spread over a pool of persistent keep-alive
+connections, one per concurrent worker, and each worker can optionally
+pipeline several HTTP/1.1 requests on its connection before reading the
+responses back.
+
+The script only depends on the standard library so that it can run on a
+freshly launched node without installing anything. It writes the same
+`results.json` file that `MasterNode.calculate_results` reads.
+
+Usage:
+    python3 load_generator.py -n 1000 -c 50 -p 1 https://example.com/
+"""
+
+import typing as _t
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+from histogram import LatencyHistogram
+from timeseries import ThroughputSeries
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+USER_AGENT = 'Cloud Horde Benchmark'
+FORWARDED_FOR = 'webhorde.com'
+
+DEFAULT_CONCURRENCY = 50
+DEFAULT_PIPELINE = 1
+DEFAULT_TIMEOUT = 30
+READ_CHUNK_SIZE = 64 * 1024
+# Seconds between each report of the live metrics of a run.
+METRICS_INTERVAL = 1
+
+
+class Target:
+    """Represents the URL being benchmarked."""
+
+    def __init__(self, url: str):
+        """Creates a target.
+        Args:
+            url (str): URL to benchmark
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {parts.scheme}')
+
+        self.url = url
+        self.host = parts.hostname
+        self.use_ssl = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.use_ssl else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        host_header = parts.netloc.rsplit('@', 1)[-1]
+        self.request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {host_header}\r\n'
+            f'User-Agent: {USER_AGENT}\r\n'
+            f'X-Forwarded-For: {FORWARDED_FOR}\r\n'
+            'Accept: */*\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'
+        ).encode('latin-1')
+
+    def ssl_context(self) -> _t.Optional[ssl.SSLContext]:
+        """Returns the SSL context to use for the connection."""
+        if not self.use_ssl:
+            return None
+        return ssl.create_default_context()
+
+
+class LoadStats:
+    """Collects the latency and outcome of each request."""
+
+    def __init__(self):
+        """Creates an empty set of stats."""
+        self.complete_requests = 0
+        self.failed_requests = 0
+        self.histogram = LatencyHistogram()
+        self.series = ThroughputSeries()
+        self.started_at = None
+        self.finished_at = None
+        # Requests since the live metrics were last taken.
+        self.window = LatencyHistogram()
+        self.window_requests = 0
+        self.window_failures = 0
+        # Used to convert the monotonic clock into epoch timestamps.
+        self._clock_offset = time.time() - time.perf_counter()
+
+    def now(self) -> float:
+        """Returns the current epoch timestamp using a monotonic clock."""
+        return self._clock_offset + time.perf_counter()
+
+    def record(self, latency: float, success: bool) -> None:
+        """Records a request which received a response.
+        Args:
+            latency (float): Time taken for the response in milliseconds
+            success (bool): Whether the response had a successful status
+        """
+        self.complete_requests += 1
+        if not success:
+            self.failed_requests += 1
+        latency = round(latency * 1000)
+        self.histogram.record(latency)
+        self.window.record(latency)
+        self.window_requests += 1
+        if not success:
+            self.window_failures += 1
+        self.series.record(self.now(), latency, not success)
+
+    def record_failures(self, num_requests: int) -> None:
+        """Records requests which did not receive a response at all.
+        Args:
+            num_requests (int): Number of requests which failed
+        """
+        self.failed_requests += num_requests
+        self.window_requests += num_requests
+        self.window_failures += num_requests
+        self.series.record_failures(self.now(), num_requests)
+
+    def take_window(self) -> _t.Dict[str, _t.Any]:
+        """Returns the requests recorded since the last call and starts a
+        new window. The histogram is kept whole, rather than reduced to
+        percentiles, so the windows from each node can be merged exactly.
+        Returns:
+            dict: The latencies of the responses (`histogram`, in
+                microseconds), the requests (`requests`) and the failed
+                requests (`failed_requests`) in the window
+        """
+        window = {
+            'histogram': self.window.to_dict(),
+            'requests': self.window_requests,
+            'failed_requests': self.window_failures,
+        }
+        self.window = LatencyHistogram()
+        self.window_requests = 0
+        self.window_failures = 0
+        return window
+
+    @property
+    def duration(self) -> float:
+        """Wall clock duration of the run in seconds."""
+        if self.started_at is None or self.finished_at is None:
+            return 0
+        return self.finished_at - self.started_at
+
+    def as_dict(self) -> _t.Dict[str, _t.Any]:
+        """Returns the stats in the format expected by the controller.
+        Times are in milliseconds, the histogram is in microseconds and
+        `started_at` and `duration` are in seconds.
+        """
+        histogram = self.histogram
+        return {
+            'min_time': round((histogram.min or 0) / 1000),
+            'max_time': round((histogram.max or 0) / 1000),
+            'mean_time': round((histogram.mean or 0) / 1000),
+            'complete_requests': self.complete_requests,
+            'failed_requests': self.failed_requests,
+            'started_at': self.started_at,
+            'duration': self.duration,
+            'histogram': histogram.to_dict(),
+            'timeseries': self.series.to_dict(),
+        }
+
+
+class RequestCounter:
+    """Hands out the remaining requests to the workers."""
+
+    def __init__(self, num_requests: int):
+        self.remaining = num_requests
+
+    def claim(self, num_requests: int) -> int:
+        """Claims up to `num_requests` requests, returning the number claimed.
+        """
+        claimed = min(self.remaining, num_requests)
+        self.remaining -= claimed
+        return claimed
+
+    def release(self, num_requests: int) -> None:
+        """Returns unsent requests so that another worker can send them."""
+        self.remaining += num_requests
+
+
+async def _read_response(reader: asyncio.StreamReader) -> _t.Tuple[int, bool]:
+    """Reads a single HTTP response from the stream, discarding the body.
+    Args:
+        reader (asyncio.StreamReader): Stream to read from
+    Returns:
+        Tuple[int, bool]: Status code and whether the connection can be reused
+    """
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split(None, 2)[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        # Informational responses are followed by the real response.
+        if 100 <= status < 200:
+            continue
+        break
+
+    keep_alive = headers.get('connection') != 'close'
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            await _discard(reader, size + 2)
+    elif 'content-length' in headers:
+        await _discard(reader, int(headers['content-length']))
+    elif status not in (204, 304):
+        # No framing information, the body runs until the connection closes.
+        while await reader.read(READ_CHUNK_SIZE):
+            pass
+        keep_alive = False
+
+    return status, keep_alive
+
+
+async def _discard(reader: asyncio.StreamReader, num_bytes: int) -> None:
+    """Reads and discards exactly `num_bytes` bytes from the stream."""
+    while num_bytes > 0:
+        chunk = await reader.read(min(num_bytes, READ_CHUNK_SIZE))
+        if not chunk:
+            raise ConnectionError('Connection closed mid response')
+        num_bytes -= len(chunk)
+
+
+async def _worker(
+    target: Target,
+    counter: RequestCounter,
+    stats: LoadStats,
+    pipeline: int,
+    timeout: float,
+) -> None:
+    """Sends requests over a single persistent connection until there are no
+    requests left.
+    Args:
+        target (Target): Target to benchmark
+        counter (RequestCounter): Shared counter of requests left to send
+        stats (LoadStats): Stats to record the results into
+        pipeline (int): Number of requests to send before reading responses
+        timeout (float): Seconds to wait for a connection or response
+    """
+    reader = writer = None
+    while True:
+        batch = counter.claim(pipeline)
+        if not batch:
+            break
+
+        if writer is None:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(
+                        target.host,
+                        target.port,
+                        ssl=target.ssl_context()
+                    ),
+                    timeout
+                )
+            except (OSError, asyncio.TimeoutError):
+                stats.record_failures(batch)
+                continue
+
+        sent_at = time.perf_counter()
+        writer.write(target.request * batch)
+        for i in range(batch):
+            try:
+                status, keep_alive = await asyncio.wait_for(
+                    _read_response(reader),
+                    timeout
+                )
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError):
+                stats.record_failures(batch - i)
+                writer.close()
+                reader = writer = None
+                break
+
+            latency = (time.perf_counter() - sent_at) * 1000
+            stats.record(latency, status < 400)
+            if not keep_alive:
+                # Any requests pipelined behind this one will never be
+                # answered, so hand them back to be sent again.
+                counter.release(batch - i - 1)
+                writer.close()
+                reader = writer = None
+                break
+
+    if writer is not None:
+        writer.close()
+
+
+async def _report_metrics(
+    stats: LoadStats,
+    on_metrics: _t.Callable[[_t.Dict[str, _t.Any]], None],
+    interval: float,
+) -> None:
+    """Hands the live metrics of a run to a callback every interval until
+    cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        on_metrics(stats.take_window())
+
+
+async def run(
+    url: str,
+    num_requests: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    pipeline: int = DEFAULT_PIPELINE,
+    timeout: float = DEFAULT_TIMEOUT,
+    on_metrics: _t.Optional[
+        _t.Callable[[_t.Dict[str, _t.Any]], None]
+    ] = None,
+    metrics_interval: float = METRICS_INTERVAL,
+) -> LoadStats:
+    """Runs the benchmark against a URL.
+    Args:
+        url (str): URL to benchmark
+        num_requests (int): Total number of requests to send
+        concurrency (int): Number of connections to keep open at once
+        pipeline (int): Number of requests to pipeline on each connection
+        timeout (float): Seconds to wait for a connection or response
+        on_metrics (Callable): Called from the event loop every
+            `metrics_interval` seconds with the requests since the last call,
+            see `LoadStats.take_window`. It must not block.
+        metrics_interval (float): Seconds between each call of `on_metrics`
+    Returns:
+        LoadStats: Stats for the run
+    """
+    target = Target(url)
+    counter = RequestCounter(num_requests)
+    stats = LoadStats()
+    concurrency = max(1, min(concurrency, num_requests))
+
+    stats.started_at = stats.now()
+    stats.series.start = int(stats.started_at)
+    reporter = None
+    if on_metrics is not None:
+        reporter = asyncio.ensure_future(
+            _report_metrics(stats, on_metrics, metrics_interval)
+        )
+    try:
+        await asyncio.gather(*(
+            _worker(target, counter, stats, max(1, pipeline), timeout)
+            for _ in range(concurrency)
+        ))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    stats.finished_at = stats.now()
+    if on_metrics is not None:
+        # Report the tail of the run which fell after the last interval.
+        on_metrics(stats.take_window())
+    return stats
+
+
+def write_results(
+    stats: LoadStats,
+    results_fp: str = 'results.json',
+    summary_fp: _t.Optional[str] = 'results.txt',
+) -> None:
+    """Writes the results of a run to disk.
+
+    The JSON results are written last and moved into place atomically, so
+    the controller never reads a partially written file.
+
+    Args:
+        stats (LoadStats): Stats to write
+        results_fp (str): Path of the JSON results read by the controller
+        summary_fp (str): Path of a human readable summary
+    """
+    results = stats.as_dict()
+
+    if summary_fp is not None:
+        rps = stats.duration and stats.complete_requests / stats.duration
+        percentiles = (50, 90, 99, 99.9)
+        with open(summary_fp, 'w') as f:
+            f.write(
+                f'Time taken for tests:   {stats.duration:.3f} seconds\n'
+            )
+            f.write(
+                f'Complete requests:      {results["complete_requests"]}\n'
+            )
+            f.write(f'Failed requests:        {results["failed_requests"]}\n')
+            f.write(f'Requests per second:    {rps:.2f} [#/sec] (mean)\n')
+            f.write(
+                'Total:                  '
+                f'{results["min_time"]} {results["mean_time"]} '
+                f'{results["max_time"]} (min mean max, ms)\n'
+            )
+            f.write('\nPercentage of the requests served within a certain '
+                    'time (ms)\n')
+            for percentile in percentiles:
+                value = stats.histogram.percentile(percentile) or 0
+                f.write(f'  {percentile:>5}%  {value / 1000:.1f}\n')
+
+    tmp_fp = f'{results_fp}.tmp'
+    with open(tmp_fp, 'w') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_fp, results_fp)
+
+
+def parse_args(args: _t.Optional[_t.List[str]] = None) -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url', help='URL to benchmark')
+    parser.add_argument(
+        '-n', '--requests', type=int, default=1,
+        help='Number of requests to perform'
+    )
+    parser.add_argument(
+        '-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+        help='Number of connections to keep open at once'
+    )
+    parser.add_argument(
+        '-p', '--pipeline', type=int, default=DEFAULT_PIPELINE,
+        help='Number of requests to pipeline on each connection'
+    )
+    parser.add_argument(
+        '-t', '--timeout', type=float, default=DEFAULT_TIMEOUT,
+        help='Seconds to wait for a connection or response'
+    )
+    parser.add_argument(
+        '-o', '--output', default='results.json',
+        help='Path to write the JSON results to'
+    )
+    parser.add_argument(
+        '-s', '--summary', default='results.txt',
+        help='Path to write a human readable summary to'
+    )
+    return parser.parse_args(args)
+
+
+def main(args: _t.Optional[_t.List[str]] = None) -> int:
+    """Entry point when run as a script."""
+    args = parse_args(args)
+    if uvloop is not None:
+        uvloop.install()
+    stats = asyncio.run(run(
+        args.url,
+        args.requests,
+        args.concurrency,
+        args.pipeline,
+        args.timeout
+    ))
+    write_results(stats, args.output, args.summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
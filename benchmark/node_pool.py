@@ -0,0 +1,239 @@
+"""A pool of slave node instances which are kept warm between benchmarks.
+
+Launching and setting up a fresh instance takes minutes, so rather than
+terminating the instances once a benchmark is done they are returned to the
+pool and leased to the next benchmark. Idle instances are recycled once they
+have been idle for longer than the TTL and the pool is topped back up to its
+target size.
+
+The pool does not talk to AWS directly. Instead it is given a provider which
+exposes `create_instances(num_instances)` and `terminate_instances(instances)`
+in the same way as the `ec2` module. If the provider also exposes
+`instance_running(instance)` it is used to drop instances that have stopped
+running while they were idle, and if it exposes `launch_instances` and
+`setup_instance` then `lease_pipelined` hands back new instances as soon as
+they have launched so that each can be set up on its own.
+"""
+
+import typing as _t
+import os
+import threading
+import time
+
+
+NODE_POOL_SIZE = int(os.getenv('NODE_POOL_SIZE', 0))
+NODE_POOL_IDLE_TTL = int(os.getenv('NODE_POOL_IDLE_TTL', 30 * 60))
+NODE_POOL_MAINTAIN_INTERVAL = int(os.getenv('NODE_POOL_MAINTAIN_INTERVAL', 60))
+
+
+class NodePool:
+    """Keeps a number of idle, already set up instances ready to be leased.
+    """
+
+    def __init__(
+        self,
+        provider,
+        size: int = NODE_POOL_SIZE,
+        idle_ttl: float = NODE_POOL_IDLE_TTL,
+        clock: _t.Callable[[], float] = time.monotonic,
+    ):
+        """Creates a node pool.
+        Args:
+            provider: Object used to create and terminate instances
+            size (int): Number of idle instances to keep warm. A size of 0
+                means that every released instance is terminated.
+            idle_ttl (float): Seconds an instance can be idle before it is
+                recycled
+            clock (Callable[[], float]): Returns the current time in seconds
+        """
+        self.provider = provider
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+
+        # Idle instances along with the time they were returned to the pool,
+        # oldest first.
+        self._idle: _t.List[_t.Tuple[_t.Any, float]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: _t.Optional[threading.Thread] = None
+
+    def __len__(self):
+        """Returns the number of idle instances."""
+        return len(self._idle)
+
+    def idle_instances(self) -> _t.List:
+        """Returns the idle instances."""
+        with self._lock:
+            return [instance for instance, _ in self._idle]
+
+    def lease(self, num_instances: int) -> _t.List:
+        """Leases instances from the pool, creating new instances for any
+        shortfall.
+        Args:
+            num_instances (int): Number of instances needed
+        Returns:
+            list: List of instances
+        """
+        leased = self._lease_idle(num_instances)
+        missing = num_instances - len(leased)
+        if missing:
+            leased += list(self.provider.create_instances(
+                num_instances=missing
+            ))
+        return leased
+
+    def lease_pipelined(
+        self,
+        num_instances: int
+    ) -> _t.Tuple[_t.List, _t.List]:
+        """Leases instances from the pool, launching new instances for any
+        shortfall without waiting for them to be set up.
+        Args:
+            num_instances (int): Number of instances needed
+        Returns:
+            tuple: The instances which are ready to use, and the instances
+                which still need to be passed to `provider.setup_instance`
+        """
+        leased = self._lease_idle(num_instances)
+        missing = num_instances - len(leased)
+        if not missing:
+            return leased, []
+        launch_instances = getattr(self.provider, 'launch_instances', None)
+        if launch_instances is None:
+            leased += list(self.provider.create_instances(
+                num_instances=missing
+            ))
+            return leased, []
+        return leased, list(launch_instances(num_instances=missing))
+
+    def _lease_idle(self, num_instances: int) -> _t.List:
+        """Leases up to `num_instances` of the idle instances."""
+        leased = []
+        while len(leased) < num_instances:
+            with self._lock:
+                if not self._idle:
+                    break
+                # Lease the most recently used instances first so that the
+                # older ones are left to expire.
+                instance, _ = self._idle.pop()
+            if self._is_running(instance):
+                leased.append(instance)
+            else:
+                self._terminate([instance])
+        return leased
+
+    def release(self, instances: _t.List) -> None:
+        """Returns instances to the pool. Any instances beyond the pool size
+        are terminated.
+        Args:
+            instances (list): Instances to return
+        """
+        now = self.clock()
+        with self._lock:
+            self._idle += [(instance, now) for instance in instances]
+            surplus = len(self._idle) - self.size
+            expired = []
+            if surplus > 0:
+                expired = [instance for instance, _ in self._idle[:surplus]]
+                self._idle = self._idle[surplus:]
+        self._terminate(expired)
+
+    def discard(self, instances: _t.List) -> None:
+        """Terminates leased instances which cannot be used again, rather
+        than returning them to the pool.
+        Args:
+            instances (list): Instances to terminate
+        """
+        self._terminate(instances)
+
+    def reap(self) -> _t.List:
+        """Terminates instances which have been idle for longer than the TTL.
+        Returns:
+            list: The instances terminated
+        """
+        cutoff = self.clock() - self.idle_ttl
+        with self._lock:
+            expired = [
+                instance for instance, idle_since in self._idle
+                if idle_since <= cutoff
+            ]
+            self._idle = [
+                (instance, idle_since)
+                for instance, idle_since in self._idle
+                if idle_since > cutoff
+            ]
+        self._terminate(expired)
+        return expired
+
+    def replenish(self) -> _t.List:
+        """Creates instances until the pool is back to its target size.
+        Returns:
+            list: The instances created
+        """
+        with self._lock:
+            missing = self.size - len(self._idle)
+        if missing <= 0:
+            return []
+        instances = list(self.provider.create_instances(
+            num_instances=missing
+        ))
+        now = self.clock()
+        with self._lock:
+            self._idle += [(instance, now) for instance in instances]
+        return instances
+
+    def maintain(self) -> None:
+        """Recycles expired instances and tops the pool back up."""
+        self.reap()
+        self.replenish()
+
+    def drain(self) -> None:
+        """Terminates every idle instance."""
+        with self._lock:
+            instances = [instance for instance, _ in self._idle]
+            self._idle = []
+        self._terminate(instances)
+
+    def start(self, interval: float = NODE_POOL_MAINTAIN_INTERVAL) -> None:
+        """Starts maintaining the pool in a background thread.
+        Args:
+            interval (float): Seconds between each maintenance run
+        """
+        if self._thread is not None or not self.size:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._maintain_forever,
+            args=(interval,),
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background maintenance thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _maintain_forever(self, interval: float) -> None:
+        """Maintains the pool until stopped."""
+        while not self._stop.is_set():
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f'\033[91mFailed to maintain node pool: {e}\033[0m')
+            self._stop.wait(interval)
+
+    def _is_running(self, instance) -> bool:
+        """Checks with the provider that an idle instance is still usable."""
+        instance_running = getattr(self.provider, 'instance_running', None)
+        if instance_running is None:
+            return True
+        return instance_running(instance)
+
+    def _terminate(self, instances: _t.List) -> None:
+        """Terminates instances through the provider."""
+        if instances:
+            self.provider.terminate_instances(instances)
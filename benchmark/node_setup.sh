@@ -0,0 +1,32 @@
+#!/usr/bin/bash
+
+# Script to install what a node needs to run the agent onto a server over SSH:
+# Python and the agent files. This is run once when building a node image, or
+# on every node launched from a plain image. Try this every 5 seconds until 30
+# seconds at which point it will exit.
+host=$1
+shift
+agent_files="$@"
+
+host_user=ubuntu
+
+wait_time=0
+while [ $wait_time -lt 30 ]; do
+  sleep 5
+  wait_time=$((wait_time + 5))
+
+  commands='sudo apt update;'
+  commands+='sudo apt upgrade -y;'
+  commands+='sudo apt update;'
+  commands+='sudo apt install -y python3;'
+
+  ssh-keyscan -T 10 $host >> ~/.ssh/known_hosts
+  ssh -o "StrictHostKeyChecking no" $host_user@$host "$commands"
+
+  if [ $? -eq 0 ]; then
+    break
+  fi
+  echo -e '\033[91mFailed to setup server, trying in 5 seconds...\033[0m'
+done
+
+scp -o "StrictHostKeyChecking no" $agent_files $host_user@$host:~/.
@@ -0,0 +1,539 @@
+"""Providers which create the slave nodes used to run a benchmark.
+
+A provider is responsible for the life cycle of a node: creating it, starting
+the agent on it and terminating it. The provider to use is picked with the
+`NODE_PROVIDER` environment variable:
+
+    ec2     Launches EC2 instances (default).
+    local   Runs the agents as subprocesses on this machine.
+    docker  Runs the agents inside local Docker containers.
+
+Once a node's agent has connected to the controller's control server, jobs
+and results go over the control channel whatever the provider. The local
+providers make it possible to run the whole pipeline, including horizontally
+scaled benchmarks, on a single machine without AWS.
+"""
+
+import typing as _t
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+try:
+    from . import control_channel
+except ImportError:
+    import control_channel
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'results')
+
+NODE_PROVIDER = os.getenv('NODE_PROVIDER', 'ec2')
+
+# Files which need to be on a node to run the agent.
+AGENT_FILES = [
+    os.path.join(BASE_DIR, 'agent.py'),
+    os.path.join(BASE_DIR, 'control_channel.py'),
+    os.path.join(BASE_DIR, 'load_generator.py'),
+    os.path.join(BASE_DIR, 'histogram.py'),
+    os.path.join(BASE_DIR, 'timeseries.py'),
+]
+
+
+def results_path(host: str) -> str:
+    """Returns the path the results for a host are fetched to.
+    Args:
+        host (str): Host of the node
+    Returns:
+        str: Path of the results file
+    """
+    return os.path.join(RESULTS_DIR, f'{host}.json')
+
+
+class NodeProvider:
+    """Interface for the providers of slave nodes.
+
+    Implementation:
+        * `create_instances` creates the nodes and starts an agent on each,
+        which connects to `control_server` with `host(instance)` as its ID.
+        * `terminate_instances` terminates the nodes.
+        * `launch_instances` and `setup_instance` can be overridden when
+        creating a node is slow, so that each node can be set up as soon as
+        it has launched rather than waiting for the slowest.
+    """
+
+    def __init__(
+        self,
+        control_server: _t.Optional[control_channel.ControlServer] = None,
+    ):
+        """Creates a provider.
+        Args:
+            control_server (ControlServer): Server the agents connect to.
+                Defaults to the controller's shared server.
+        """
+        self._control_server = control_server
+
+    @property
+    def control_server(self) -> control_channel.ControlServer:
+        """The server the agents connect to, started on first use."""
+        if self._control_server is None:
+            self._control_server = control_channel.get_server()
+        return self._control_server
+
+    def create_instances(self, num_instances: int = 1) -> _t.List:
+        """Creates nodes.
+        Args:
+            num_instances (int): Number of nodes to create
+        Returns:
+            list: List of instances
+        """
+        raise NotImplementedError(
+            'The `create_instances` method must be implemented.'
+        )
+
+    def launch_instances(self, num_instances: int = 1) -> _t.List:
+        """Starts creating nodes, leaving each to be finished by
+        `setup_instance`. By default the nodes are created in full.
+        Args:
+            num_instances (int): Number of nodes to create
+        Returns:
+            list: List of instances
+        """
+        return self.create_instances(num_instances=num_instances)
+
+    def setup_instance(self, instance) -> None:
+        """Finishes creating a node started by `launch_instances`.
+        Args:
+            instance: Instance to set up
+        """
+
+    def terminate_instances(self, instances: _t.List) -> None:
+        """Terminates nodes.
+        Args:
+            instances (list): Instances to terminate
+        """
+        raise NotImplementedError(
+            'The `terminate_instances` method must be implemented.'
+        )
+
+    def instance_running(self, instance) -> bool:
+        """Returns True if the instance can still be used."""
+        return True
+
+    def host(self, instance) -> str:
+        """Returns a host name which is unique to the instance."""
+        return instance.public_ip_address
+
+    def agent(self, instance) -> control_channel.AgentConnection:
+        """Returns the connection to an instance's agent."""
+        return self.control_server.agent(self.host(instance))
+
+    def agent_connected(self, instance) -> bool:
+        """Returns True if an instance's agent is connected, without waiting
+        for it.
+        """
+        try:
+            return self.control_server.agent(self.host(instance), 0).connected
+        except TimeoutError:
+            return False
+
+    def round_trip_time(self, instance) -> float:
+        """Returns the round trip time to an instance's agent measured when
+        it connected, or 0 if it is not connected.
+        """
+        try:
+            return self.control_server.agent(self.host(instance), 0).rtt
+        except TimeoutError:
+            return 0
+
+    def wait_until_ready(self, instances: _t.List) -> None:
+        """Waits for the agent on each instance to connect and measures how
+        far its clock is from the controller's clock.
+        Raises:
+            TimeoutError: An agent did not connect or did not answer the
+                pings measuring its clock.
+        """
+        agents = control_channel.wait_for_agents(
+            self.control_server,
+            [self.host(instance) for instance in instances]
+        )
+        control_channel.measure_clock_offsets(agents)
+
+    def schedule_benchmark(
+        self,
+        instance,
+        ts: datetime,
+        num_requests: int,
+        url: str,
+        concurrency: _t.Optional[int] = None,
+        pipeline: _t.Optional[int] = None,
+    ) -> int:
+        """Schedules a benchmark on a node.
+        Args:
+            instance: Instance to run the benchmark on
+            ts (datetime): Time to start the benchmark by the controller's
+                clock. The agent corrects it for its own clock.
+            num_requests (int): Number of requests to run
+            url (str): URL to benchmark
+            concurrency (int): Number of concurrent connections to use
+            pipeline (int): Number of requests to pipeline per connection
+        Returns:
+            int: ID of the job
+        """
+        # Remove the results of any previous benchmark in case the node was
+        # reused.
+        fp = results_path(self.host(instance))
+        if os.path.exists(fp):
+            os.remove(fp)
+        return self.agent(instance).send_job(
+            ts.timestamp(),
+            num_requests,
+            url,
+            concurrency,
+            pipeline
+        )
+
+    def fetch_results(
+        self,
+        instance,
+        job_id: _t.Optional[int] = None,
+        timeout: float = 0,
+    ) -> int:
+        """Waits for the results of a benchmark to arrive from a node's agent
+        and writes them to `results_path`.
+
+        The results are pushed by the agent as soon as its run finishes. If
+        the agent disconnects in the meantime, it sends them again once it
+        has reconnected, so this keeps waiting until the timeout. A job which
+        failed on the node returns straight away.
+
+        Args:
+            instance: Instance to fetch the results from
+            job_id (int): ID of the job. Defaults to the last job sent.
+            timeout (float): Seconds to wait for the results to arrive
+        Returns:
+            int: 0 if the results were fetched, otherwise non-zero
+        """
+        deadline = time.monotonic() + timeout
+        results = None
+        while results is None:
+            remaining = max(0, deadline - time.monotonic())
+            try:
+                agent = self.control_server.agent(
+                    self.host(instance),
+                    remaining
+                )
+            except TimeoutError:
+                return 1
+            results = agent.result(job_id, remaining)
+            if results is None and (agent.connected or not remaining):
+                return 1
+
+        return self.write_results(instance, results)
+
+    async def fetch_results_async(
+        self,
+        instance,
+        job_id: _t.Optional[int] = None,
+        timeout: float = 0,
+    ) -> int:
+        """Waits for the results of a benchmark from an event loop, see
+        `fetch_results`. No thread is tied up while the benchmark runs, only
+        while waiting for a disconnected agent to reconnect.
+        Args:
+            instance: Instance to fetch the results from
+            job_id (int): ID of the job. Defaults to the last job sent.
+            timeout (float): Seconds to wait for the results to arrive
+        Returns:
+            int: 0 if the results were fetched, otherwise non-zero
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        results = None
+        while results is None:
+            remaining = max(0, deadline - loop.time())
+            try:
+                agent = self.control_server.agent(self.host(instance), 0)
+            except TimeoutError:
+                try:
+                    agent = await asyncio.to_thread(
+                        self.control_server.agent,
+                        self.host(instance),
+                        remaining
+                    )
+                except TimeoutError:
+                    return 1
+            results = await agent.wait_result(job_id, remaining)
+            if results is None and (agent.connected or not remaining):
+                return 1
+
+        return self.write_results(instance, results)
+
+    def take_metrics(
+        self,
+        instance,
+        job_id: _t.Optional[int],
+    ) -> _t.List[_t.Dict[str, _t.Any]]:
+        """Returns the live metrics a node's agent has sent for a job since
+        the last call. Does not wait for the agent if it is not connected.
+        Args:
+            instance: Instance running the job
+            job_id (int): ID of the job
+        Returns:
+            List[dict]: The metrics, see `LoadStats.take_window`
+        """
+        if job_id is None:
+            return []
+        try:
+            agent = self.control_server.agent(self.host(instance), 0)
+        except TimeoutError:
+            return []
+        return agent.take_metrics(job_id)
+
+    def write_results(self, instance, results: _t.Dict[str, _t.Any]) -> int:
+        """Writes the results of a node to `results_path`.
+        Returns:
+            int: 0 if the results were written, non-zero if the job failed
+        """
+        if 'error' in results:
+            print(
+                f'\033[91mBenchmark failed on {self.host(instance)}: '
+                f'{results["error"]}\033[0m'
+            )
+            return 1
+        fp = results_path(self.host(instance))
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        with open(fp, 'w') as f:
+            json.dump(results, f)
+        return 0
+
+
+class EC2Provider(NodeProvider):
+    """Runs the agents on EC2 instances. The agent is copied onto each
+    instance and started by `server_setup.sh` when the instance is set up.
+    """
+
+    @property
+    def ec2(self):
+        """The `ec2` module, imported on first use as importing it connects
+        to AWS.
+        """
+        try:
+            from . import ec2
+        except ImportError:
+            import ec2
+        return ec2
+
+    def create_instances(self, num_instances: int = 1) -> _t.List:
+        # The agents connect to the control server as soon as they start.
+        self.control_server.start()
+        return self.ec2.create_instances(num_instances=num_instances)
+
+    def launch_instances(self, num_instances: int = 1) -> _t.List:
+        self.control_server.start()
+        return self.ec2.launch_instances(num_instances=num_instances)
+
+    def setup_instance(self, instance) -> None:
+        self.ec2.setup_instance(instance)
+
+    def terminate_instances(self, instances: _t.List) -> None:
+        self.ec2.terminate_instances(instances)
+
+    def instance_running(self, instance) -> bool:
+        return self.ec2.instance_running(instance)
+
+
+class LocalInstance:
+    """A node whose agent runs as a local subprocess."""
+
+    def __init__(self):
+        self.id = f'local-{uuid.uuid4().hex[:12]}'
+        self.public_ip_address = self.id
+        self.work_dir = tempfile.mkdtemp(prefix='cloud-swarm-node-')
+        self.process: _t.Optional[subprocess.Popen] = None
+
+
+class LocalProcessProvider(NodeProvider):
+    """Runs each node's agent as a subprocess on this machine."""
+
+    def create_instances(self, num_instances: int = 1) -> _t.List:
+        instances = []
+        for _ in range(num_instances):
+            instance = LocalInstance()
+            instance.process = subprocess.Popen(
+                [sys.executable, AGENT_FILES[0]],
+                cwd=instance.work_dir,
+                env={
+                    **os.environ,
+                    'CONTROL_CHANNEL_ADDRESS': self.control_server.address,
+                    'AGENT_ID': instance.id,
+                    'AGENT_TOKEN': control_channel.agent_token(
+                        instance.id,
+                        self.control_server.secret
+                    ),
+                },
+                stdout=subprocess.DEVNULL,
+            )
+            instances.append(instance)
+        return instances
+
+    def terminate_instances(self, instances: _t.List) -> None:
+        for instance in instances:
+            process = instance.process
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            shutil.rmtree(instance.work_dir, ignore_errors=True)
+
+    def instance_running(self, instance) -> bool:
+        return instance.process.poll() is None
+
+
+class DockerInstance:
+    """A node whose agent runs inside a Docker container."""
+
+    def __init__(self, container: str):
+        self.id = container
+        self.public_ip_address = container
+
+
+class DockerProvider(NodeProvider):
+    """Runs each node's agent in its own local Docker container."""
+
+    NODE_DIR = '/node'
+
+    def __init__(
+        self,
+        control_server: _t.Optional[control_channel.ControlServer] = None,
+        image: _t.Optional[str] = os.getenv('DOCKER_NODE_IMAGE'),
+        network: _t.Optional[str] = os.getenv('DOCKER_NODE_NETWORK'),
+        controller_address: _t.Optional[str] = os.getenv(
+            'DOCKER_CONTROL_CHANNEL_ADDRESS'
+        ),
+    ):
+        """Creates a Docker provider.
+        Args:
+            control_server (ControlServer): Server the agents connect to
+            image (str): Image with Python 3 installed to run the nodes from.
+                Defaults to the node image built by `image_builder` if it is
+                up to date, otherwise `python:3.9-slim`.
+            network (str): Docker network to attach the containers to
+            controller_address (str): `host:port` the containers reach the
+                control server on. Defaults to the Docker host.
+        """
+        super().__init__(control_server)
+        self.image = image
+        self.network = network
+        self.controller_address = controller_address
+
+    def node_image(self) -> _t.Tuple[str, bool]:
+        """Returns the image to run the nodes from, and whether the agent is
+        already installed in it.
+        """
+        try:
+            from . import image_builder
+        except ImportError:
+            import image_builder
+        tag = image_builder.docker_tag()
+        if self.image is None:
+            if image_builder.docker_image_exists(tag):
+                return tag, True
+            return image_builder.DOCKER_BASE_IMAGE, False
+        return self.image, self.image == tag
+
+    def create_instances(self, num_instances: int = 1) -> _t.List:
+        controller_address = self.controller_address or (
+            f'host.docker.internal:{self.control_server.port}'
+        )
+        image, prebaked = self.node_image()
+        instances = []
+        for _ in range(num_instances):
+            name = f'cloud-swarm-node-{uuid.uuid4().hex[:12]}'
+            token = control_channel.agent_token(
+                name,
+                self.control_server.secret
+            )
+            args = [
+                'docker', 'create', '--rm', '--name', name,
+                '--add-host', 'host.docker.internal:host-gateway',
+                '-w', self.NODE_DIR,
+                '-e', f'CONTROL_CHANNEL_ADDRESS={controller_address}',
+                '-e', f'AGENT_ID={name}',
+                # Taken from the environment so the token is not in the
+                # command line.
+                '-e', 'AGENT_TOKEN',
+            ]
+            if self.network:
+                args += ['--network', self.network]
+            subprocess.run(
+                args + [image, 'python3', 'agent.py'],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                env={**os.environ, 'AGENT_TOKEN': token},
+            )
+            if not prebaked:
+                self._copy_agent(name)
+            subprocess.run(
+                ['docker', 'start', name],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            instances.append(DockerInstance(name))
+        return instances
+
+    def _copy_agent(self, container: str) -> None:
+        """Copies the agent files into a container."""
+        with tempfile.TemporaryDirectory() as node_dir:
+            for fp in AGENT_FILES:
+                shutil.copy(fp, node_dir)
+            subprocess.run(
+                [
+                    'docker', 'cp',
+                    f'{node_dir}/.',
+                    f'{container}:{self.NODE_DIR}',
+                ],
+                check=True,
+            )
+
+    def terminate_instances(self, instances: _t.List) -> None:
+        if instances:
+            subprocess.call(
+                ['docker', 'rm', '-f', *[i.id for i in instances]],
+                stdout=subprocess.DEVNULL,
+            )
+
+    def instance_running(self, instance) -> bool:
+        return subprocess.call(
+            ['docker', 'inspect', instance.id],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) == 0
+
+
+PROVIDERS = {
+    'ec2': EC2Provider,
+    'local': LocalProcessProvider,
+    'docker': DockerProvider,
+}
+
+
+def get_provider(name: str = NODE_PROVIDER) -> NodeProvider:
+    """Returns the provider registered under a name.
+    Args:
+        name (str): Name of the provider
+    Returns:
+        NodeProvider: The provider
+    """
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(
+            f'Unknown node provider: {name}. Choose from '
+            f'{", ".join(PROVIDERS)}.'
+        )
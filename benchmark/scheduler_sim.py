@@ -0,0 +1,176 @@
+"""Simulates the job queue schedulers on a synthetic workload.
+
+The benchmarks are admitted by the real `job_queue.Queue`, running against
+fakeredis with a simulated clock, so the numbers reflect the Lua scripts the
+controller uses. Each benchmark's estimated runtime is its actual runtime
+with noise added, as the estimates made from previous benchmarks are never
+exact.
+
+Usage:
+    python scheduler_sim.py --jobs 500 --seed 1
+"""
+
+import typing as _t
+import argparse
+import heapq
+import random
+import fakeredis
+import job_queue
+
+
+class Job:
+    """A benchmark in the synthetic workload."""
+
+    def __init__(
+        self,
+        benchmark_id: int,
+        arrival: float,
+        num_nodes: int,
+        runtime: float,
+        estimated_runtime: float,
+    ):
+        self.benchmark_id = benchmark_id
+        self.arrival = arrival
+        self.num_nodes = num_nodes
+        self.runtime = runtime
+        self.estimated_runtime = estimated_runtime
+        self.start: _t.Optional[float] = None
+
+    @property
+    def wait(self) -> float:
+        """Seconds the job waited in the queue."""
+        return self.start - self.arrival
+
+
+def workload(
+    num_jobs: int,
+    max_nodes: int,
+    mean_interarrival: float,
+    seed: int,
+) -> _t.List[Job]:
+    """Generates a synthetic workload. Most benchmarks are small, with the
+    occasional benchmark which needs every node.
+    Args:
+        num_jobs (int): Number of benchmarks
+        max_nodes (int): Number of nodes in the cluster
+        mean_interarrival (float): Mean seconds between submissions
+        seed (int): Seed for the random number generator
+    Returns:
+        List[Job]: The benchmarks in order of arrival
+    """
+    rng = random.Random(seed)
+    jobs = []
+    arrival = 0.0
+    for i in range(num_jobs):
+        arrival += rng.expovariate(1 / mean_interarrival)
+        num_nodes = rng.choices(
+            [1, 2, 4, 8, max_nodes // 2, max_nodes],
+            weights=[30, 25, 20, 12, 8, 5]
+        )[0]
+        runtime = rng.lognormvariate(4.8, 0.6)
+        jobs.append(Job(
+            i + 1,
+            arrival,
+            num_nodes,
+            runtime,
+            runtime * rng.uniform(0.7, 1.5)
+        ))
+    return jobs
+
+
+def simulate(
+    jobs: _t.List[Job],
+    max_nodes: int,
+    scheduler: str,
+) -> _t.Dict[str, float]:
+    """Runs a workload through the queue.
+    Args:
+        jobs (List[Job]): The benchmarks
+        max_nodes (int): Number of nodes in the cluster
+        scheduler (str): Scheduler to use
+    Returns:
+        Dict[str, float]: Summary statistics
+    """
+    queue = job_queue.Queue(
+        max_nodes=max_nodes,
+        connection=fakeredis.FakeRedis(),
+        scheduler=scheduler,
+        # The simulated benchmarks do not renew their leases.
+        lease_ttl=10 ** 9,
+    )
+    by_id = {job.benchmark_id: job for job in jobs}
+    for job in jobs:
+        job.start = None
+
+    # Events are (time, order, kind, job) where completions are handled
+    # before arrivals at the same instant.
+    events = [(job.arrival, 1, 'arrival', job) for job in jobs]
+    heapq.heapify(events)
+    while events:
+        now = events[0][0]
+        while events and events[0][0] == now:
+            _, _, kind, job = heapq.heappop(events)
+            if kind == 'arrival':
+                queue.push(
+                    job.benchmark_id,
+                    'https://example.com',
+                    job.num_nodes,
+                    100,
+                    job.estimated_runtime
+                )
+            else:
+                queue.release(job.benchmark_id)
+
+        while True:
+            admitted = queue.admit(now=now)
+            if admitted is None:
+                break
+            job = by_id[admitted['benchmark_id']]
+            job.start = now
+            heapq.heappush(events, (now + job.runtime, 0, 'done', job))
+
+    waits = sorted(job.wait for job in jobs)
+    makespan = max(job.start + job.runtime for job in jobs)
+    large = [job.wait for job in jobs if job.num_nodes == max_nodes]
+    busy = sum(job.num_nodes * job.runtime for job in jobs)
+    return {
+        'mean_wait': sum(waits) / len(waits),
+        'p95_wait': waits[int(len(waits) * 0.95) - 1],
+        'max_wait': waits[-1],
+        'mean_wait_full_cluster': sum(large) / len(large) if large else 0,
+        'makespan': makespan,
+        'utilisation': busy / (max_nodes * makespan),
+        'throughput': len(jobs) / makespan * 3600,
+    }
+
+
+def main(args: _t.Optional[_t.List[str]] = None) -> None:
+    """Entry point when run as a script."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=job_queue.MAX_NODES)
+    parser.add_argument('--interarrival', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(args)
+
+    jobs = workload(args.jobs, args.nodes, args.interarrival, args.seed)
+    print(
+        f'{"Scheduler":<10}{"Mean wait":>11}{"P95 wait":>10}{"Max wait":>10}'
+        f'{"Full wait":>11}{"Makespan":>10}{"Util":>7}{"Jobs/h":>8}'
+    )
+    for scheduler in ('fifo', 'backfill'):
+        stats = simulate(jobs, args.nodes, scheduler)
+        print(
+            f'{scheduler:<10}'
+            f'{stats["mean_wait"]:>10.0f}s'
+            f'{stats["p95_wait"]:>9.0f}s'
+            f'{stats["max_wait"]:>9.0f}s'
+            f'{stats["mean_wait_full_cluster"]:>10.0f}s'
+            f'{stats["makespan"]:>9.0f}s'
+            f'{stats["utilisation"]:>7.0%}'
+            f'{stats["throughput"]:>8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
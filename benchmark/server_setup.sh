@@ -1,23 +1,37 @@
 #!/usr/bin/bash
 
-# Script to ssh into a server, and setup the server for benchmarking. Try
-# this every 5 seconds until 30 seconds at which point it will exit.
+# Script to setup a server for benchmarking and start the agent which connects
+# back to the controller. Servers launched from a node image which already has
+# the agent installed are passed `prebaked` and only have the agent started.
+# The agent's token is taken from the AGENT_TOKEN environment variable, so it
+# does not show in the arguments of any process.
+host=$1
+controller_address=$2
+prebaked=$3
 
-wait_time=0
-while [ $wait_time -lt 30 ]; do
-  sleep 5
-  wait_time=$((wait_time + 5))
+host_user=ubuntu
+base_dir=$(dirname $BASH_SOURCE[0])
+agent_files="${base_dir}/agent.py ${base_dir}/control_channel.py"
+agent_files+=" ${base_dir}/load_generator.py ${base_dir}/histogram.py"
+agent_files+=" ${base_dir}/timeseries.py"
 
-  commands='sudo apt update'
-  commands+='sudo apt upgrade -y;'
-  commands+='sudo apt update;'
-  commands+='sudo apt install -y apache2;'
+if [ "$prebaked" = "prebaked" ]; then
+  # The server is reachable as soon as SSH is up, so wait for that alone.
+  wait_time=0
+  until ssh-keyscan -T 5 $host >> ~/.ssh/known_hosts 2> /dev/null; do
+    if [ $wait_time -ge 60 ]; then
+      break
+    fi
+    sleep 1
+    wait_time=$((wait_time + 1))
+  done
+else
+  bash "${base_dir}/node_setup.sh" $host $agent_files
+fi
 
-  ssh-keyscan -T 10 $1 >> ~/.ssh/known_hosts
-  ssh -o "StrictHostKeyChecking no" ubuntu@$1 "$commands"
-
-  if [ $? -eq 0 ]; then
-    break
-  fi
-  echo -e '\033[91mFailed to setup server, trying in 5 seconds...\033[0m'
-done
+# Start the agent in the background. From here on the controller talks to the
+# node over the agent's connection. The token is written to a file only the
+# node's user can read, from the SSH connection's input.
+ssh -o "StrictHostKeyChecking no" $host_user@$host \
+  "umask 077 && cat > agent.token && nohup python3 agent.py --controller ${controller_address} --id ${host} --token-file agent.token > agent.log 2>&1 < /dev/null &" \
+  <<< "$AGENT_TOKEN"
@@ -1,27 +1,334 @@
-"""Contains functions to communicate with the site API."""
+"""Contains functions to communicate with the site API.
 
+Messages are sent through a single `SiteAPIClient`, which keeps its
+connections to the site alive between messages and retries failed requests
+with a backoff. Messages which still cannot be delivered because the site is
+unreachable are written to an outbox on disk and sent again, in order, once
+the site is reachable. Messages the site rejects, and messages which have
+been tried from the outbox `MAX_OUTBOX_ATTEMPTS` times, are moved to a dead
+letter directory instead so they cannot hold up the messages behind them.
+
+Progress updates are not sent straight away. They are held for up to
+`BATCH_INTERVAL` seconds and sent together in one request, keeping only the
+latest status of each benchmark. Results are sent in the same batch, after
+any progress waiting to be sent. Events for benchmarks which the site cannot
+see yet are deferred by the site, so they do not need to be sent again.
+"""
+
+import typing as _t
+import atexit
+import json
 import os
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from jwt_utils import create_jwt
 
 API_DOMAIN = os.getenv('INTERNAL_API_DOMAIN', 'http://localhost:8000')
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_DIR = os.getenv('SITE_API_OUTBOX', os.path.join(BASE_DIR, 'outbox'))
+DEAD_LETTER_DIR = os.getenv(
+    'SITE_API_DEAD_LETTER',
+    os.path.join(BASE_DIR, 'dead_letter')
+)
+
+# Seconds to wait to connect to the site and for its response.
+TIMEOUT = (5, 30)
+# Number of times to retry a request which failed before it is moved to the
+# outbox.
+MAX_RETRIES = 3
+# Number of times a message in the outbox is sent before it is moved to the
+# dead letter directory.
+MAX_OUTBOX_ATTEMPTS = int(os.getenv('SITE_API_MAX_OUTBOX_ATTEMPTS', 20))
+# Response statuses which mean the site may accept the message later. These
+# and any other server error are retried, then sent from the outbox, while any
+# other client error means the site will never accept the message.
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+# Seconds progress updates are held for to be sent together.
+BATCH_INTERVAL = float(os.getenv('SITE_API_BATCH_INTERVAL', 0.5))
+
+
+class MessageRejected(Exception):
+    """The site rejected a message and will not accept it if sent again."""
+
+
+class SiteAPIClient:
+    """Client for the site's internal API."""
+
+    def __init__(
+        self,
+        domain: str = API_DOMAIN,
+        outbox_dir: str = OUTBOX_DIR,
+        dead_letter_dir: str = DEAD_LETTER_DIR,
+        batch_interval: float = BATCH_INTERVAL,
+        max_retries: int = MAX_RETRIES,
+        backoff_factor: float = 0.5,
+        max_outbox_attempts: int = MAX_OUTBOX_ATTEMPTS,
+    ):
+        """Creates a client.
+        Args:
+            domain (str): Domain the site's API is served on
+            outbox_dir (str): Directory to keep undelivered messages in
+            dead_letter_dir (str): Directory to keep messages which will not
+                be sent again in
+            batch_interval (float): Seconds to hold progress updates for
+            max_retries (int): Number of times to retry a failed request
+            backoff_factor (float): Factor of the exponential backoff between
+                retries
+            max_outbox_attempts (int): Number of times to send a message in
+                the outbox before giving up on it
+        """
+        self.domain = domain
+        self.outbox_dir = outbox_dir
+        self.dead_letter_dir = dead_letter_dir
+        self.batch_interval = batch_interval
+        self.max_outbox_attempts = max_outbox_attempts
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=TRANSIENT_STATUSES,
+            allowed_methods=['POST'],
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+
+        # Latest status of each benchmark waiting to be sent.
+        self._progress: _t.Dict[int, int] = {}
+        # Results waiting to be sent, by benchmark ID.
+        self._results: _t.Dict[int, _t.Dict[str, _t.Any]] = {}
+        self._timer: _t.Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Keeps the messages going out in the order they were sent.
+        self._send_lock = threading.RLock()
+
+    def post(self, path: str, payload: _t.Dict[str, _t.Any]) -> bool:
+        """Sends a message to the site, moving it to the outbox if the site
+        cannot be reached and to the dead letter directory if it is rejected.
+        Args:
+            path (str): Path of the endpoint
+            payload (Dict[str, Any]): Message to send
+        Returns:
+            bool: True if the message was delivered
+        """
+        return self._send(path, payload) is not None
+
+    def queue_progress(self, benchmark_id: int, status: int) -> None:
+        """Queues a progress update to be sent with the next batch.
+        Args:
+            benchmark_id (int): ID of the benchmark
+            status (int): The progress of the benchmark
+        """
+        with self._lock:
+            self._progress[benchmark_id] = status
+            self._schedule_flush()
+
+    def queue_results(self, payload: _t.Dict[str, _t.Any]) -> None:
+        """Queues the results of a benchmark to be sent with the next batch.
+        Args:
+            payload (Dict[str, Any]): Results in the format of the
+                `benchmark_results` endpoint
+        """
+        with self._lock:
+            self._results[payload['benchmark_id']] = payload
+            self._schedule_flush()
+
+    def flush(self) -> None:
+        """Sends the queued events in one batch."""
+        with self._send_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                progress, self._progress = self._progress, {}
+                results, self._results = self._results, {}
+            if progress or results:
+                self.post('/internal-api/benchmark-batch/', {
+                    'progress': [
+                        {'benchmark_id': benchmark_id, 'status': status}
+                        for benchmark_id, status in progress.items()
+                    ],
+                    'results': list(results.values()),
+                })
+
+    def flush_outbox(self) -> bool:
+        """Sends the undelivered messages in the order they were sent.
+
+        Stops at the first message the site cannot be reached for, unless it
+        has been tried `max_outbox_attempts` times, in which case it is moved
+        to the dead letter directory along with any message the site rejects.
+        Returns:
+            bool: True if the outbox is now empty
+        """
+        with self._send_lock:
+            for fp in self._outbox():
+                try:
+                    with open(fp) as f:
+                        message = json.load(f)
+                except (OSError, ValueError):
+                    # A message which was not written in full is of no use.
+                    os.remove(fp)
+                    continue
+                try:
+                    response = self._post(message['path'], message['payload'])
+                except MessageRejected as e:
+                    self._write_dead_letter(message, str(e))
+                    os.remove(fp)
+                    continue
+                if response is None:
+                    message['attempts'] = message.get('attempts', 0) + 1
+                    if message['attempts'] < self.max_outbox_attempts:
+                        self._write_message(fp, message)
+                        return False
+                    self._write_dead_letter(
+                        message,
+                        f'Not delivered after {message["attempts"]} attempts'
+                    )
+                os.remove(fp)
+            return True
+
+    def _schedule_flush(self) -> None:
+        """Schedules the queued events to be sent. Must be called with the
+        lock held.
+        """
+        if self._timer is None:
+            self._timer = threading.Timer(self.batch_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _send(
+        self,
+        path: str,
+        payload: _t.Dict[str, _t.Any]
+    ) -> _t.Optional[requests.Response]:
+        """Sends a message after any in the outbox, moving it to the outbox
+        if the site cannot be reached and to the dead letter directory if the
+        site rejects it.
+        Returns:
+            Response: The site's response, or None if it was not delivered
+        """
+        with self._send_lock:
+            # Anything in the outbox has to go first.
+            response = None
+            if self.flush_outbox():
+                try:
+                    response = self._post(path, payload)
+                except MessageRejected as e:
+                    self._write_dead_letter(
+                        {'path': path, 'payload': payload},
+                        str(e)
+                    )
+                    return None
+            if response is None:
+                self._write_outbox(path, payload)
+            return response
+
+    def _post(
+        self,
+        path: str,
+        payload: _t.Dict[str, _t.Any]
+    ) -> _t.Optional[requests.Response]:
+        """Sends a message to the site, retrying on failure.
+        Returns:
+            Response: The site's response, or None if the site could not be
+                reached
+        Raises:
+            MessageRejected: The site responded with an error which sending
+                the message again will not fix
+        """
+        # The token is created at the time of sending as it expires.
+        token = create_jwt(payload)
+        try:
+            response = self.session.post(
+                f'{self.domain}{path}',
+                json={'token': token},
+                timeout=TIMEOUT,
+            )
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            if status in TRANSIENT_STATUSES or status >= 500:
+                print(f'\033[91mFailed to send to {path}: {e}\033[0m')
+                return None
+            raise MessageRejected(str(e)) from e
+        except requests.RequestException as e:
+            # Connection errors, timeouts and running out of retries.
+            print(f'\033[91mFailed to send to {path}: {e}\033[0m')
+            return None
+        return response
+
+    def _outbox(self) -> _t.List[str]:
+        """Returns the paths of the undelivered messages, oldest first."""
+        try:
+            names = sorted(os.listdir(self.outbox_dir))
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.outbox_dir, name)
+            for name in names
+            if name.endswith('.json')
+        ]
+
+    def _write_outbox(self, path: str, payload: _t.Dict[str, _t.Any]) -> None:
+        """Writes an undelivered message to the outbox."""
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        self._write_message(
+            os.path.join(self.outbox_dir, self._message_name()),
+            {'path': path, 'payload': payload}
+        )
+
+    def _write_dead_letter(
+        self,
+        message: _t.Dict[str, _t.Any],
+        reason: str
+    ) -> None:
+        """Writes a message which will not be sent again to the dead letter
+        directory, along with why it was given up on.
+        """
+        print(
+            f'\033[91mGiving up on the message to {message["path"]}: '
+            f'{reason}\033[0m'
+        )
+        os.makedirs(self.dead_letter_dir, exist_ok=True)
+        self._write_message(
+            os.path.join(self.dead_letter_dir, self._message_name()),
+            {**message, 'reason': reason}
+        )
+
+    @staticmethod
+    def _message_name() -> str:
+        """Returns a file name for a message which sorts in the order the
+        messages were written.
+        """
+        return f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json'
+
+    @staticmethod
+    def _write_message(fp: str, message: _t.Dict[str, _t.Any]) -> None:
+        """Writes a message to a file."""
+        # Write to a temporary file first so a crash cannot leave half a
+        # message behind.
+        with open(f'{fp}.tmp', 'w') as f:
+            json.dump(message, f)
+        os.replace(f'{fp}.tmp', fp)
+
+
+client = SiteAPIClient()
+atexit.register(client.flush)
+
 
 def send_progress(benchmark_id: int, progress: int) -> None:
-    """Sends the progress of a benchmark to the site API.
+    """Sends the progress of a benchmark to the site API. The update is sent
+    with the next batch.
     Args:
         benchmark_id (int): ID of the benchmark
         progress (int): The progress of the benchmark.
     """
-    payload = {
-        'benchmark_id': benchmark_id,
-        'status': progress
-    }
-    token = create_jwt(payload)
-    requests.post(
-        F'{API_DOMAIN}/internal-api/benchmark-progress/',
-        json={'token': token}
-    )
+    client.queue_progress(benchmark_id, progress)
 
 
 def send_results(
@@ -32,6 +339,11 @@ def send_results(
     completed_requests: int,
     failed_requests: int,
     sys_error_requests: int,
+    p50_time: _t.Optional[int] = None,
+    p90_time: _t.Optional[int] = None,
+    p99_time: _t.Optional[int] = None,
+    p999_time: _t.Optional[int] = None,
+    start_skew_ms: _t.Optional[int] = None,
 ) -> None:
     """Sends the results of a benchmark to the site API.
     Args:
@@ -42,6 +354,12 @@ def send_results(
         completed_requests (int): The number of completed requests.
         failed_requests (int): The number of failed requests.
         sys_error_requests (int): The number of system error requests.
+        p50_time (int): The 50th percentile time of the benchmark.
+        p90_time (int): The 90th percentile time of the benchmark.
+        p99_time (int): The 99th percentile time of the benchmark.
+        p999_time (int): The 99.9th percentile time of the benchmark.
+        start_skew_ms (int): Milliseconds between the first and last node
+            starting the benchmark.
     """
     payload = {
         'benchmark_id': benchmark_id,
@@ -51,9 +369,35 @@ def send_results(
         'complete_requests': completed_requests,
         'failed_requests': failed_requests,
         'sys_error_requests': sys_error_requests,
+        'p50_time': p50_time,
+        'p90_time': p90_time,
+        'p99_time': p99_time,
+        'p999_time': p999_time,
+        'start_skew_ms': start_skew_ms,
+    }
+    # The results complete the benchmark, so they go straight out with any
+    # progress waiting to be sent.
+    client.queue_results(payload)
+    client.flush()
+
+
+def send_timeseries(
+    benchmark_id: int,
+    timeseries: _t.Dict[str, _t.Any],
+) -> None:
+    """Sends the per-second throughput of a benchmark to the site API.
+    Args:
+        benchmark_id (int): ID of the benchmark
+        timeseries (Dict[str, Any]): The merged `ThroughputSeries` as a dict.
+            Contains the epoch second of the first slot (`start`) and lists
+            of the responses (`requests`), failed requests (`errors`) and
+            latency sums in microseconds (`latency_sum`) for each second.
+    """
+    payload = {
+        'benchmark_id': benchmark_id,
+        'start': timeseries['start'],
+        'requests': timeseries['requests'],
+        'errors': timeseries['errors'],
+        'latency_sum': timeseries['latency_sum'],
     }
-    token = create_jwt(payload)
-    requests.post(
-        F'{API_DOMAIN}/internal-api/benchmark-results/',
-        json={'token': token}
-    )
+    client.post('/internal-api/benchmark-timeseries/', payload)
@@ -0,0 +1,244 @@
+"""Unittests for the consumers module."""
+
+import asyncio
+import json
+import threading
+import unittest
+from unittest import mock
+import consumers
+import job_queue
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestBenchmarkConsumer(unittest.TestCase):
+    """Unittests for the BenchmarkConsumer class."""
+
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+        self.queue = job_queue.Queue(
+            max_nodes=8,
+            connection=self.connection,
+            test=True
+        )
+        # The benchmarks are not run, so they keep holding their nodes.
+        self.run_job = mock.patch.object(
+            consumers.BenchmarkConsumer,
+            'run_job'
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def consumer(self, name: str = 'controller-1', **kwargs):
+        consumer = consumers.BenchmarkConsumer(
+            connection=self.connection,
+            queue=self.queue,
+            name=name,
+            **kwargs
+        )
+        self.addCleanup(consumer.executor.shutdown)
+        return consumer
+
+    def publish_new(self, benchmark_id: int = 1, num_servers: int = 2):
+        job_queue.publish('benchmark_new', {
+            'benchmark_id': benchmark_id,
+            'domain': 'https://example.com',
+            'num_servers': num_servers,
+            'num_requests': 10,
+        }, connection=self.connection)
+
+    def pending(self, stream: str = 'benchmark_new') -> int:
+        """Returns the number of events not yet acknowledged."""
+        return self.connection.xpending(stream, 'controllers')['pending']
+
+    def test_new_benchmark(self):
+        """Test that a new benchmark is queued, started and acknowledged."""
+        consumer = self.consumer()
+        self.publish_new()
+        self.assertEqual(consumer.poll(block=None), 1)
+        self.assertEqual(self.queue.active_nodes(), 2)
+        self.assertEqual(self.pending(), 0)
+        consumer.executor.shutdown(wait=True)
+        self.run_job.assert_called_once()
+
+    def test_event_kept_while_down(self):
+        """Test that an event published before any controller is running is
+        handled once one starts.
+        """
+        self.publish_new()
+        self.assertEqual(self.consumer().poll(block=None), 1)
+        self.assertEqual(self.queue.active_nodes(), 2)
+
+    def test_redelivered_benchmark(self):
+        """Test that a benchmark is only queued once when its event is
+        delivered more than once.
+        """
+        consumer = self.consumer()
+        self.publish_new(num_servers=6)
+        self.publish_new(num_servers=6)
+        self.assertEqual(consumer.poll(block=None), 2)
+        self.assertEqual(self.queue.active_nodes(), 6)
+        self.assertTrue(self.queue.is_empty())
+
+    def test_redelivered_done(self):
+        """Test that the nodes of a benchmark are only released once."""
+        consumer = self.consumer()
+        self.publish_new(1, 2)
+        self.publish_new(2, 3)
+        consumer.poll(block=None)
+        for _ in range(2):
+            job_queue.publish(
+                'benchmark_done',
+                {'benchmark_id': 1, 'num_servers': 2},
+                connection=self.connection
+            )
+        consumer.poll(block=None)
+        self.assertEqual(self.queue.active_nodes(), 3)
+
+    def test_reclaim(self):
+        """Test that an event read by a controller which crashed before
+        handling it is handled by another controller.
+        """
+        crashed = self.consumer('controller-1')
+        self.publish_new()
+        with mock.patch.object(crashed, 'benchmark_new', side_effect=OSError):
+            crashed.poll(block=None)
+        self.assertEqual(self.pending(), 1)
+        self.assertEqual(self.queue.active_nodes(), 0)
+
+        other = self.consumer('controller-2')
+        self.assertEqual(other.reclaim(min_idle_time=0), 1)
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(self.queue.active_nodes(), 2)
+
+    def test_invalid_event(self):
+        """Test that an event which can never be handled is dropped."""
+        consumer = self.consumer()
+        self.connection.xadd('benchmark_new', {'data': 'not json'})
+        consumer.poll(block=None)
+        self.assertEqual(self.pending(), 0)
+
+    def test_max_workers(self):
+        """Test that no more benchmarks are admitted than there are workers
+        to run them, and the next is admitted once a worker is free.
+        """
+        release = threading.Event()
+        finished = threading.Event()
+
+        def run_job(job):
+            release.wait(5)
+            self.queue.release(job['benchmark_id'])
+            if job['benchmark_id'] == 2:
+                finished.set()
+
+        self.run_job.side_effect = run_job
+        consumer = self.consumer(max_workers=1)
+        self.publish_new(1, 1)
+        self.publish_new(2, 1)
+        consumer.poll(block=None)
+        self.assertEqual(consumer.metrics()['in_flight'], 1)
+        self.assertEqual(self.queue.size(), 1)
+
+        release.set()
+        self.assertTrue(finished.wait(5))
+        consumer.executor.shutdown(wait=True)
+        self.assertEqual(consumer.metrics()['finished'], 2)
+        self.assertEqual(consumer.metrics()['in_flight'], 0)
+
+    def test_lease_lost(self):
+        """Test that a benchmark is cancelled when its lease is lost, as it
+        has been put back on the queue to be run again.
+        """
+        cancelled = threading.Event()
+
+        async def run_benchmark_async(*args):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        mock.patch.object(
+            consumers.controller,
+            'run_benchmark_async',
+            run_benchmark_async
+        ).start()
+        self.queue.lease_ttl = 0.3
+        consumer = self.consumer()
+        self.publish_new(1, 2)
+        consumer.poll(block=None)
+        job = self.run_job.call_args[0][0]
+        self.connection.hdel(self.queue.running_name, 1)
+
+        with self.assertRaises(job_queue.LeaseLost):
+            asyncio.run(consumer.run_job_async(job))
+        self.assertTrue(cancelled.is_set())
+
+    def test_failed_job(self):
+        """Test that a benchmark which fails is reported to the site, unless
+        it failed by losing its lease as it will be run again.
+        """
+        fail_benchmark = mock.patch.object(
+            consumers.controller,
+            'fail_benchmark'
+        ).start()
+        consumer = self.consumer()
+        job = {'benchmark_id': 1, 'num_servers': 2, 'num_requests': 10}
+        consumer.in_flight = 2
+        self.run_job.side_effect = job_queue.LeaseLost
+        consumer._run_job(job)
+        fail_benchmark.assert_not_called()
+
+        self.run_job.side_effect = TimeoutError
+        consumer._run_job(job)
+        fail_benchmark.assert_called_once_with(1, 2, 10)
+        self.assertEqual(consumer.metrics()['failed'], 2)
+
+    def test_report_failed(self):
+        """Test that a benchmark given up on is reported to the site."""
+        fail_benchmark = mock.patch.object(
+            consumers.controller,
+            'fail_benchmark'
+        ).start()
+        consumer = self.consumer()
+        self.publish_new(1, 2)
+        consumer.poll(block=None)
+        self.connection.rpush(
+            self.queue.failed_name,
+            json.dumps(self.run_job.call_args[0][0])
+        )
+        self.assertEqual(consumer.report_failed(), 1)
+        fail_benchmark.assert_called_once_with(1, 2, 10)
+
+    def test_backpressure(self):
+        """Test that new benchmarks are left on the stream and the site is
+        told to stop sending them while the queue is full.
+        """
+        consumer = self.consumer(max_queue_depth=1)
+        self.publish_new(1, 8)
+        self.publish_new(2, 8)
+        consumer.poll(block=None)
+        self.assertTrue(consumer.saturated())
+
+        self.publish_new(3, 8)
+        self.assertEqual(consumer.poll(block=None), 0)
+        consumer.report()
+        self.assertEqual(
+            json.loads(self.connection.get(consumers.BACKPRESSURE_KEY)),
+            {'queue_depth': 1, 'max_queue_depth': 1}
+        )
+        metrics = json.loads(
+            self.connection.hget(consumers.METRICS_KEY, 'controller-1')
+        )
+        self.assertEqual(metrics['queue_depth'], 1)
+
+        # Once the queue drains the waiting benchmark is read.
+        self.queue.release(1)
+        consumer.run_next_job()
+        self.assertEqual(consumer.poll(block=None), 1)
+        self.queue.release(2)
+        consumer.run_next_job()
+        consumer.report()
+        self.assertIsNone(self.connection.get(consumers.BACKPRESSURE_KEY))
@@ -0,0 +1,259 @@
+"""Unittests for the control_channel module."""
+
+import json
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+import control_channel
+import load_generator
+from agent import Agent
+from control_channel import (
+    ControlServer,
+    MessageReader,
+    agent_token,
+    token_proof,
+)
+
+
+class TestControlServer(unittest.TestCase):
+    """Unittests for the ControlServer class."""
+
+    def setUp(self):
+        self.server = ControlServer('127.0.0.1', 0, 'secret').start()
+        self.addCleanup(self.server.stop)
+
+    def connect(self, agent_id: str, token: str) -> socket.socket:
+        """Opens a connection to the server and answers its challenge."""
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(sock.close)
+        challenge = self.read_challenge(sock)
+        control_channel.send_message(sock, {
+            'type': 'hello',
+            'agent_id': agent_id,
+            'proof': token_proof(token, challenge['nonce']),
+        })
+        return sock
+
+    def read_challenge(self, sock: socket.socket) -> dict:
+        """Reads the challenge the server sends when a connection opens,
+        byte by byte so nothing sent after it is read.
+        """
+        line = b''
+        while not line.endswith(b'\n'):
+            line += sock.recv(1)
+        challenge = json.loads(line)
+        self.assertEqual(challenge['type'], 'challenge')
+        return challenge
+
+    def test_agent_connects(self):
+        """Test that an agent with a valid token is registered."""
+        self.connect('node-1', agent_token('node-1', 'secret'))
+        agent = self.server.agent('node-1', timeout=5)
+        self.assertEqual(agent.agent_id, 'node-1')
+
+    def test_invalid_token(self):
+        """Test that an agent with an invalid token is disconnected."""
+        sock = self.connect('node-1', agent_token('node-1', 'other'))
+        sock.settimeout(5)
+        self.assertEqual(sock.recv(1), b'')
+        with self.assertRaises(TimeoutError):
+            self.server.agent('node-1', timeout=0.1)
+
+    def test_replayed_hello(self):
+        """Test that a hello overheard on one connection cannot be replayed
+        on another, as each connection is challenged with its own nonce.
+        """
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(sock.close)
+        challenge = self.read_challenge(sock)
+        hello = {
+            'type': 'hello',
+            'agent_id': 'node-1',
+            'proof': token_proof(
+                agent_token('node-1', 'secret'),
+                challenge['nonce']
+            ),
+        }
+
+        replayed = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(replayed.close)
+        self.read_challenge(replayed)
+        control_channel.send_message(replayed, hello)
+        replayed.settimeout(5)
+        self.assertEqual(replayed.recv(1), b'')
+        with self.assertRaises(TimeoutError):
+            self.server.agent('node-1', timeout=0.1)
+
+    def test_job_and_result(self):
+        """Test that a job is sent to the agent and its result returned."""
+        sock = self.connect('node-1', agent_token('node-1', 'secret'))
+        agent = self.server.agent('node-1', timeout=5)
+        job_id = agent.send_job(time.time(), 10, 'http://localhost/')
+
+        message = MessageReader(sock).read()
+        self.assertEqual(message['type'], 'job')
+        self.assertEqual(message['job_id'], job_id)
+        self.assertEqual(message['num_requests'], 10)
+
+        self.assertIsNone(agent.result())
+        control_channel.send_message(sock, {
+            'type': 'result',
+            'job_id': job_id,
+            'results': {'complete_requests': 10},
+        })
+        self.assertEqual(
+            agent.result(timeout=5),
+            {'complete_requests': 10}
+        )
+        # The results are not kept once they have been returned.
+        self.assertIsNone(agent.result(job_id))
+
+    def test_metrics(self):
+        """Test that the metrics sent for a job are kept until taken."""
+        sock = self.connect('node-1', agent_token('node-1', 'secret'))
+        agent = self.server.agent('node-1', timeout=5)
+        for i in range(2):
+            control_channel.send_message(sock, {
+                'type': 'metrics',
+                'job_id': 1,
+                'metrics': {'requests': i},
+            })
+        # Results follow the metrics on the same connection.
+        control_channel.send_message(sock, {
+            'type': 'result',
+            'job_id': 1,
+            'results': {},
+        })
+        agent.result(1, timeout=5)
+
+        self.assertEqual(
+            agent.take_metrics(1),
+            [{'requests': 0}, {'requests': 1}]
+        )
+        self.assertEqual(agent.take_metrics(1), [])
+
+    def test_measure_clock_offset(self):
+        """Test that the offset of an agent's clock is measured from its
+        replies to pings.
+        """
+        sock = self.connect('node-1', agent_token('node-1', 'secret'))
+        agent = self.server.agent('node-1', timeout=5)
+
+        def reply():
+            # Reply as if the agent's clock was 2 seconds ahead.
+            reader = MessageReader(sock)
+            for _ in range(control_channel.CLOCK_SAMPLES):
+                ping = reader.read()
+                control_channel.send_message(sock, {
+                    'type': 'pong',
+                    'sent_at': ping['sent_at'],
+                    'time': time.time() + 2,
+                })
+
+        threading.Thread(target=reply, daemon=True).start()
+        self.assertAlmostEqual(agent.measure_clock_offset(), 2, delta=0.05)
+
+    def test_measure_clock_offsets_failed(self):
+        """Test that an agent whose clock could not be measured is reported,
+        once the clocks of the other agents have been measured.
+        """
+        socks = {
+            agent_id: self.connect(agent_id, agent_token(agent_id, 'secret'))
+            for agent_id in ('node-1', 'node-2')
+        }
+        agents = control_channel.wait_for_agents(
+            self.server,
+            ['node-1', 'node-2'],
+            timeout=5
+        )
+
+        def reply():
+            reader = MessageReader(socks['node-1'])
+            for _ in range(control_channel.CLOCK_SAMPLES):
+                ping = reader.read()
+                control_channel.send_message(socks['node-1'], {
+                    'type': 'pong',
+                    'sent_at': ping['sent_at'],
+                    'time': time.time() + 2,
+                })
+
+        threading.Thread(target=reply, daemon=True).start()
+        with mock.patch.object(
+            agents[1],
+            'ping',
+            side_effect=TimeoutError('Agent node-2 did not reply')
+        ), self.assertRaisesRegex(TimeoutError, 'node-2'):
+            control_channel.measure_clock_offsets(agents)
+        self.assertAlmostEqual(agents[0].clock_offset, 2, delta=0.05)
+
+    def test_result_after_disconnect(self):
+        """Test that waiting for a result stops when the agent disconnects.
+        """
+        sock = self.connect('node-1', agent_token('node-1', 'secret'))
+        agent = self.server.agent('node-1', timeout=5)
+        agent.send_job(time.time(), 10, 'http://localhost/')
+        sock.close()
+        self.assertIsNone(agent.result(timeout=5))
+        self.assertFalse(agent.connected)
+
+
+class TestAgent(unittest.TestCase):
+    """Unittests for the Agent class."""
+
+    def test_reconnects(self):
+        """Test that the agent reconnects when the connection drops."""
+        server = ControlServer('127.0.0.1', 0, 'secret').start()
+        self.addCleanup(server.stop)
+        agent = Agent(
+            server.address,
+            'node-1',
+            agent_token('node-1', 'secret')
+        )
+        self.addCleanup(agent.stop)
+        threading.Thread(target=agent.run_forever, daemon=True).start()
+
+        first = server.agent('node-1', timeout=5)
+        first.close()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            second = server.agent('node-1', timeout=5)
+            if second is not first:
+                break
+            time.sleep(0.05)
+        self.assertIsNot(second, first)
+
+    def test_failed_job(self):
+        """Test that a job which fails sends back its error rather than
+        leaving the controller waiting for its results.
+        """
+        server = ControlServer('127.0.0.1', 0, 'secret').start()
+        self.addCleanup(server.stop)
+        agent = Agent(
+            server.address,
+            'node-1',
+            agent_token('node-1', 'secret')
+        )
+        self.addCleanup(agent.stop)
+        threading.Thread(target=agent.run_forever, daemon=True).start()
+        mock.patch.object(
+            load_generator,
+            'run',
+            side_effect=OSError('Name or service not known')
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+        connection = server.agent('node-1', timeout=5)
+        job_id = connection.send_job(time.time(), 10, 'http://invalid/')
+        self.assertEqual(
+            connection.result(job_id, timeout=5),
+            {'error': 'OSError: Name or service not known'}
+        )
+
+        # A job which arrives after its start time is rejected.
+        job_id = connection.send_job(time.time() - 1, 10, 'http://invalid/')
+        self.assertRegex(
+            connection.result(job_id, timeout=5)['error'],
+            r'^LateStart: '
+        )
@@ -0,0 +1,390 @@
+"""Unittests for the controller module."""
+
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import controller
+import providers
+from control_channel import ControlServer
+from histogram import LatencyHistogram
+from node_pool import NodePool
+from tests.utils import start_http_server
+
+
+class TestMasterNode(unittest.TestCase):
+    """Runs whole benchmarks through the MasterNode on local nodes."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_http_server()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/'
+        cls.control_server = ControlServer('127.0.0.1', 0, 'secret').start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.control_server.stop()
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.results_dir, True)
+        self.site_api = mock.patch.object(controller, 'site_api').start()
+        self.job_queue = mock.patch.object(controller, 'job_queue').start()
+        mock.patch.object(providers, 'RESULTS_DIR', self.results_dir).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.pool = NodePool(
+            providers.LocalProcessProvider(self.control_server),
+            size=0
+        )
+
+    def test_run_benchmark(self):
+        """Test that the results are collected as soon as the nodes finish
+        rather than after a fixed wait.
+        """
+        started = time.monotonic()
+        with controller.MasterNode(
+            1,
+            self.url,
+            num_nodes=2,
+            requests_per_node=25,
+            concurrency=5,
+            pool=self.pool
+        ) as master:
+            master.execute_tasks()
+            results = master.calculate_results()
+
+        self.assertLess(time.monotonic() - started, 30)
+        self.assertEqual(results['completed_requests'], 50)
+        self.assertEqual(results['failed_requests'], 0)
+        self.assertEqual(results['sys_error_requests'], 0)
+        self.assertIsNotNone(results['p99_time'])
+        # Both nodes start at the same instant.
+        self.assertLess(results['start_skew_ms'], 250)
+        self.site_api.send_results.assert_called_once()
+
+    def test_missing_results(self):
+        """Test that a node which never reports back is counted as failed
+        once the deadline passes.
+        """
+        mock.patch.object(controller, 'RESULTS_TIMEOUT', 0).start()
+        mock.patch.object(controller.SlaveNode, 'schedule_benchmark').start()
+        with controller.MasterNode(
+            1,
+            self.url,
+            num_nodes=1,
+            requests_per_node=10,
+            pool=self.pool
+        ) as master:
+            master.execute_tasks()
+            results = master.calculate_results()
+
+        self.assertEqual(results['completed_requests'], 0)
+        self.assertEqual(results['sys_error_requests'], 10)
+        self.assertIsNone(results['start_skew_ms'])
+
+    def test_run_benchmark_async(self):
+        """Test that several benchmarks run concurrently on one event loop."""
+        mock.patch.object(controller, 'node_pool', self.pool).start()
+
+        async def run():
+            return await asyncio.gather(*(
+                controller.run_benchmark_async(benchmark_id, self.url, 1, 10)
+                for benchmark_id in (1, 2)
+            ))
+
+        for results in asyncio.run(run()):
+            self.assertEqual(results['completed_requests'], 10)
+        self.assertEqual(self.site_api.send_results.call_count, 2)
+
+    def test_live_metrics(self):
+        """Test that the metrics streamed by the nodes are merged and
+        published while the benchmark runs.
+        """
+        with controller.MasterNode(
+            1,
+            self.url,
+            num_nodes=2,
+            requests_per_node=25,
+            concurrency=5,
+            pool=self.pool
+        ) as master:
+            master.execute_tasks()
+
+        published = [
+            call.args[1]
+            for call in self.job_queue.publish.call_args_list
+            if call.args[0] == controller.METRICS_STREAM
+        ]
+        self.assertTrue(published)
+        for metrics in published:
+            self.assertEqual(metrics['benchmark_id'], 1)
+            self.assertEqual(metrics['error_rate'], 0)
+        self.assertIsNotNone(published[-1]['p99_time'])
+
+    def test_schedule_timeout(self):
+        """Test that a node which does not accept its job in time cancels the
+        benchmark, and the nodes are terminated rather than returned to the
+        pool as they may still run their jobs.
+        """
+        mock.patch.object(controller, 'SCHEDULE_TIMEOUT', 0.1).start()
+        mock.patch.object(
+            self.pool.provider,
+            'schedule_benchmark',
+            side_effect=lambda *args: time.sleep(1)
+        ).start()
+        release = mock.patch.object(
+            self.pool,
+            'release',
+            wraps=self.pool.release
+        ).start()
+        discard = mock.patch.object(
+            self.pool,
+            'discard',
+            wraps=self.pool.discard
+        ).start()
+
+        async def run():
+            async with controller.MasterNode(
+                1,
+                self.url,
+                num_nodes=2,
+                requests_per_node=10,
+                pool=self.pool
+            ) as master:
+                await master.execute_tasks_async()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+        release.assert_called_once_with([])
+        self.assertEqual(len(discard.call_args[0][0]), 2)
+
+    def test_pipelined_bring_up(self):
+        """Test that each node is connected as soon as it is set up rather
+        than waiting for the slowest node, and the benchmark only starts once
+        every node is ready.
+        """
+        provider = self.pool.provider
+        slow = threading.Event()
+        connected = []
+
+        def setup_instance(instance):
+            if instance is launched[0]:
+                slow.wait(5)
+
+        def wait_until_ready(instances):
+            connected.append(instances[0])
+            if len(connected) == 1:
+                slow.set()
+            return providers.NodeProvider.wait_until_ready(provider, instances)
+
+        launched = provider.create_instances(2)
+        mock.patch.object(
+            self.pool,
+            'lease_pipelined',
+            return_value=([], launched)
+        ).start()
+        mock.patch.object(provider, 'setup_instance', setup_instance).start()
+        mock.patch.object(
+            provider,
+            'wait_until_ready',
+            wait_until_ready
+        ).start()
+
+        async def run():
+            async with controller.MasterNode(
+                1,
+                self.url,
+                num_nodes=2,
+                requests_per_node=10,
+                pool=self.pool
+            ) as master:
+                await master.execute_tasks_async()
+                return await master.calculate_results_async()
+
+        results = asyncio.run(run())
+        self.assertEqual(connected, [launched[1], launched[0]])
+        self.assertEqual(results['completed_requests'], 20)
+
+    def test_failed_setup(self):
+        """Test that a node which fails to be set up is terminated and the
+        other nodes are returned to the pool.
+        """
+        provider = self.pool.provider
+        launched = provider.create_instances(2)
+        provider.wait_until_ready([launched[0]])
+        mock.patch.object(
+            self.pool,
+            'lease_pipelined',
+            return_value=([launched[0]], [launched[1]])
+        ).start()
+        mock.patch.object(
+            provider,
+            'setup_instance',
+            side_effect=OSError
+        ).start()
+        mock.patch.object(provider, 'wait_until_ready').start()
+        terminate = mock.patch.object(
+            provider,
+            'terminate_instances',
+            wraps=provider.terminate_instances
+        ).start()
+        release = mock.patch.object(
+            self.pool,
+            'release',
+            wraps=self.pool.release
+        ).start()
+
+        async def run():
+            async with controller.MasterNode(
+                1,
+                self.url,
+                num_nodes=2,
+                requests_per_node=10,
+                pool=self.pool
+            ):
+                pass
+
+        with self.assertRaises(OSError):
+            asyncio.run(run())
+        terminate.assert_any_call([launched[1]])
+        release.assert_called_once_with([launched[0]])
+
+    def test_agent_not_connected(self):
+        """Test that a node whose agent never connected is terminated rather
+        than returned to the pool.
+        """
+        provider = self.pool.provider
+        launched = provider.create_instances(2)
+        provider.wait_until_ready(launched)
+        mock.patch.object(
+            self.pool,
+            'lease_pipelined',
+            return_value=(launched, [])
+        ).start()
+        mock.patch.object(
+            provider,
+            'wait_until_ready',
+            side_effect=TimeoutError
+        ).start()
+        mock.patch.object(
+            provider,
+            'agent_connected',
+            lambda instance: instance is launched[0]
+        ).start()
+        release = mock.patch.object(self.pool, 'release').start()
+        discard = mock.patch.object(self.pool, 'discard').start()
+        self.addCleanup(provider.terminate_instances, launched)
+
+        async def run():
+            async with controller.MasterNode(
+                1,
+                self.url,
+                num_nodes=2,
+                requests_per_node=10,
+                pool=self.pool
+            ):
+                pass
+
+        with self.assertRaises(TimeoutError):
+            asyncio.run(run())
+        release.assert_called_once_with([launched[0]])
+        discard.assert_called_once_with([launched[1]])
+
+    def test_start_lead(self):
+        """Test that the start time leaves time for the slowest round trip
+        and for sending the job to every node.
+        """
+        master = controller.MasterNode(1, self.url, pool=self.pool)
+        for round_trip_time in (0.2, 0.1):
+            node = mock.Mock()
+            node.round_trip_time.return_value = round_trip_time
+            master.nodes.append(node)
+        self.assertAlmostEqual(
+            master.start_lead(),
+            controller.START_MARGIN + 0.2 + 2 * controller.SEND_TIME_PER_NODE
+        )
+
+    def test_provisioning_pool(self):
+        """Test that a node which is slow to be set up does not hold up the
+        short blocking calls of other benchmarks.
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        mock.patch.object(
+            controller,
+            '_provisioning_executor',
+            executor
+        ).start()
+        provider = self.pool.provider
+        setting_up = threading.Event()
+        set_up = threading.Event()
+        mock.patch.object(
+            provider,
+            'setup_instance',
+            side_effect=lambda instance: setting_up.set() or set_up.wait(5)
+        ).start()
+        mock.patch.object(provider, 'wait_until_ready').start()
+        master = controller.MasterNode(1, self.url, pool=self.pool)
+        node = controller.SlaveNode(mock.Mock(), provider)
+
+        async def run():
+            bring_up = asyncio.ensure_future(master.bring_up_node(node, True))
+            await controller.run_blocking(setting_up.wait, 5)
+            # The provisioning pool is full, but short calls still run.
+            self.assertEqual(
+                await controller.run_blocking(lambda: 'sent', timeout=1),
+                'sent'
+            )
+            set_up.set()
+            await bring_up
+
+        asyncio.run(run())
+
+
+class TestMergeMetrics(unittest.TestCase):
+    """Unittests for the merge_metrics function."""
+
+    def test_merge_metrics(self):
+        """Test that the metrics from each node are merged exactly."""
+        windows = []
+        for latencies, failed_requests in (([1000, 2000], 1), ([3000], 0)):
+            histogram = LatencyHistogram()
+            for latency in latencies:
+                histogram.record(latency)
+            windows.append({
+                'histogram': histogram.to_dict(),
+                'requests': len(latencies) + failed_requests,
+                'failed_requests': failed_requests,
+            })
+
+        self.assertEqual(controller.merge_metrics(windows, 2), {
+            'rps': 2,
+            'error_rate': 0.25,
+            'p50_time': 2,
+            'p99_time': 3,
+        })
+        self.assertIsNone(controller.merge_metrics([], 1))
+
+
+class TestStartSkew(unittest.TestCase):
+    """Unittests for the start_skew function."""
+
+    def test_start_skew(self):
+        """Test that the skew is the gap between the first and last node."""
+        results = [
+            {'started_at': 100.010},
+            {'started_at': 100.002},
+            {'started_at': 100.004},
+        ]
+        self.assertEqual(controller.start_skew(results), 8)
+
+    def test_no_start_times(self):
+        """Test that the skew is unknown when no node reports its start."""
+        self.assertIsNone(controller.start_skew([{}]))
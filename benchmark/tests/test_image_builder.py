@@ -0,0 +1,94 @@
+"""Unittests for the image_builder module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import image_builder
+import providers
+
+
+class StandInImage:
+    """Stands in for an AMI."""
+
+    def __init__(self, image_id: str, creation_date: str, version: str):
+        self.id = image_id
+        self.creation_date = creation_date
+        self.tags = [{'Key': image_builder.VERSION_TAG, 'Value': version}]
+
+
+class TestImageBuilder(unittest.TestCase):
+    """Unittests for the image_builder module."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        mock.patch.object(image_builder, '_ami_versions', {}).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def write(self, name: str, content: str) -> str:
+        fp = os.path.join(self.tmp_dir, name)
+        with open(fp, 'w') as f:
+            f.write(content)
+        return fp
+
+    def test_image_version(self):
+        """Test that the version only changes when a file baked into the
+        image changes.
+        """
+        files = [self.write('agent.py', 'a'), self.write('setup.sh', 'b')]
+        version = image_builder.image_version(files)
+        self.assertEqual(image_builder.image_version(files), version)
+
+        self.write('agent.py', 'c')
+        self.assertNotEqual(image_builder.image_version(files), version)
+
+    def test_latest_ami(self):
+        """Test that the newest node AMI is picked."""
+        ec2 = mock.Mock()
+        ec2.images.filter.return_value = [
+            StandInImage('ami-2', '2022-02-01T00:00:00.000Z', 'v2'),
+            StandInImage('ami-1', '2022-01-01T00:00:00.000Z', 'v1'),
+        ]
+        self.assertEqual(image_builder.latest_ami(ec2), ('ami-2', 'v2'))
+
+        ec2.images.filter.return_value = []
+        self.assertIsNone(image_builder.latest_ami(ec2))
+
+    def test_is_current(self):
+        """Test that only an AMI of the current version skips the setup, and
+        the version of each AMI is only looked up once.
+        """
+        version = image_builder.image_version()
+        ec2 = mock.Mock()
+        ec2.Image.side_effect = lambda image_id: StandInImage(
+            image_id,
+            '',
+            version if image_id == 'ami-new' else 'old'
+        )
+        self.assertTrue(image_builder.is_current('ami-new', ec2))
+        self.assertTrue(image_builder.is_current('ami-new', ec2))
+        self.assertFalse(image_builder.is_current('ami-old', ec2))
+        self.assertEqual(ec2.Image.call_count, 2)
+
+    def test_docker_node_image(self):
+        """Test that the Docker provider uses the node image once it has been
+        built.
+        """
+        provider = providers.DockerProvider(image=None)
+        exists = mock.patch.object(
+            image_builder,
+            'docker_image_exists',
+            return_value=False
+        ).start()
+        self.assertEqual(
+            provider.node_image(),
+            (image_builder.DOCKER_BASE_IMAGE, False)
+        )
+
+        exists.return_value = True
+        self.assertEqual(
+            provider.node_image(),
+            (image_builder.docker_tag(), True)
+        )
@@ -0,0 +1,410 @@
+"""Unittests for the job_queue module."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+import redis
+import job_queue
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestQueue(unittest.TestCase):
+    """Unittests for the Queue class against a stand-in Redis server."""
+
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+        self.queue = job_queue.Queue(
+            max_nodes=8,
+            connection=self.connection,
+            test=True
+        )
+
+    def push(self, benchmark_id: int, num_nodes: int) -> None:
+        self.queue.push(benchmark_id, 'https://example.com', num_nodes, 10)
+
+    def test_admit(self):
+        """Test that a benchmark is admitted and its nodes reserved."""
+        self.push(1, 3)
+        job = self.queue.admit()
+        self.assertEqual(job['benchmark_id'], 1)
+        self.assertEqual(self.queue.active_nodes(), 3)
+        self.assertTrue(self.queue.is_empty())
+
+    def test_admit_empty(self):
+        """Test that nothing is admitted from an empty queue."""
+        self.assertIsNone(self.queue.admit())
+        self.assertEqual(self.queue.active_nodes(), 0)
+
+    def test_admit_does_not_fit(self):
+        """Test that a benchmark which does not fit stays at the head of the
+        queue.
+        """
+        self.push(1, 6)
+        self.push(2, 6)
+        self.assertEqual(self.queue.admit()['benchmark_id'], 1)
+        self.assertIsNone(self.queue.admit())
+        self.assertEqual(self.queue.size(), 1)
+        self.assertEqual(self.queue.active_nodes(), 6)
+
+        self.queue.release(1)
+        self.assertEqual(self.queue.admit()['benchmark_id'], 2)
+
+    def test_pop(self):
+        """Test that popping reserves the benchmark's nodes."""
+        self.push(1, 3)
+        self.assertEqual(self.queue.pop()['benchmark_id'], 1)
+        self.assertEqual(self.queue.active_nodes(), 3)
+        self.assertIsNone(self.queue.pop())
+
+    def test_release(self):
+        """Test that a benchmark's nodes are only released once."""
+        self.push(1, 3)
+        self.push(2, 2)
+        self.queue.admit()
+        self.queue.admit()
+        self.assertTrue(self.queue.release(1))
+        self.assertFalse(self.queue.release(1))
+        self.assertEqual(self.queue.active_nodes(), 2)
+
+    def test_fifo_blocks(self):
+        """Test that the FIFO scheduler does not run anything behind a
+        benchmark which does not fit.
+        """
+        self.push(1, 6)
+        self.push(2, 4)
+        self.push(3, 1)
+        self.assertEqual(self.queue.admit()['benchmark_id'], 1)
+        self.assertIsNone(self.queue.admit())
+
+    def test_concurrent_admission(self):
+        """Test that concurrent admissions never reserve more than the
+        maximum number of nodes.
+        """
+        for i in range(200):
+            self.push(i, 1 + i % 3)
+
+        admitted = []
+        lock = threading.Lock()
+        peak = [0]
+        barrier = threading.Barrier(16)
+
+        def worker():
+            barrier.wait()
+            for _ in range(50):
+                job = self.queue.admit()
+                if job is None:
+                    continue
+                with lock:
+                    admitted.append(job)
+                    peak[0] = max(peak[0], self.queue.active_nodes())
+                self.queue.release(job['benchmark_id'])
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        ids = [job['benchmark_id'] for job in admitted]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertLessEqual(peak[0], self.queue.max_nodes)
+        self.assertEqual(self.queue.active_nodes(), 0)
+        self.assertEqual(len(admitted) + self.queue.size(), 200)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestBackfill(unittest.TestCase):
+    """Unittests for the backfill scheduler."""
+
+    def setUp(self):
+        self.queue = job_queue.Queue(
+            max_nodes=8,
+            connection=fakeredis.FakeRedis(),
+            scheduler='backfill',
+            # The benchmarks do not renew their leases.
+            lease_ttl=10 ** 6,
+            test=True
+        )
+
+    def push(self, benchmark_id: int, num_nodes: int, runtime: float):
+        self.queue.push(
+            benchmark_id,
+            'https://example.com',
+            num_nodes,
+            10,
+            runtime
+        )
+
+    def admitted(self, now: float = 0):
+        """Returns the ID of the admitted benchmark."""
+        job = self.queue.admit(now=now)
+        return job and job['benchmark_id']
+
+    def test_backfills_short_job(self):
+        """Test that a benchmark which ends before the head of the queue can
+        start is run in the idle nodes.
+        """
+        self.push(1, 6, 100)
+        self.push(2, 8, 100)
+        self.push(3, 2, 50)
+        self.assertEqual(self.admitted(), 1)
+        self.assertEqual(self.admitted(), 3)
+        self.assertEqual(self.queue.size(), 1)
+
+    def test_does_not_delay_head(self):
+        """Test that a benchmark which would delay the head of the queue is
+        not run.
+        """
+        self.push(1, 6, 100)
+        self.push(2, 8, 100)
+        self.push(3, 2, 500)
+        self.assertEqual(self.admitted(), 1)
+        self.assertIsNone(self.admitted())
+
+    def test_backfills_into_spare_nodes(self):
+        """Test that a long benchmark is run if it only uses nodes which will
+        still be spare once the head of the queue starts.
+        """
+        self.push(1, 4, 100)
+        self.push(2, 6, 100)
+        self.push(3, 2, 500)
+        self.assertEqual(self.admitted(), 1)
+        self.assertEqual(self.admitted(), 3)
+
+        # The head starts as soon as the first benchmark finishes.
+        self.queue.release(1)
+        self.assertEqual(self.admitted(100), 2)
+        self.assertEqual(self.queue.active_nodes(now=100), 8)
+
+    def test_release_uses_reserved_nodes(self):
+        """Test that finishing a benchmark releases the nodes it reserved."""
+        self.push(1, 6, 100)
+        self.admitted()
+        self.queue.release(1)
+        self.assertEqual(self.queue.active_nodes(), 0)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestFairShare(unittest.TestCase):
+    """Unittests for the priority classes and fair queuing across accounts."""
+
+    def setUp(self):
+        self.queue = job_queue.Queue(
+            max_nodes=1,
+            connection=fakeredis.FakeRedis(),
+            test=True
+        )
+
+    def push(self, benchmark_id: int, account_id: int, **kwargs):
+        self.queue.push(
+            benchmark_id,
+            'https://example.com',
+            1,
+            10,
+            100,
+            account_id=account_id,
+            **kwargs
+        )
+
+    def order(self):
+        """Returns the IDs of the benchmarks in the order they are run."""
+        order = []
+        while True:
+            job = self.queue.admit(now=0)
+            if job is None:
+                return order
+            order.append(job['benchmark_id'])
+            self.queue.release(job['benchmark_id'])
+
+    def test_burst_is_interleaved(self):
+        """Test that a burst from one account does not hold up the other
+        accounts.
+        """
+        for benchmark_id in range(1, 5):
+            self.push(benchmark_id, 1)
+        self.push(5, 2)
+        self.push(6, 3)
+        self.assertEqual(self.order(), [1, 5, 6, 2, 3, 4])
+
+    def test_weight(self):
+        """Test that an account with twice the weight gets twice the share."""
+        for benchmark_id in range(1, 5):
+            self.push(benchmark_id, 1, weight=2)
+        for benchmark_id in range(5, 9):
+            self.push(benchmark_id, 2)
+        self.assertEqual(self.order(), [1, 5, 2, 3, 6, 4, 7, 8])
+
+    def test_priority(self):
+        """Test that paid benchmarks run before free benchmarks."""
+        self.push(1, 1, priority=job_queue.PRIORITY_FREE)
+        self.push(2, 1, priority=job_queue.PRIORITY_FREE)
+        self.push(3, 2, priority=job_queue.PRIORITY_PAID)
+        self.assertEqual(self.order(), [3, 1, 2])
+
+    def test_idle_account_does_not_bank_share(self):
+        """Test that an account cannot save up its share while it has nothing
+        queued and then jump ahead of the others.
+        """
+        for benchmark_id in range(1, 5):
+            self.push(benchmark_id, 1)
+        self.assertEqual(self.queue.admit(now=0)['benchmark_id'], 1)
+        self.queue.release(1)
+        self.assertEqual(self.queue.admit(now=0)['benchmark_id'], 2)
+        self.queue.release(2)
+        self.push(5, 2)
+        self.push(6, 2)
+        self.assertEqual(self.order(), [5, 3, 6, 4])
+
+    def test_status(self):
+        """Test the number of benchmarks ahead and the expected start."""
+        self.queue.max_nodes = 2
+        self.push(1, 1, priority=job_queue.PRIORITY_FREE)
+        self.push(2, 1, priority=job_queue.PRIORITY_FREE)
+        self.push(3, 2)
+        self.assertEqual(self.queue.status(3, now=0), {
+            'ahead': 0,
+            'estimated_start': 0,
+        })
+        self.assertEqual(self.queue.status(2, now=0), {
+            'ahead': 2,
+            'estimated_start': 100,
+        })
+
+        # The running benchmark holds a node for the rest of its runtime.
+        self.queue.admit(now=0)
+        self.assertEqual(self.queue.status(1, now=20), {
+            'ahead': 0,
+            'estimated_start': 60,
+        })
+        self.assertIsNone(self.queue.status(3))
+
+    def test_invalid_push(self):
+        """Test that an unknown priority or a weight of zero is rejected."""
+        with self.assertRaises(ValueError):
+            self.push(1, 1, priority=5)
+        with self.assertRaises(ValueError):
+            self.push(1, 1, weight=0)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestLeases(unittest.TestCase):
+    """Unittests for the leases on the nodes of running benchmarks."""
+
+    def setUp(self):
+        self.connection = fakeredis.FakeRedis()
+        self.queue = self.controller('controller-1')
+
+    def controller(self, owner: str) -> job_queue.Queue:
+        """Returns the queue as seen by a controller."""
+        return job_queue.Queue(
+            max_nodes=8,
+            connection=self.connection,
+            lease_ttl=60,
+            owner=owner,
+            test=True
+        )
+
+    def push(self, benchmark_id: int, num_nodes: int):
+        self.queue.push(benchmark_id, 'https://example.com', num_nodes, 10)
+
+    def test_expired_lease(self):
+        """Test that the nodes of a controller which died are freed once its
+        lease expires and its benchmark is run again.
+        """
+        self.push(1, 6)
+        self.push(2, 4)
+        self.assertEqual(self.queue.admit(now=0)['benchmark_id'], 1)
+        self.assertEqual(self.queue.active_nodes(now=59), 6)
+        self.assertEqual(self.queue.active_nodes(now=60), 0)
+
+        other = self.controller('controller-2')
+        job = other.admit(now=60)
+        self.assertEqual(job['benchmark_id'], 1)
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(other.leases(now=60)[1]['owner'], 'controller-2')
+        self.assertFalse(self.queue.renew(1, now=61))
+
+    def test_renew(self):
+        """Test that a renewed lease keeps holding the nodes."""
+        self.push(1, 6)
+        self.queue.admit(now=0)
+        self.assertTrue(self.queue.renew(1, now=50))
+        self.assertEqual(self.queue.active_nodes(now=100), 6)
+        self.assertFalse(self.controller('controller-2').renew(1, now=100))
+        self.assertFalse(self.queue.renew(1, now=110))
+
+    def test_max_attempts(self):
+        """Test that a benchmark is given up on once it has been tried
+        `MAX_ATTEMPTS` times.
+        """
+        self.push(1, 6)
+        now = 0
+        for _ in range(job_queue.MAX_ATTEMPTS):
+            self.assertEqual(self.queue.admit(now=now)['benchmark_id'], 1)
+            now += 60
+        self.assertIsNone(self.queue.admit(now=now))
+        self.assertTrue(self.queue.is_empty())
+        self.assertEqual(self.queue.active_nodes(now=now), 0)
+        failed = self.queue.take_failed()
+        self.assertEqual(failed['benchmark_id'], 1)
+        self.assertEqual(failed['attempts'], job_queue.MAX_ATTEMPTS + 1)
+        self.assertIsNone(self.queue.take_failed())
+
+    def test_release_owner(self):
+        """Test that a controller cannot release a lease which another
+        controller has taken since its own expired.
+        """
+        self.push(1, 6)
+        self.queue.admit(now=0)
+        other = self.controller('controller-2')
+        other.admit(now=60)
+        self.assertFalse(self.queue.release(1))
+        self.assertEqual(other.active_nodes(now=60), 6)
+        self.assertTrue(self.queue.release(1, 'controller-2'))
+
+    def test_lease(self):
+        """Test that the lease is renewed while the benchmark runs and
+        released when it finishes.
+        """
+        self.queue.lease_ttl = 0.3
+        self.push(1, 6)
+        self.queue.admit()
+        with self.queue.lease(1):
+            time.sleep(0.5)
+            self.assertEqual(self.queue.active_nodes(), 6)
+        self.assertEqual(self.queue.active_nodes(), 0)
+        self.assertEqual(self.queue.leases(), {})
+
+    def test_lease_lost(self):
+        """Test that the run is told when its lease is taken by another
+        controller.
+        """
+        self.queue.lease_ttl = 0.3
+        self.push(1, 6)
+        self.queue.admit()
+        on_lost = threading.Event()
+        with self.queue.lease(1, on_lost=on_lost.set) as lost:
+            self.connection.hdel(self.queue.running_name, 1)
+            self.assertTrue(on_lost.wait(1))
+            self.assertTrue(lost.is_set())
+
+    def test_lease_lost_to_errors(self):
+        """Test that the lease is treated as lost once it could not be
+        renewed for longer than it lasts.
+        """
+        self.queue.lease_ttl = 0.3
+        self.push(1, 6)
+        self.queue.admit()
+        with mock.patch.object(
+            self.queue,
+            'renew',
+            side_effect=redis.ConnectionError
+        ):
+            with self.queue.lease(1) as lost:
+                self.assertFalse(lost.wait(0.2))
+                self.assertTrue(lost.wait(1))
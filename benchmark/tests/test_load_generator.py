@@ -0,0 +1,261 @@
+"""Unittests for the load_generator module."""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import load_generator
+from histogram import LatencyHistogram
+from tests.utils import start_http_server
+
+
+async def read_responses(
+    response: bytes,
+    num_responses: int,
+    close: bool = False
+) -> list:
+    """Serves a canned response on a local server and reads it back.
+    Args:
+        response: Bytes the server sends as soon as a client connects
+        num_responses: Number of responses to read
+        close: Whether the server closes the connection after sending
+    Returns:
+        list: The status and keep alive flag of each response, followed by
+            whether the stream was read to its end.
+    """
+    served = []
+
+    async def handle(reader, writer):
+        served.append(writer)
+        writer.write(response)
+        await writer.drain()
+        if close:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        results = [
+            await load_generator._read_response(reader)
+            for _ in range(num_responses)
+        ]
+        return results + [reader.at_eof()]
+    finally:
+        writer.close()
+        for served_writer in served:
+            served_writer.close()
+        server.close()
+        await server.wait_closed()
+
+
+class CountingServer:
+    """Answers pipelined requests, counting each one, and closes the
+    connection after every `close_every` responses.
+    """
+
+    def __init__(self, close_every: int = 0):
+        self.close_every = close_every
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        answered = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            self.requests += 1
+            answered += 1
+            close = self.close_every and answered % self.close_every == 0
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Length: 2\r\n'
+                + (b'Connection: close\r\n' if close else b'')
+                + b'\r\nok'
+            )
+            await writer.drain()
+            if close:
+                break
+        writer.close()
+
+    async def run(self, num_requests: int, **kwargs):
+        """Runs the load generator against the server."""
+        server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await load_generator.run(
+                f'http://127.0.0.1:{port}/',
+                num_requests,
+                timeout=5,
+                **kwargs
+            )
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+class TestReadResponse(unittest.TestCase):
+    """Unittests for the _read_response function."""
+
+    def test_content_length(self):
+        """Test that a body framed by its length is read exactly, leaving the
+        next response on the stream.
+        """
+        response = (
+            b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello'
+            b'HTTP/1.1 404 Not Found\r\ncontent-length: 0\r\n\r\n'
+        )
+        self.assertEqual(
+            asyncio.run(read_responses(response, 2)),
+            [(200, True), (404, True), False]
+        )
+
+    def test_chunked(self):
+        """Test that a chunked body is read up to its last chunk, including
+        chunk extensions and trailers.
+        """
+        response = (
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'5;name=value\r\nhello\r\n6\r\n world\r\n0\r\n'
+            b'Trailer: value\r\n\r\n'
+            b'HTTP/1.1 204 No Content\r\n\r\n'
+        )
+        self.assertEqual(
+            asyncio.run(read_responses(response, 2)),
+            [(200, True), (204, True), False]
+        )
+
+    def test_close_delimited(self):
+        """Test that a body without framing is read until the connection
+        closes, and the connection is not reused.
+        """
+        response = b'HTTP/1.1 200 OK\r\n\r\n' + b'x' * 100000
+        self.assertEqual(
+            asyncio.run(read_responses(response, 1, close=True)),
+            [(200, False), True]
+        )
+
+    def test_connection_close(self):
+        """Test that a response asking for the connection to be closed is
+        not reused.
+        """
+        response = (
+            b'HTTP/1.1 200 OK\r\nConnection: close\r\n'
+            b'Content-Length: 2\r\n\r\nok'
+        )
+        self.assertEqual(
+            asyncio.run(read_responses(response, 1)),
+            [(200, False), False]
+        )
+
+    def test_informational(self):
+        """Test that an informational response is skipped."""
+        response = (
+            b'HTTP/1.1 100 Continue\r\n\r\n'
+            b'HTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n'
+        )
+        self.assertEqual(
+            asyncio.run(read_responses(response, 1)),
+            [(201, True), False]
+        )
+
+    def test_closed_mid_response(self):
+        """Test that a connection closed part way through a body raises."""
+        response = b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nhello'
+        with self.assertRaises(ConnectionError):
+            asyncio.run(read_responses(response, 1, close=True))
+
+
+class TestRequestCounter(unittest.TestCase):
+    """Unittests for the RequestCounter class."""
+
+    def test_claim(self):
+        """Test that no more requests are claimed than are left, and that
+        released requests can be claimed again.
+        """
+        counter = load_generator.RequestCounter(5)
+        self.assertEqual(counter.claim(3), 3)
+        self.assertEqual(counter.claim(3), 2)
+        self.assertEqual(counter.claim(3), 0)
+        counter.release(1)
+        self.assertEqual(counter.claim(3), 1)
+
+    def test_exact_requests(self):
+        """Test that several workers pipelining requests send exactly the
+        number of requests asked for.
+        """
+        server = CountingServer()
+        stats = asyncio.run(server.run(103, concurrency=4, pipeline=5))
+        self.assertEqual(server.requests, 103)
+        self.assertEqual(stats.complete_requests, 103)
+        self.assertEqual(stats.failed_requests, 0)
+
+    def test_exact_requests_connection_close(self):
+        """Test that requests pipelined behind a response which closes the
+        connection are sent again, so exactly the number asked for are
+        answered.
+        """
+        server = CountingServer(close_every=3)
+        stats = asyncio.run(server.run(50, concurrency=3, pipeline=4))
+        self.assertEqual(stats.complete_requests, 50)
+        self.assertEqual(stats.failed_requests, 0)
+        self.assertEqual(server.requests, 50)
+
+
+class TestRun(unittest.TestCase):
+    """Unittests for running the load generator and writing its results."""
+
+    def setUp(self):
+        self.server = start_http_server()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+
+    def test_results(self):
+        """Test that a run writes results with its histogram, time series
+        and start time.
+        """
+        results_fp = os.path.join(self.tmp_dir, 'results.json')
+        summary_fp = os.path.join(self.tmp_dir, 'results.txt')
+        started = time.time()
+        self.assertEqual(load_generator.main([
+            '-n', '20',
+            '-c', '2',
+            '-p', '2',
+            '-o', results_fp,
+            '-s', summary_fp,
+            self.url,
+        ]), 0)
+        with open(results_fp) as f:
+            results = json.load(f)
+
+        self.assertEqual(results['complete_requests'], 20)
+        self.assertEqual(results['failed_requests'], 0)
+        self.assertAlmostEqual(results['started_at'], started, delta=5)
+        self.assertEqual(
+            len(LatencyHistogram.from_dict(results['histogram'])),
+            20
+        )
+        timeseries = results['timeseries']
+        self.assertEqual(timeseries['start'], int(results['started_at']))
+        self.assertEqual(sum(timeseries['requests']), 20)
+        self.assertEqual(sum(timeseries['errors']), 0)
+        self.assertTrue(os.path.exists(summary_fp))
+        self.assertFalse(os.path.exists(f'{results_fp}.tmp'))
+
+    def test_unreachable(self):
+        """Test that requests to a server which cannot be reached are
+        counted as failed.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        stats = asyncio.run(load_generator.run(self.url, 6, concurrency=2))
+        self.assertEqual(stats.complete_requests, 0)
+        self.assertEqual(stats.failed_requests, 6)
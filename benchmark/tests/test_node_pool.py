@@ -0,0 +1,167 @@
+"""Unittests for the node_pool module."""
+
+import unittest
+from node_pool import NodePool
+
+
+class StandInInstance:
+    """Stands in for an EC2 instance."""
+
+    def __init__(self, instance_id: int):
+        self.id = instance_id
+        self.public_ip_address = f'10.0.0.{instance_id}'
+        self.running = True
+        self.terminated = False
+
+
+class StandInProvider:
+    """Provider which creates stand in instances rather than calling AWS."""
+
+    def __init__(self):
+        self.created = []
+        self.terminated = []
+
+    def create_instances(self, num_instances: int = 1):
+        instances = [
+            StandInInstance(len(self.created) + i)
+            for i in range(num_instances)
+        ]
+        self.created += instances
+        return instances
+
+    def terminate_instances(self, instances):
+        for instance in instances:
+            instance.terminated = True
+        self.terminated += instances
+
+    def instance_running(self, instance) -> bool:
+        return instance.running
+
+
+class Clock:
+    """Clock which only moves when told to."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNodePool(unittest.TestCase):
+    """Unittests for the NodePool class."""
+
+    def setUp(self):
+        self.provider = StandInProvider()
+        self.clock = Clock()
+        self.pool = NodePool(
+            self.provider,
+            size=3,
+            idle_ttl=60,
+            clock=self.clock
+        )
+
+    def test_lease_creates_missing_instances(self):
+        """Test that an empty pool creates the instances leased."""
+        instances = self.pool.lease(2)
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(len(self.provider.created), 2)
+
+    def test_release_keeps_instances_warm(self):
+        """Test that released instances are reused by the next lease."""
+        instances = self.pool.lease(2)
+        self.pool.release(instances)
+
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(self.provider.terminated, [])
+        self.assertCountEqual(self.pool.lease(2), instances)
+        self.assertEqual(len(self.provider.created), 2)
+
+    def test_lease_tops_up_from_provider(self):
+        """Test that a lease larger than the pool creates the shortfall."""
+        self.pool.release(self.pool.lease(1))
+        instances = self.pool.lease(3)
+
+        self.assertEqual(len(instances), 3)
+        self.assertEqual(len(self.provider.created), 3)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_lease_pipelined(self):
+        """Test that warm instances are leased as ready and the shortfall is
+        launched for setting up when the provider supports it.
+        """
+        warm = self.pool.lease(1)
+        self.pool.release(warm)
+        self.provider.launch_instances = self.provider.create_instances
+        ready, launched = self.pool.lease_pipelined(3)
+
+        self.assertEqual(ready, warm)
+        self.assertEqual(len(launched), 2)
+
+    def test_lease_pipelined_without_launch(self):
+        """Test that every instance is ready when the provider can only
+        create instances in full.
+        """
+        ready, launched = self.pool.lease_pipelined(2)
+        self.assertEqual(len(ready), 2)
+        self.assertEqual(launched, [])
+
+    def test_release_terminates_surplus(self):
+        """Test that instances beyond the pool size are terminated."""
+        instances = self.pool.lease(5)
+        self.pool.release(instances)
+
+        self.assertEqual(len(self.pool), 3)
+        self.assertEqual(len(self.provider.terminated), 2)
+
+    def test_size_zero_terminates_everything(self):
+        """Test that a pool of size zero behaves like no pool at all."""
+        pool = NodePool(self.provider, size=0)
+        pool.release(pool.lease(2))
+
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(len(self.provider.terminated), 2)
+
+    def test_lease_skips_stopped_instances(self):
+        """Test that idle instances which stopped running are terminated and
+        replaced.
+        """
+        instances = self.pool.lease(2)
+        self.pool.release(instances)
+        instances[0].running = False
+
+        leased = self.pool.lease(2)
+        self.assertNotIn(instances[0], leased)
+        self.assertIn(instances[0], self.provider.terminated)
+        self.assertEqual(len(leased), 2)
+
+    def test_reap_recycles_idle_instances(self):
+        """Test that instances idle past the TTL are terminated and the pool
+        is topped back up with fresh instances.
+        """
+        self.pool.release(self.pool.lease(2))
+        self.clock.now = 30
+        recently_used = self.pool.lease(1)
+        self.pool.release(recently_used)
+        self.clock.now = 61
+
+        self.pool.maintain()
+        self.assertEqual(len(self.provider.terminated), 1)
+        self.assertNotIn(recently_used[0], self.provider.terminated)
+        self.assertEqual(len(self.pool), 3)
+        self.assertTrue(all(
+            not instance.terminated
+            for instance in self.pool.idle_instances()
+        ))
+
+    def test_drain(self):
+        """Test that draining terminates every idle instance."""
+        self.pool.replenish()
+        self.pool.drain()
+
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(len(self.provider.terminated), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
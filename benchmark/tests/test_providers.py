@@ -0,0 +1,105 @@
+"""Unittests for the providers module."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import providers
+from control_channel import ControlServer
+from controller import SlaveNode
+from tests.utils import start_http_server
+
+
+class TestLocalProcessProvider(unittest.TestCase):
+    """Unittests for the LocalProcessProvider class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_http_server()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/'
+
+        cls.control_server = ControlServer('127.0.0.1', 0, 'secret').start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.control_server.stop()
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(providers, 'RESULTS_DIR', self.results_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.results_dir, True)
+
+        self.provider = providers.LocalProcessProvider(self.control_server)
+        self.instances = self.provider.create_instances(num_instances=2)
+        self.addCleanup(self.provider.terminate_instances, self.instances)
+
+    def test_create_instances(self):
+        """Test that each instance has its own host and work directory and
+        that its agent connects to the control server.
+        """
+        hosts = {self.provider.host(instance) for instance in self.instances}
+        self.assertEqual(len(hosts), 2)
+        for instance in self.instances:
+            self.assertTrue(os.path.isdir(instance.work_dir))
+        self.provider.wait_until_ready(self.instances)
+        self.assertTrue(hosts.issubset(self.control_server.agents))
+
+    def test_terminate_instances(self):
+        """Test that terminating an instance stops its agent and removes its
+        work directory.
+        """
+        self.provider.terminate_instances(self.instances)
+        for instance in self.instances:
+            self.assertFalse(self.provider.instance_running(instance))
+            self.assertFalse(os.path.exists(instance.work_dir))
+
+    def test_fetch_results_before_run(self):
+        """Test that fetching results before a run has finished fails."""
+        self.provider.wait_until_ready(self.instances)
+        self.assertNotEqual(self.provider.fetch_results(self.instances[0]), 0)
+
+    def test_benchmark(self):
+        """Test that each node's agent runs the load generator and streams
+        its results back to the results directory.
+        """
+        nodes = [
+            SlaveNode(instance, self.provider) for instance in self.instances
+        ]
+        self.provider.wait_until_ready(self.instances)
+        # A job which arrives after its start time is rejected.
+        start = datetime.now() + timedelta(seconds=0.5)
+        for node in nodes:
+            node.schedule_benchmark(start, 20, self.url, 2)
+
+        for node in nodes:
+            self.assertEqual(
+                self.provider.fetch_results(node.instance, timeout=30),
+                0
+            )
+            with open(providers.results_path(node.host)) as f:
+                results = json.load(f)
+            self.assertEqual(results['complete_requests'], 20)
+            self.assertEqual(results['failed_requests'], 0)
+
+
+class TestGetProvider(unittest.TestCase):
+    """Unittests for the get_provider function."""
+
+    def test_local(self):
+        """Test that the local provider is returned by name."""
+        self.assertIsInstance(
+            providers.get_provider('local'),
+            providers.LocalProcessProvider
+        )
+
+    def test_unknown(self):
+        """Test that an unknown provider raises an error."""
+        with self.assertRaises(ValueError):
+            providers.get_provider('unknown')
@@ -0,0 +1,174 @@
+"""Unittests for the site_api module."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import jwt
+import site_api
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Records the messages posted to it, failing while the site is down and
+    for the paths given an error status.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.connections.add(self.client_address)
+        response = b''
+        if self.server.down:
+            status = 503
+        elif self.server.statuses.get(self.path):
+            # A list of statuses is responded with in turn.
+            status = self.server.statuses[self.path]
+            if isinstance(status, list):
+                status = status.pop(0)
+        else:
+            status = 200
+            token = json.loads(body)['token']
+            payload = jwt.decode(token, 'secret', algorithms=['HS256'])
+            self.server.messages.append((self.path, payload))
+            response = json.dumps({'success': True}).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSiteAPIClient(unittest.TestCase):
+    """Unittests for the SiteAPIClient class."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SiteHandler)
+        self.server.down = False
+        self.server.messages = []
+        self.server.connections = set()
+        self.server.statuses = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.outbox_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.outbox_dir, True)
+        self.dead_letter_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dead_letter_dir, True)
+        mock.patch.dict(os.environ, {'JWT_SECRET_KEY': 'secret'}).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.client = site_api.SiteAPIClient(
+            domain=f'http://127.0.0.1:{self.server.server_address[1]}',
+            outbox_dir=self.outbox_dir,
+            dead_letter_dir=self.dead_letter_dir,
+            batch_interval=60,
+            max_retries=1,
+            backoff_factor=0,
+            max_outbox_attempts=2,
+        )
+        self.addCleanup(self.client.session.close)
+
+    def test_keep_alive(self):
+        """Test that every message goes over the same connection."""
+        for i in range(3):
+            self.assertTrue(self.client.post('/path/', {'n': i}))
+        self.assertEqual(len(self.server.messages), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_outbox(self):
+        """Test that a message which could not be delivered is sent before
+        the next message once the site is back.
+        """
+        self.server.down = True
+        self.assertFalse(self.client.post('/path/', {'n': 1}))
+        self.assertEqual(len(os.listdir(self.outbox_dir)), 1)
+
+        self.server.down = False
+        self.assertTrue(self.client.post('/path/', {'n': 2}))
+        self.assertEqual(
+            [payload['n'] for _, payload in self.server.messages],
+            [1, 2]
+        )
+        self.assertEqual(os.listdir(self.outbox_dir), [])
+
+    def test_rejected_message(self):
+        """Test that a message the site rejects is moved to the dead letter
+        directory rather than the outbox, so later messages are still
+        delivered.
+        """
+        self.server.statuses['/internal-api/benchmark-timeseries/'] = 400
+        self.assertFalse(
+            self.client.post('/internal-api/benchmark-timeseries/', {'n': 1})
+        )
+        self.assertEqual(os.listdir(self.outbox_dir), [])
+        self.assertEqual(len(os.listdir(self.dead_letter_dir)), 1)
+
+        self.assertTrue(self.client.post('/path/', {'n': 2}))
+        self.assertTrue(self.client.post('/path/', {'n': 3}))
+        self.assertEqual(
+            [payload['n'] for _, payload in self.server.messages],
+            [2, 3]
+        )
+
+    def test_server_error(self):
+        """Test that a message the site fails on with a server error is
+        retried, and kept in the outbox if it keeps failing.
+        """
+        self.server.statuses['/path/'] = [500]
+        self.assertTrue(self.client.post('/path/', {'n': 1}))
+        self.assertEqual(self.server.messages, [('/path/', {'n': 1})])
+
+        self.server.statuses['/path/'] = [500, 500]
+        self.assertFalse(self.client.post('/path/', {'n': 2}))
+        self.assertEqual(len(os.listdir(self.outbox_dir)), 1)
+        self.assertEqual(os.listdir(self.dead_letter_dir), [])
+        self.assertTrue(self.client.flush_outbox())
+        self.assertEqual(
+            [payload['n'] for _, payload in self.server.messages],
+            [1, 2]
+        )
+
+    def test_outbox_attempts(self):
+        """Test that a message is moved from the outbox to the dead letter
+        directory once it has been tried the most times allowed.
+        """
+        self.server.down = True
+        self.assertFalse(self.client.post('/path/', {'n': 1}))
+        self.assertFalse(self.client.flush_outbox())
+        self.assertEqual(len(os.listdir(self.outbox_dir)), 1)
+
+        self.assertTrue(self.client.flush_outbox())
+        self.assertEqual(os.listdir(self.outbox_dir), [])
+        [name] = os.listdir(self.dead_letter_dir)
+        with open(os.path.join(self.dead_letter_dir, name)) as f:
+            message = json.load(f)
+        self.assertEqual(message['payload'], {'n': 1})
+        self.assertEqual(message['attempts'], 2)
+
+    def test_batch_progress(self):
+        """Test that progress updates are coalesced into one request which
+        keeps the latest status of each benchmark.
+        """
+        self.client.queue_progress(1, 1)
+        self.client.queue_progress(1, 2)
+        self.client.queue_progress(2, 1)
+        self.client.flush()
+
+        self.assertEqual(self.server.messages, [(
+            '/internal-api/benchmark-batch/',
+            {
+                'progress': [
+                    {'benchmark_id': 1, 'status': 2},
+                    {'benchmark_id': 2, 'status': 1},
+                ],
+                'results': [],
+            }
+        )])
@@ -0,0 +1,95 @@
+"""Unittests for the timeseries module."""
+
+import json
+import unittest
+from timeseries import ThroughputSeries
+
+
+def series(start: int, requests: list) -> ThroughputSeries:
+    """Returns a series with the given number of requests in each second,
+    each taking 10 microseconds and every other one failing.
+    """
+    result = ThroughputSeries(start)
+    for slot, num_requests in enumerate(requests):
+        for i in range(num_requests):
+            result.record(start + slot + 0.5, 10, i % 2 == 1)
+    return result
+
+
+class TestThroughputSeries(unittest.TestCase):
+    """Unittests for the ThroughputSeries class."""
+
+    def test_record(self):
+        """Test that values are bucketed by the second they were recorded,
+        counting values from before the start in the first slot.
+        """
+        result = ThroughputSeries(100)
+        result.record(99.5, 5)
+        result.record(100.2, 10, error=True)
+        result.record(102.9, 20)
+        result.record_failures(102.1, 3)
+        self.assertEqual(result.to_dict(), {
+            'start': 100,
+            'requests': [2, 0, 1],
+            'errors': [1, 0, 3],
+            'latency_sum': [15, 0, 20],
+        })
+
+    def test_merge_later(self):
+        """Test that a series starting later is added at its offset, growing
+        the series.
+        """
+        result = series(100, [1, 2]).merge(series(101, [3, 0, 4]))
+        self.assertEqual(result.start, 100)
+        self.assertEqual(result.requests.tolist(), [1, 5, 0, 4])
+        self.assertEqual(result.errors.tolist(), [0, 2, 0, 2])
+        self.assertEqual(result.latency_sum.tolist(), [10, 50, 0, 40])
+
+    def test_merge_earlier(self):
+        """Test that merging a series starting earlier moves the start back,
+        keeping each value in its own second.
+        """
+        result = series(102, [1, 2]).merge(series(100, [3]))
+        self.assertEqual(result.start, 100)
+        self.assertEqual(result.requests.tolist(), [3, 0, 1, 2])
+        self.assertEqual(result.errors.tolist(), [1, 0, 0, 1])
+        self.assertEqual(result.latency_sum.tolist(), [30, 0, 10, 20])
+
+    def test_merge_gap(self):
+        """Test that a series starting after the end of the series is merged
+        with empty seconds in between.
+        """
+        result = series(100, [1]).merge(series(103, [2]))
+        self.assertEqual(result.requests.tolist(), [1, 0, 0, 2])
+
+    def test_merge_empty(self):
+        """Test that merging an empty series changes nothing, and merging
+        into an empty series copies the other series.
+        """
+        result = series(100, [1, 2]).merge(ThroughputSeries())
+        self.assertEqual(result.start, 100)
+        self.assertEqual(result.requests.tolist(), [1, 2])
+
+        result = ThroughputSeries().merge(series(100, [1, 2]))
+        self.assertEqual(result.start, 100)
+        self.assertEqual(result.requests.tolist(), [1, 2])
+
+        # A series with a start but no values only moves the start back.
+        result = series(100, [1]).merge(ThroughputSeries(98))
+        self.assertEqual(result.start, 98)
+        self.assertEqual(result.requests.tolist(), [0, 0, 1])
+
+    def test_round_trip(self):
+        """Test that a series is unchanged by serialising it to JSON and
+        back.
+        """
+        original = series(100, [3, 0, 2])
+        original.latency_sum[0] = 2 ** 40
+        data = json.loads(json.dumps(original.to_dict()))
+        result = ThroughputSeries.from_dict(data)
+        self.assertEqual(result.to_dict(), original.to_dict())
+        self.assertEqual(result.latency_sum.typecode, 'Q')
+
+        empty = ThroughputSeries.from_dict(ThroughputSeries().to_dict())
+        self.assertIsNone(empty.start)
+        self.assertEqual(len(empty), 0)
@@ -0,0 +1,27 @@
+"""Helpers shared by the unittests."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Responds to every request with a small body."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'hello world'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server() -> ThreadingHTTPServer:
+    """Starts a local HTTP server to benchmark in a background thread."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
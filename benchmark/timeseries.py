@@ -0,0 +1,128 @@
+"""Per-second throughput counters recorded during a benchmark run.
+
+Each node keeps three parallel arrays of counters, one slot per second of the
+run: the number of responses received, the number of those that failed and
+the sum of their latencies in microseconds. The arrays are indexed by the
+number of seconds since `start`, an epoch timestamp in whole seconds, so
+series from different nodes can be merged by aligning them on `start`.
+
+This module only depends on the standard library as it is copied onto the
+nodes alongside `load_generator.py`.
+"""
+
+import typing as _t
+from array import array
+
+
+class ThroughputSeries:
+    """Requests, errors and latency sums bucketed into one second slots."""
+
+    def __init__(self, start: _t.Optional[int] = None):
+        """Creates an empty series.
+        Args:
+            start (int): Epoch second of the first slot. Defaults to the
+                second of the first value recorded.
+        """
+        self.start = start
+        self.requests = array('I')
+        self.errors = array('I')
+        self.latency_sum = array('Q')
+
+    def __len__(self):
+        """Returns the number of seconds covered by the series."""
+        return len(self.requests)
+
+    def _slot(self, ts: float) -> int:
+        """Returns the slot for a timestamp, growing the arrays if needed.
+        Args:
+            ts (float): Epoch timestamp
+        Returns:
+            int: Index of the slot
+        """
+        second = int(ts)
+        if self.start is None:
+            self.start = second
+        elif second < self.start:
+            # Values recorded before the start are counted in the first slot.
+            second = self.start
+        slot = second - self.start
+        missing = slot + 1 - len(self.requests)
+        if missing > 0:
+            self.requests.extend([0] * missing)
+            self.errors.extend([0] * missing)
+            self.latency_sum.extend([0] * missing)
+        return slot
+
+    def record(self, ts: float, latency: int, error: bool = False) -> None:
+        """Records a response.
+        Args:
+            ts (float): Epoch timestamp the response was received
+            latency (int): Latency of the response in microseconds
+            error (bool): Whether the response was an error
+        """
+        slot = self._slot(ts)
+        self.requests[slot] += 1
+        self.latency_sum[slot] += latency
+        if error:
+            self.errors[slot] += 1
+
+    def record_failures(self, ts: float, num_requests: int) -> None:
+        """Records requests which failed without a response.
+        Args:
+            ts (float): Epoch timestamp of the failure
+            num_requests (int): Number of requests which failed
+        """
+        slot = self._slot(ts)
+        self.errors[slot] += num_requests
+
+    def merge(self, other: 'ThroughputSeries') -> 'ThroughputSeries':
+        """Adds the counters of another series into this one, aligning the
+        two series on their start time.
+        Args:
+            other (ThroughputSeries): Series to merge in
+        Returns:
+            ThroughputSeries: This series
+        """
+        if other.start is None:
+            return self
+        if self.start is None:
+            self.start = other.start
+        elif other.start < self.start:
+            # Prepend empty slots so that both series share the same start.
+            shift = self.start - other.start
+            self.requests = array('I', [0] * shift) + self.requests
+            self.errors = array('I', [0] * shift) + self.errors
+            self.latency_sum = array('Q', [0] * shift) + self.latency_sum
+            self.start = other.start
+
+        offset = other.start - self.start
+        if len(other):
+            self._slot(self.start + offset + len(other) - 1)
+        for i in range(len(other)):
+            self.requests[offset + i] += other.requests[i]
+            self.errors[offset + i] += other.errors[i]
+            self.latency_sum[offset + i] += other.latency_sum[i]
+        return self
+
+    def to_dict(self) -> _t.Dict[str, _t.Any]:
+        """Serialises the series."""
+        return {
+            'start': self.start,
+            'requests': self.requests.tolist(),
+            'errors': self.errors.tolist(),
+            'latency_sum': self.latency_sum.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: _t.Dict[str, _t.Any]) -> 'ThroughputSeries':
+        """Creates a series from the output of `to_dict`.
+        Args:
+            data (dict): Serialised series
+        Returns:
+            ThroughputSeries: The deserialised series
+        """
+        series = cls(data['start'])
+        series.requests = array('I', data['requests'])
+        series.errors = array('I', data['errors'])
+        series.latency_sum = array('Q', data['latency_sum'])
+        return series
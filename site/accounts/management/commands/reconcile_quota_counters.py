@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from ... import models as account_models
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the quota counter of each account from its package history '
+        'and benchmarks, fixing any which have drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account',
+            type=int,
+            action='append',
+            help='ID of an account to reconcile. Defaults to every account.'
+        )
+
+    def handle(self, *args, **options):
+        accounts = account_models.Account.objects.select_related('package')
+        if options['account']:
+            accounts = accounts.filter(id__in=options['account'])
+
+        reconciled = drifted = 0
+        for account in accounts.iterator():
+            before = account.quota_counters.first()
+            after = account.reconcile_quota()
+            reconciled += 1
+            if before is None or (before.pk, before.quota, before.used) != (
+                after.pk,
+                after.quota,
+                after.used,
+            ):
+                drifted += 1
+        self.stdout.write(
+            f'Reconciled {reconciled} accounts, {drifted} had drifted'
+        )
@@ -1,15 +1,95 @@
+import typing as _t
+import uuid
+from django.core import serializers
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
 from django.http import HttpRequest, HttpResponse
+from django.utils.functional import SimpleLazyObject
+from packages import models as package_models
 from . import models as account_models
 
+# The account and its package are kept in the session under this key, along
+# with the versions they were loaded at.
+SESSION_KEY = '_account'
+
+
+def account_version_key(user_id: int) -> str:
+    """Return the cache key holding the version of a user's account."""
+    return f'account_version_{user_id}'
+
+
+def invalidate_account(user_id: int) -> None:
+    """Make every session reload a user's account on its next request."""
+    cache.delete(account_version_key(user_id))
+
+
+def _version(key: str, versions: dict) -> str:
+    """Return the version held in the cache under a key, starting a new
+    version if there is none.
+    """
+    version = versions.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key) or version
+    return version
+
+
+def get_account(
+    request: HttpRequest
+) -> _t.Optional[account_models.Account]:
+    """Return the account of the logged in user with its package.
+
+    The account is kept in the session and only loaded from the database, in
+    one query joined to its package, when the account or any package has
+    changed since it was kept. Changes are tracked by versions held in the
+    cache, which are dropped when an account gets a new package and when a
+    package is saved.
+    """
+    keys = [
+        account_version_key(request.user.id),
+        package_models.Package.VERSION_CACHE_KEY,
+    ]
+    versions = cache.get_many(keys)
+    cached = request.session.get(SESSION_KEY)
+    if (
+        cached is not None
+        and all(versions.get(key) for key in keys)
+        and cached['versions'] == [versions[key] for key in keys]
+    ):
+        account, package = (
+            obj.object
+            for obj in serializers.deserialize('json', cached['objects'])
+        )
+        for obj in (account, package):
+            obj._state.adding = False
+            obj._state.db = DEFAULT_DB_ALIAS
+        account.package = package
+        account.user = request.user
+        return account
+
+    versions = [_version(key, versions) for key in keys]
+    account = account_models.Account.objects.select_related(
+        'package'
+    ).filter(user=request.user).first()
+    if account is None:
+        request.session.pop(SESSION_KEY, None)
+        return None
+    request.session[SESSION_KEY] = {
+        'versions': versions,
+        'objects': serializers.serialize('json', [account, account.package]),
+    }
+    return account
+
 
 def account_middleware(get_response):
-    """If a user is logged in, add their account to the request."""
+    """If a user is logged in, add their account to the request. The account
+    is only loaded when it is first used.
+    """
 
     def middleware(request: HttpRequest) -> HttpResponse:
         if request.user and request.user.is_authenticated:
-            account = account_models.Account.objects.filter(
-                user=request.user
-            ).first()
+            account = SimpleLazyObject(lambda: get_account(request))
         else:
             account = None
         request.account = account
@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_billingaddress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('quota', models.PositiveIntegerField()),
+                ('used', models.PositiveIntegerField(default=0)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_counters', to='accounts.account')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='quotacounter',
+            constraint=models.UniqueConstraint(fields=('account', 'period_start'), name='unique_account_quota_period'),
+        ),
+    ]
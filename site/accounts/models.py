@@ -1,7 +1,8 @@
 import typing as _t
 from datetime import datetime, timedelta
 from django import dispatch
-from django.db import models
+from django.db import NotSupportedError, models, transaction
+from django.db.models.functions import Now
 from django.utils import timezone
 from django.contrib.auth.models import User
 from packages import models as package_models
@@ -10,7 +11,122 @@ from payments import model_mixins as payment_mixins
 NEW_ACCOUNT_PACKAGE = dispatch.Signal()
 
 
+def refresh_period_end(
+    created_on: datetime,
+    refresh_period: int,
+    now: datetime,
+) -> datetime:
+    """Returns the end of the refresh period which `now` falls in, for
+    periods of `refresh_period` days counted from `created_on`.
+
+    Args:
+        created_on: When the first period started.
+        refresh_period: Number of days in each period.
+        now: The time to find the period of.
+    """
+    if created_on >= now or refresh_period <= 0:
+        return created_on
+    period = timedelta(days=refresh_period)
+    # Rounds up the number of whole periods which have passed.
+    periods = -((created_on - now) // period)
+    return created_on + periods * period
+
+
+class RefreshPeriodEnd(models.Func):
+    """Database expression for `refresh_period_end`, to annotate querysets
+    with the end of the current refresh period without computing it for
+    each row in Python. Supported on PostgreSQL and SQLite.
+
+    Args:
+        created_on: When the first period started. Defaults to the
+            `created_on` field.
+        refresh_period: Number of days in each period. Defaults to the
+            `refresh_period` of the row's package.
+        now: The time to find the period of. Defaults to the database's
+            current time.
+        offset: Number of periods to move the result by, e.g. -1 for the
+            start of the current period.
+    """
+    output_field = models.DateTimeField()
+
+    def __init__(
+        self,
+        created_on='created_on',
+        refresh_period='package__refresh_period',
+        now=None,
+        offset: int = 0,
+        **extra
+    ):
+        if now is None:
+            now = Now()
+        elif isinstance(now, datetime):
+            now = models.Value(now, output_field=models.DateTimeField())
+        self.offset = int(offset)
+        super().__init__(created_on, refresh_period, now, **extra)
+
+    def compile_arguments(self, compiler, connection) -> _t.Tuple[
+        _t.List[str], _t.List[list]
+    ]:
+        """Compiles the created on, refresh period and now expressions."""
+        sqls, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.append(list(expression_params))
+        return sqls, params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        (created_on, period, now), (c, p, n) = self.compile_arguments(
+            compiler,
+            connection
+        )
+        sql = (
+            f'COALESCE({created_on} + (CEIL(GREATEST(EXTRACT(EPOCH FROM '
+            f'({now} - {created_on})), 0) / (NULLIF({period}, 0) * 86400.0))'
+            f' + %s) * {period} * INTERVAL \'1 day\', {created_on})'
+        )
+        return sql, (*c, *n, *c, *p, self.offset, *p, *c)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        (created_on, period, now), (c, p, n) = self.compile_arguments(
+            compiler,
+            connection
+        )
+        # Periods which have passed, as a fraction.
+        passed = (
+            f'(MAX(JULIANDAY({now}) - JULIANDAY({created_on}), 0) '
+            f'/ NULLIF({period}, 0))'
+        )
+        passed_params = (*n, *c, *p)
+        # SQLite has no CEIL before 3.35.
+        periods = (
+            f'(CAST({passed} AS INTEGER) '
+            f'+ ({passed} > CAST({passed} AS INTEGER)) + %s)'
+        )
+        periods_params = (*passed_params * 3, self.offset)
+        # Whole days are added, so the time of day stays as it is.
+        sql = (
+            f'COALESCE(DATE({created_on}, ({periods} * {period}) '
+            f'|| \' days\') || SUBSTR({created_on}, 11), {created_on})'
+        )
+        return sql, (*c, *periods_params, *p, *c, *c)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(
+            'RefreshPeriodEnd is only supported on PostgreSQL and SQLite.'
+        )
+
+
 class ActiveManager(models.Manager):
+    def with_refresh_period(self):
+        """Annotates each package history with the start and end of its
+        current refresh period.
+        """
+        return self.get_queryset().select_related('package').annotate(
+            refresh_period_end=RefreshPeriodEnd(),
+            refresh_period_start=RefreshPeriodEnd(offset=-1),
+        )
+
     def active(self):
         return self.get_queryset().filter(
             paid_on__isnull=False,
@@ -31,7 +147,9 @@ class Account(models.Model, payment_mixins.StripeCustomerMixin):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._package = self.package
+        # The ID is compared rather than the package so that creating an
+        # account does not load its package.
+        self._package_id = self.package_id
         self._expiry_date = self.expiry_date
 
     def __str__(self):
@@ -43,7 +161,7 @@ class Account(models.Model, payment_mixins.StripeCustomerMixin):
         """
         changed = any([
             not self.id,
-            self._package != self.package,
+            self._package_id != self.package_id,
             self._expiry_date != self.expiry_date,
         ])
         instance = super().save(*args, **kwargs)
@@ -69,30 +187,94 @@ class Account(models.Model, payment_mixins.StripeCustomerMixin):
         return self.package_history.latest('created_on')
 
     @property
-    def remaining_quota(self):
+    def remaining_quota(self) -> int:
         """Number of benchmarks that can be run before the next refresh."""
+        counter = self.quota_counter()
+        return counter.quota - counter.used
+
+    @property
+    def can_run_benchmark(self) -> bool:
+        """Determine if the account can run another benchmark."""
+        return self.remaining_quota > 0
+
+    def quota_counter(self) -> 'QuotaCounter':
+        """Returns the counter of the current quota period. The counter is
+        looked up in one query, and only rebuilt when it is missing or the
+        quota has changed since it was built as a package expired.
+        """
+        counter = self.quota_counters.filter(
+            period_start__lte=timezone.now()
+        ).first()
+        if counter is None or not counter.is_current:
+            counter = self.reconcile_quota()
+        return counter
+
+    def quota_period(self) -> _t.Tuple[
+        datetime, int, _t.Optional[datetime]
+    ]:
+        """Works out the current quota period from the package history.
+
+        Returns:
+            Tuple[datetime, int, Optional[datetime]]: When the period started,
+                the number of benchmarks allowed in it and when the quota
+                changes as a paid package expires.
+        """
         package_history = self.package_history.active()
 
         # Scenario where user does not have any paid packages. Thus, check
         # remaining quota on their free package.
         if not package_history:
-            return self.package.quota - self.benchmarks.filter(
-                created_on__gte=self.latest_history.created_on
-            ).count()
+            return self.latest_history.created_on, self.package.quota, None
 
         # Scenario where user has paid packages.
-        start_date = package_history.earliest('created_on').created_on
-        total_quota = package_history.aggregate(
-            models.Sum('package__quota')
-        )['package__quota__sum']
-        return total_quota - self.benchmarks.filter(
-            created_on__gte=start_date
-        ).count()
+        period = package_history.aggregate(
+            start=models.Min('created_on'),
+            quota=models.Sum('package__quota'),
+            valid_until=models.Min('expiry_date'),
+        )
+        return period['start'], period['quota'], period['valid_until']
 
-    @property
-    def can_run_benchmark(self) -> bool:
-        """Determine if the account can run another benchmark."""
-        return self.remaining_quota > 0
+    def reconcile_quota(self) -> 'QuotaCounter':
+        """Rebuilds the counter of the current quota period from the package
+        history and the benchmarks run in the period.
+
+        Returns:
+            QuotaCounter: The counter of the current period.
+        """
+        with transaction.atomic():
+            # Benchmarks are created holding the same lock, so none are
+            # created between counting them and committing the counter.
+            Account.lock_quota(self.pk)
+            counters = QuotaCounter.objects.filter(account=self)
+            period_start, quota, valid_until = self.quota_period()
+            # Drop any later periods, e.g. from a package history which was
+            # removed, so that this period is the current one.
+            counters.filter(period_start__gt=period_start).delete()
+            counter, _ = QuotaCounter.objects.update_or_create(
+                account=self,
+                period_start=period_start,
+                defaults={
+                    'quota': quota,
+                    'valid_until': valid_until,
+                    'used': self.benchmarks.filter(
+                        created_on__gte=period_start
+                    ).count(),
+                }
+            )
+        return counter
+
+    @classmethod
+    def lock_quota(cls, account_id: int) -> None:
+        """Lock the row of an account until the end of the transaction, so
+        that benchmarks are not created while its quota counter is rebuilt.
+        Must be called inside `transaction.atomic()`.
+
+        Args:
+            account_id: ID of the account to lock.
+        """
+        list(cls.objects.select_for_update().filter(
+            pk=account_id
+        ).values_list('pk', flat=True))
 
     @classmethod
     def new_free_account(cls, user: User):
@@ -135,17 +317,16 @@ class PackageHistory(models.Model):
 
     @property
     def refresh_period_end_on(self) -> datetime:
-        """Returns the end date of the curren   t cycle before the benchmark
-        quota refreshes.
+        """Returns the end date of the current cycle before the benchmark
+        quota refreshes. This is the first whole number of refresh periods
+        after `created_on` which is not before now, see `RefreshPeriodEnd`
+        to work it out in the database.
         """
-        today = timezone.now()
-        focus_date = self.created_on
-        refresh_period = self.package.refresh_period
-
-        while focus_date < today:
-            focus_date += timedelta(days=refresh_period)
-
-        return focus_date
+        return refresh_period_end(
+            self.created_on,
+            self.package.refresh_period,
+            timezone.now()
+        )
 
     def __str__(self):
         fmt = '%Y-%m-%d'
@@ -170,6 +351,65 @@ class PackageHistory(models.Model):
         return rec
 
 
+class QuotaCounter(models.Model):
+    """Number of benchmarks an account has run in a quota period. It is kept
+    up to date as benchmarks are created, so the quota of an account can be
+    checked without counting its benchmarks.
+    """
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name='quota_counters'
+    )
+    period_start = models.DateTimeField()
+    quota = models.PositiveIntegerField()
+    used = models.PositiveIntegerField(default=0)
+    # When the quota changes as the first of the paid packages expires.
+    valid_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'period_start'],
+                name='unique_account_quota_period'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.account} - {self.used}/{self.quota}'
+
+    @property
+    def is_current(self) -> bool:
+        """Whether the quota still holds."""
+        return self.valid_until is None or self.valid_until > timezone.now()
+
+    @classmethod
+    def record_benchmark(cls, account_id: int, created_on: datetime) -> bool:
+        """Counts a new benchmark against the quota period it was created in.
+        The counter is incremented in the database, so benchmarks created at
+        the same time are all counted. It must be called in the transaction
+        which creates the benchmark, after locking the account with
+        `Account.lock_quota`, so that a counter rebuilt at the same time
+        counts the benchmark exactly once.
+
+        Args:
+            account_id: ID of the account which requested the benchmark.
+            created_on: When the benchmark was created.
+
+        Returns:
+            bool: True if a counter was incremented. If the account has no
+                counter yet, it is built the next time the quota is checked.
+        """
+        period = cls.objects.filter(
+            account_id=account_id,
+            period_start__lte=created_on
+        ).values('pk')[:1]
+        return bool(cls.objects.filter(pk=models.Subquery(period)).update(
+            used=models.F('used') + 1
+        ))
+
+
 class BillingAddress(models.Model, payment_mixins.StripeAddressMixin):
     """Represents the billing address of an account."""
     account = models.OneToOneField(Account, on_delete=models.CASCADE)
@@ -1,7 +1,10 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
+from django.db.models import Q
+from packages import models as package_models
 from . import models as accounts_models
+from .middleware import invalidate_account
 
 
 @receiver(post_save, sender=User)
@@ -15,11 +18,52 @@ def on_new_account_package(
     instance: accounts_models.Account,
     **kwargs
 ):
-    """Create a new package history record."""
+    """Create a new package history record and drop the account kept in
+    the user's sessions.
+    """
     accounts_models.PackageHistory.new_package_history(instance)
+    invalidate_account(instance.user_id)
 
 
 accounts_models.NEW_ACCOUNT_PACKAGE.connect(
     on_new_account_package,
     accounts_models.Account,
 )
+
+
+@receiver(post_save, sender=accounts_models.PackageHistory)
+def on_package_history_saved(
+    sender,
+    instance: accounts_models.PackageHistory,
+    **kwargs
+):
+    """Rebuild the quota counter of the account as its quota may have
+    changed.
+    """
+    instance.account.reconcile_quota()
+
+
+@receiver(post_delete, sender=accounts_models.PackageHistory)
+def on_package_history_deleted(
+    sender,
+    instance: accounts_models.PackageHistory,
+    **kwargs
+):
+    """Drop the quota counters of the account, they are rebuilt the next
+    time the quota is checked. They are not rebuilt here as the account may
+    be being deleted.
+    """
+    accounts_models.QuotaCounter.objects.filter(
+        account_id=instance.account_id
+    ).delete()
+
+
+@receiver(post_save, sender=package_models.Package)
+def on_package_saved(sender, instance: package_models.Package, **kwargs):
+    """Drop the quota counters of the accounts with the package as its quota
+    may have changed. They are rebuilt the next time the quota is checked.
+    """
+    accounts_models.QuotaCounter.objects.filter(
+        Q(account__package=instance)
+        | Q(account__package_history__package=instance)
+    ).delete()
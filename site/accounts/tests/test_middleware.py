@@ -0,0 +1,81 @@
+"""Unittests for the accounts middleware."""
+
+from datetime import date
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core_functions.py.unittest_helpers import get_user
+from packages import models as package_models
+from .. import middleware
+from .. import models as account_models
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}})
+class TestAccountMiddleware(TestCase):
+    """Unittests for the ``account_middleware``."""
+
+    def setUp(self) -> None:
+        self.user = get_user()
+        self.client.force_login(self.user)
+
+    def get_account(self) -> account_models.Account:
+        """Returns the account the middleware adds to a request."""
+        response = self.client.get(reverse('prices'))
+        return response.wsgi_request.account
+
+    def count_queries(self, path: str) -> int:
+        """Returns the number of queries made to load a page."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(path)
+        return len(queries)
+
+    def test_account_loaded_once(self) -> None:
+        """Tests that the account is kept in the session and not loaded
+        again while it has not changed.
+        """
+        request = self.client.get(reverse('prices')).wsgi_request
+        self.assertEqual(request.account.user_id, self.user.id)
+        with self.assertNumQueries(0):
+            account = middleware.get_account(request)
+            self.assertEqual(account.package.name, 'Free')
+            self.assertEqual(account.user, self.user)
+
+    def test_queries_saved(self) -> None:
+        """Tests that pages make fewer queries once the account is kept, and
+        pages which do not use the account never load it.
+        """
+        first = self.count_queries(reverse('prices'))
+        self.assertLess(self.count_queries(reverse('prices')), first)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse(any(
+            account_models.Account._meta.db_table in query['sql']
+            for query in queries
+        ))
+
+    def test_new_package(self) -> None:
+        """Tests that the account is reloaded when its package or expiry
+        date changes.
+        """
+        self.get_account()
+        account = account_models.Account.objects.get(user=self.user)
+        account.expiry_date = date(2030, 1, 1)
+        account.save()
+        self.assertEqual(self.get_account().expiry_date, account.expiry_date)
+
+    def test_package_changed(self) -> None:
+        """Tests that the account is reloaded when its package changes."""
+        self.get_account()
+        package = package_models.Package.objects.get(name='Free')
+        package.quota += 1
+        package.save()
+        self.assertEqual(self.get_account().package.quota, package.quota)
+
+    def test_anonymous(self) -> None:
+        """Tests that there is no account when no user is logged in."""
+        self.client.logout()
+        self.assertIsNone(self.get_account())
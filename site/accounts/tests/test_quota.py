@@ -0,0 +1,104 @@
+"""Unittests for the quota counters."""
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from benchmark import models as benchmark_models
+from benchmark.tests.test_models import get_benchmark
+from core_functions.py.unittest_helpers import get_user
+from .. import models as account_models
+
+
+class TestQuotaCounter(TestCase):
+    """Unittests for the ``QuotaCounter`` model."""
+
+    def setUp(self) -> None:
+        self.account = account_models.Account.objects.get(user=get_user())
+
+    def run_benchmark(self, seed: int = 1) -> None:
+        """Creates a benchmark requested by the account."""
+        get_benchmark(seed, account=self.account)
+
+    def test_counts_benchmarks(self) -> None:
+        """Tests that each new benchmark is counted against the quota."""
+        quota = self.account.package.quota
+        self.assertEqual(self.account.remaining_quota, quota)
+        self.run_benchmark(1)
+        self.run_benchmark(2)
+        self.assertEqual(self.account.remaining_quota, quota - 2)
+
+    def test_counted_with_benchmark(self) -> None:
+        """Tests that a benchmark is only created if it is counted, and that
+        it is created holding the lock on its account.
+        """
+        self.assertTrue(self.account.can_run_benchmark)
+        with mock.patch.object(
+            account_models.QuotaCounter,
+            'record_benchmark',
+            side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.run_benchmark(1)
+        self.assertFalse(benchmark_models.Benchmark.objects.exists())
+
+        with mock.patch.object(
+            account_models.Account,
+            'lock_quota',
+            wraps=account_models.Account.lock_quota
+        ) as lock_quota:
+            self.run_benchmark(1)
+        lock_quota.assert_called_once_with(self.account.pk)
+        self.assertEqual(
+            self.account.remaining_quota,
+            self.account.package.quota - 1
+        )
+
+    def test_can_run_benchmark_one_query(self) -> None:
+        """Tests that checking the quota takes a single query once the
+        counter has been built.
+        """
+        self.account.can_run_benchmark
+        with self.assertNumQueries(1):
+            self.assertTrue(self.account.can_run_benchmark)
+
+    def test_paid_package(self) -> None:
+        """Tests that the counter is rebuilt when a paid package is added,
+        and again once it expires.
+        """
+        free_quota = self.account.package.quota
+        self.run_benchmark(1)
+        self.assertEqual(self.account.remaining_quota, free_quota - 1)
+        history = account_models.PackageHistory.objects.create(
+            account=self.account,
+            package=self.account.package,
+            price=0,
+            paid_on=timezone.now(),
+            expiry_date=timezone.now() + timedelta(days=30),
+        )
+        # Only benchmarks created since the paid package count.
+        self.assertEqual(self.account.remaining_quota, free_quota)
+
+        self.run_benchmark(2)
+        expired = history.expiry_date + timedelta(days=1)
+        with mock.patch.object(timezone, 'now', return_value=expired):
+            counter = self.account.quota_counter()
+        self.assertIsNone(counter.valid_until)
+        self.assertEqual(counter.used, 1)
+
+    def test_reconcile(self) -> None:
+        """Tests that the reconciliation job fixes a counter which drifted.
+        """
+        self.run_benchmark(1)
+        account_models.QuotaCounter.objects.filter(
+            account=self.account
+        ).update(used=0)
+
+        out = StringIO()
+        call_command('reconcile_quota_counters', stdout=out)
+        self.assertIn('1 had drifted', out.getvalue())
+        self.assertEqual(
+            self.account.remaining_quota,
+            self.account.package.quota - 1
+        )
@@ -0,0 +1,98 @@
+"""Unittests for working out the refresh periods of the package history."""
+
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from core_functions.py.unittest_helpers import get_user
+from .. import models as account_models
+
+
+def loop_refresh_period_end(created_on, refresh_period, now):
+    """Works out the end of the refresh period one period at a time."""
+    focus_date = created_on
+    while focus_date < now:
+        focus_date += timedelta(days=refresh_period)
+    return focus_date
+
+
+class TestRefreshPeriodEnd(TestCase):
+    """Unittests for ``refresh_period_end`` and ``RefreshPeriodEnd``."""
+
+    def setUp(self) -> None:
+        self.now = timezone.now().replace(microsecond=123456)
+        account = account_models.Account.objects.get(user=get_user())
+        self.history = account.package_history.first()
+        self.refresh_period = self.history.package.refresh_period
+
+    def set_created_on(self, created_on) -> None:
+        account_models.PackageHistory.objects.filter(
+            pk=self.history.pk
+        ).update(created_on=created_on)
+
+    def test_matches_loop(self) -> None:
+        """Tests that the end is the same as stepping through each period.
+        """
+        for age in (
+            timedelta(0),
+            timedelta(seconds=1),
+            timedelta(days=self.refresh_period),
+            timedelta(days=self.refresh_period, seconds=1),
+            timedelta(days=1000, hours=5),
+            -timedelta(days=1),
+        ):
+            created_on = self.now - age
+            self.assertEqual(
+                account_models.refresh_period_end(
+                    created_on,
+                    self.refresh_period,
+                    self.now
+                ),
+                loop_refresh_period_end(
+                    created_on,
+                    self.refresh_period,
+                    self.now
+                ),
+                age
+            )
+
+    def test_annotation(self) -> None:
+        """Tests that the database works out the same start and end as
+        Python.
+        """
+        for age in (
+            timedelta(days=1000, hours=5),
+            timedelta(days=self.refresh_period, hours=1),
+            timedelta(hours=1),
+            -timedelta(days=1),
+        ):
+            created_on = self.now - age
+            self.set_created_on(created_on)
+            history = account_models.PackageHistory.objects.annotate(
+                end=account_models.RefreshPeriodEnd(now=self.now),
+                start=account_models.RefreshPeriodEnd(now=self.now, offset=-1),
+            ).get(pk=self.history.pk)
+            end = account_models.refresh_period_end(
+                created_on,
+                self.refresh_period,
+                self.now
+            )
+            self.assertEqual(history.end, end, age)
+            self.assertEqual(
+                history.start,
+                end - timedelta(days=self.refresh_period),
+                age
+            )
+
+    def test_with_refresh_period(self) -> None:
+        """Tests that the manager annotates the current refresh period."""
+        self.set_created_on(self.now - timedelta(days=1000))
+        history = account_models.PackageHistory.objects.with_refresh_period(
+        ).get(pk=self.history.pk)
+        self.assertEqual(
+            history.refresh_period_end.date(),
+            history.refresh_period_end_on.date()
+        )
+        self.assertEqual(
+            history.refresh_period_start.date(),
+            history.refresh_period_start_on.date()
+        )
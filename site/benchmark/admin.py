@@ -47,6 +47,11 @@ class BenchmarkAdmin(admin.ModelAdmin):
                 'min_time',
                 'max_time',
                 'mean_time',
+                'p50_time',
+                'p90_time',
+                'p99_time',
+                'p999_time',
+                'start_skew_ms',
                 'completed_requests',
                 'failed_requests',
                 'sys_error_requests',
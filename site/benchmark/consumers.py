@@ -1,11 +1,8 @@
-import typing as _t
-from datetime import datetime
-from asgiref.sync import sync_to_async, async_to_sync
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import (
     AsyncJsonWebsocketConsumer,
     DenyConnection
 )
-from channels.layers import get_channel_layer
 from channels.db import database_sync_to_async
 from sites import models as site_models
 from accounts import models as account_models
@@ -45,65 +42,6 @@ class BenchmarkProgressConsumer(AsyncJsonWebsocketConsumer):
             self.channel_name
         )
 
-    @classmethod
-    def send_status_update(
-        cls,
-        site_id: int,
-        benchmark_id: int,
-        status: str,
-        num_servers: int,
-        num_requests: int,
-        completed_requests: int,
-        failed_requests: int,
-        created_on: _t.Optional[datetime] = None,
-        scheduled_on: _t.Optional[datetime] = None,
-        min_time: _t.Optional[int] = None,
-        mean_time: _t.Optional[int] = None,
-        max_time: _t.Optional[int] = None,
-    ) -> None:
-        """Send an update to the websocket.
-
-        Args:
-            site_id (int): The site id.
-            benchmark_id (int): The benchmark id.
-            status (str): The new status.
-            num_servers (int): The number of servers.
-            num_requests (int): The number of requests per server.
-            completed_requests (int): The number of completed requests.
-            failed_requests (int): The number of failed requests.
-            created_on (datetime): The time the benchmark was created.
-            scheduled_on (datetime): The time the benchmark was scheduled.
-            min_time (int): The minimum time in milliseconds.
-            mean_time (int): The mean time in milliseconds.
-            max_time (int): The maximum time in milliseconds.
-        """
-        group_name = get_site_group_name(site_id)
-        channel_layer = get_channel_layer()
-        datetime_fmt = '%d-%m-%Y %H:%M'
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'benchmark_progress_update',
-                'message': {
-                    'benchmark_id': benchmark_id,
-                    'status': status,
-                    'num_servers': num_servers,
-                    'num_requests': num_requests,
-                    'completed_requests': completed_requests,
-                    'failed_requests': failed_requests,
-                    'created_on': created_on.strftime(datetime_fmt),
-                    'scheduled_on': (
-                        scheduled_on
-                        and scheduled_on.strftime(datetime_fmt)
-                        or None
-                    ),
-                    'min_time': min_time,
-                    'mean_time': mean_time,
-                    'max_time': max_time,
-                }
-            },
-        )
-
     @database_sync_to_async
     def get_site(
         self,
@@ -137,19 +75,9 @@ class BenchmarkProgressConsumer(AsyncJsonWebsocketConsumer):
 
         return account
 
-    async def benchmark_progress_update(self, event):
-        """Handle an update from the benchmark."""
-        message = event['message']
-        await self.send_json({
-            'benchmark_id': message['benchmark_id'],
-            'status': message['status'],
-            'num_servers': message['num_servers'],
-            'num_requests': message['num_requests'],
-            'completed_requests': message['completed_requests'],
-            'failed_requests': message['failed_requests'],
-            'created_on': message['created_on'],
-            'scheduled_on': message['scheduled_on'],
-            'min_time': message['min_time'],
-            'mean_time': message['mean_time'],
-            'max_time': message['max_time'],
-        })
+    async def benchmark_updates(self, event):
+        """Handle a batch of updates to the benchmarks of the site. Each
+        update holds the id of the benchmark and only the fields which
+        changed.
+        """
+        await self.send_json({'updates': event['updates']})
@@ -0,0 +1,130 @@
+"""Sends benchmark updates to the websockets watching each site.
+
+Updates are handed to a `Fanout`, which returns straight away and sends them
+from its own event loop running in a background thread, so a request never
+waits on the channel layer. Updates to the same site within `WINDOW` seconds
+are coalesced into a single message to the site's group, with the fields of
+each benchmark merged so only the latest value of each is sent. Only the
+fields which changed are sent, as the page already holds the rest.
+
+Live figures for a running benchmark, such as its throughput each second, are
+published the same way. However often they arrive, each site's group gets at
+most one message per window holding the latest figures.
+"""
+
+import typing as _t
+import asyncio
+import threading
+from channels.layers import get_channel_layer
+from .consumers import get_site_group_name
+
+
+# Seconds updates to a site are held for to be sent together.
+WINDOW = 0.25
+DATETIME_FORMAT = '%d-%m-%Y %H:%M'
+
+
+class Fanout:
+    """Coalesces benchmark updates and sends them to the site groups."""
+
+    def __init__(self, window: float = WINDOW, channel_layer=None):
+        """Create a fanout.
+
+        Args:
+            window (float): Seconds updates to a site are held for.
+            channel_layer: The channel layer to send to. Defaults to the
+                default channel layer.
+        """
+        self.window = window
+        self._channel_layer = channel_layer
+        self._loop: _t.Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # Fields waiting to be sent by site and benchmark.
+        self._pending: _t.Dict[int, _t.Dict[int, dict]] = {}
+
+    @property
+    def channel_layer(self):
+        """The channel layer, fetched on first use."""
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    def publish(self, site_id: int, benchmark_id: int, fields: dict) -> None:
+        """Queue an update to be sent to a site's group. Safe to call from
+        any thread.
+
+        Args:
+            site_id (int): The site the benchmark is for.
+            benchmark_id (int): The benchmark id.
+            fields (dict): The fields of the benchmark which changed.
+        """
+        loop = self._get_loop()
+        with self._lock:
+            updates = self._pending.setdefault(site_id, {})
+            schedule = not updates
+            updates.setdefault(benchmark_id, {}).update(fields)
+        if schedule:
+            loop.call_soon_threadsafe(
+                loop.call_later,
+                self.window,
+                self._schedule_send,
+                site_id
+            )
+
+    def flush(self, timeout: float = 5) -> None:
+        """Send every queued update now and wait for them to be sent."""
+        if self._loop is None:
+            return
+        with self._lock:
+            site_ids = list(self._pending)
+        future = asyncio.run_coroutine_threadsafe(
+            self._send_all(site_ids),
+            self._loop
+        )
+        future.result(timeout)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the fanout's event loop, starting it on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name='benchmark-fanout',
+                    daemon=True
+                ).start()
+            return self._loop
+
+    def _schedule_send(self, site_id: int) -> None:
+        """Send the updates for a site once its window has passed."""
+        asyncio.ensure_future(self._send(site_id))
+
+    async def _send_all(self, site_ids: _t.List[int]) -> None:
+        """Send the updates for several sites."""
+        for site_id in site_ids:
+            await self._send(site_id)
+
+    async def _send(self, site_id: int) -> None:
+        """Send the updates waiting for a site in one message."""
+        with self._lock:
+            updates = self._pending.pop(site_id, None)
+        if not updates:
+            return
+        try:
+            await self.channel_layer.group_send(
+                get_site_group_name(site_id),
+                {
+                    'type': 'benchmark_updates',
+                    'updates': [
+                        {'benchmark_id': benchmark_id, **fields}
+                        for benchmark_id, fields in updates.items()
+                    ],
+                }
+            )
+        except Exception as e:
+            # The websockets are only a view of the database, so a missed
+            # update is not worth failing over.
+            print(f'Failed to send benchmark updates: {e}')
+
+
+fanout = Fanout()
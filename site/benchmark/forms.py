@@ -2,6 +2,7 @@ import typing as _t
 from django import forms
 from sites import models as site_models
 from . import models as benchmark_models
+from . import producer as benchmark_producer
 
 
 class NewBenchmarkForm(forms.ModelForm):
@@ -67,6 +68,7 @@ class NewBenchmarkForm(forms.ModelForm):
     def clean(self, *args, **kwargs):
         cleaned_data = super().clean(*args, **kwargs)
         self.clean_account()
+        self.clean_capacity()
         return cleaned_data
 
     def clean_account(self):
@@ -76,6 +78,13 @@ class NewBenchmarkForm(forms.ModelForm):
                 'quota'
             )
 
+    def clean_capacity(self):
+        if benchmark_producer.controllers_busy():
+            raise forms.ValidationError(
+                'We are running more benchmarks than usual. Please try again '
+                'in a few minutes.'
+            )
+
     def save(self, *args, **kwargs):
         benchmark = super().save(commit=False)
         benchmark.requested_by = self.account
@@ -0,0 +1,172 @@
+"""Relays the live metrics of running benchmarks to the websockets.
+
+While a benchmark runs, the controller adds the merged metrics of its nodes
+(requests per second, error rate and the 50th and 99th percentile times over
+the last second) to the `benchmark_metrics` stream. The
+`relay_benchmark_metrics` management command reads the stream and hands the
+metrics to the fanout, which sends them to the site's group.
+
+However many watch a site, its group gets one message at a time, so the cost
+is set by the benchmarks rather than the viewers. To keep that cost down, the
+metrics of each benchmark are sent at most once every `RELAY_INTERVAL`
+seconds, keeping only the latest, and the fanout then merges the metrics of
+every benchmark of a site into one message.
+"""
+
+import typing as _t
+import json
+import time
+import redis
+from django.conf import settings
+from . import models as benchmark_models
+from .fanout import fanout
+
+_connection = redis.Redis(**settings.EVENT_BUS)
+
+METRICS_STREAM = 'benchmark_metrics'
+# Seconds between each send of the metrics of a benchmark.
+RELAY_INTERVAL = 1
+# Fields of the metrics which are sent to the browser.
+FIELDS = ('rps', 'error_rate', 'p50_time', 'p99_time')
+# Number of benchmarks whose site is remembered.
+MAX_SITE_IDS = 10000
+
+
+class MetricsRelay:
+    """Downsamples the live metrics and sends them to the fanout."""
+
+    def __init__(self, interval: float = RELAY_INTERVAL, publish=None):
+        """Create a relay.
+
+        Args:
+            interval (float): Seconds between each send of the metrics of a
+                benchmark.
+            publish: Called with the site ID, benchmark ID and fields to
+                send. Defaults to the fanout's `publish`.
+        """
+        self.interval = interval
+        self.publish = fanout.publish if publish is None else publish
+        # The latest metrics not sent yet, by benchmark.
+        self._pending: _t.Dict[int, dict] = {}
+        # When the metrics of each benchmark were last sent.
+        self._sent_at: _t.Dict[int, float] = {}
+        self._site_ids: _t.Dict[int, int] = {}
+
+    def add(self, metrics: _t.List[dict]) -> None:
+        """Add metrics from the stream, keeping the latest for each
+        benchmark.
+
+        Args:
+            metrics: The metrics, oldest first.
+        """
+        for message in metrics:
+            self._pending[message['benchmark_id']] = message
+
+    def send_due(self, now: _t.Optional[float] = None) -> int:
+        """Send the pending metrics of each benchmark whose metrics were not
+        sent within the interval.
+
+        Args:
+            now: Monotonic time to check the interval against.
+
+        Returns:
+            int: The number of benchmarks whose metrics were sent.
+        """
+        now = time.monotonic() if now is None else now
+        due = [
+            benchmark_id for benchmark_id in self._pending
+            if now - self._sent_at.get(benchmark_id, -self.interval)
+            >= self.interval
+        ]
+        site_ids = self.site_ids(due)
+        for benchmark_id in due:
+            message = self._pending.pop(benchmark_id)
+            self._sent_at[benchmark_id] = now
+            site_id = site_ids.get(benchmark_id)
+            if site_id is None:
+                continue
+            self.publish(
+                site_id,
+                benchmark_id,
+                {'live': {field: message.get(field) for field in FIELDS}}
+            )
+
+        # Forget the benchmarks which have stopped sending metrics.
+        for benchmark_id, sent_at in list(self._sent_at.items()):
+            if now - sent_at > self.interval * 60:
+                del self._sent_at[benchmark_id]
+        return len(due)
+
+    def next_due(self, now: _t.Optional[float] = None) -> _t.Optional[float]:
+        """Return the seconds until pending metrics are due to be sent, or
+        None if there are none.
+        """
+        if not self._pending:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0, min(
+            self._sent_at.get(benchmark_id, -self.interval)
+            + self.interval - now
+            for benchmark_id in self._pending
+        ))
+
+    def site_ids(self, benchmark_ids: _t.List[int]) -> _t.Dict[int, int]:
+        """Return the site of each benchmark, looking up the ones which are
+        not known yet in one query. Benchmarks which do not exist are left
+        out.
+        """
+        missing = [
+            benchmark_id for benchmark_id in benchmark_ids
+            if benchmark_id not in self._site_ids
+        ]
+        if missing:
+            if len(self._site_ids) + len(missing) > MAX_SITE_IDS:
+                self._site_ids = {}
+            self._site_ids.update(
+                benchmark_models.Benchmark.objects
+                .filter(id__in=missing)
+                .values_list('id', 'site_id')
+            )
+        return {
+            benchmark_id: self._site_ids[benchmark_id]
+            for benchmark_id in benchmark_ids
+            if benchmark_id in self._site_ids
+        }
+
+    def read(self, last_id: str, block: float) -> str:
+        """Add the metrics from the stream after a message, waiting for them
+        to arrive.
+
+        Args:
+            last_id: ID of the last message read.
+            block: Seconds to wait for new metrics.
+
+        Returns:
+            str: ID of the last message read.
+        """
+        response = _connection.xread(
+            {METRICS_STREAM: last_id},
+            count=1000,
+            block=max(1, round(block * 1000))
+        )
+        for _, messages in response:
+            last_id = messages[-1][0]
+            self.add([
+                json.loads(fields[b'data'])
+                for _, fields in messages
+            ])
+        return last_id
+
+    def run(self, last_id: str = '$') -> None:
+        """Relay the metrics from the stream until interrupted.
+
+        Args:
+            last_id: ID of the last message read. Defaults to only reading
+                new messages, as old metrics are of no use.
+        """
+        while True:
+            wait = self.next_due()
+            if wait is None:
+                wait = self.interval
+            last_id = self.read(last_id, wait)
+            self.send_due()
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from ... import live_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Relays the live metrics of running benchmarks from the event bus to '
+        'the websockets watching their site.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=live_metrics.RELAY_INTERVAL,
+            help='Seconds between each send of the metrics of a benchmark.'
+        )
+
+    def handle(self, *args, **options):
+        live_metrics.MetricsRelay(options['interval']).run()
@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('benchmark', '0002_alter_benchmark_requested_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='benchmark',
+            name='p50_time',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='P50 Time'),
+        ),
+        migrations.AddField(
+            model_name='benchmark',
+            name='p90_time',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='P90 Time'),
+        ),
+        migrations.AddField(
+            model_name='benchmark',
+            name='p999_time',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='P99.9 Time'),
+        ),
+        migrations.AddField(
+            model_name='benchmark',
+            name='p99_time',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='P99 Time'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-18 11:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('benchmark', '0003_benchmark_percentiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BenchmarkTimeSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0, help_text='Number of responses received during the second.')),
+                ('errors', models.PositiveIntegerField(default=0, help_text='Number of requests which failed during the second.')),
+                ('latency_sum', models.PositiveBigIntegerField(default=0, help_text='Sum of the response times in microseconds.')),
+                ('benchmark', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeseries', to='benchmark.benchmark')),
+            ],
+            options={
+                'verbose_name': 'Benchmark Time Series',
+                'verbose_name_plural': 'Benchmark Time Series',
+                'ordering': ['benchmark', 'timestamp'],
+                'unique_together': {('benchmark', 'timestamp')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('benchmark', '0004_benchmarktimeseries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='benchmark',
+            name='start_skew_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Milliseconds between the first and last server starting the benchmark.', null=True, verbose_name='Start Skew (ms)'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 import typing as _t
-from datetime import timedelta
+from datetime import datetime, timedelta
 from django import dispatch
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from sites import models as site_models
 from accounts import models as account_models
@@ -39,6 +39,33 @@ class Benchmark(models.Model):
     min_time = models.PositiveIntegerField(blank=True, null=True)
     max_time = models.PositiveIntegerField(blank=True, null=True)
     mean_time = models.PositiveIntegerField(blank=True, null=True)
+    p50_time = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='P50 Time'
+    )
+    p90_time = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='P90 Time'
+    )
+    p99_time = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='P99 Time'
+    )
+    p999_time = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='P99.9 Time'
+    )
+    start_skew_ms = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='Start Skew (ms)',
+        help_text='Milliseconds between the first and last server starting '
+        'the benchmark.'
+    )
     completed_requests = models.PositiveIntegerField(default=0)
     failed_requests = models.PositiveIntegerField(default=0)
     sys_error_requests = models.PositiveIntegerField(
@@ -56,11 +83,15 @@ class Benchmark(models.Model):
 
     def save(self, *args, **kwargs):
         """Save the benchmark and publish a new benchmark event if this is a
-        new benchmark.
+        new benchmark. A new benchmark is created in the same transaction as
+        the handlers of the event, which count it against the quota, holding
+        the lock on the account which requested it.
         """
-        created = self.pk is None
-        super().save(*args, **kwargs)
-        if created:
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            account_models.Account.lock_quota(self.requested_by_id)
+            super().save(*args, **kwargs)
             NEW_BENCHMARK.send(sender=self.__class__, instance=self)
 
     @classmethod
@@ -119,6 +150,43 @@ class Benchmark(models.Model):
         )
         return timedelta(seconds=total_seconds / records_count)
 
+    @classmethod
+    def estimated_runtime(
+        cls,
+        site: site_models.Site,
+        num_requests: int,
+        sample_size: int = 20,
+    ) -> _t.Union[timedelta, None]:
+        """Estimate how long a benchmark will take from the most recent
+        benchmarks with the same number of requests per server, preferring
+        those for the same site.
+
+        Args:
+            site (Site): The site being benchmarked.
+            num_requests (int): Number of requests per server.
+            sample_size (int): Number of previous benchmarks to average.
+
+        Returns:
+            timedelta: The estimated runtime, or None if there are no
+                previous benchmarks to go on.
+        """
+        records = cls.objects.filter(
+            num_requests=num_requests,
+            started_on__isnull=False,
+            completed_on__isnull=False,
+        ).order_by('-completed_on')
+        for queryset in (records.filter(site=site), records):
+            durations = [
+                completed_on - started_on
+                for started_on, completed_on in queryset.values_list(
+                    'started_on',
+                    'completed_on'
+                )[:sample_size]
+            ]
+            if durations:
+                return sum(durations, timedelta()) / len(durations)
+        return cls.avg_completion_time()
+
 
 class BenchmarkProgress(models.Model):
     """Represents the progress of a benchmark."""
@@ -167,6 +235,17 @@ class BenchmarkProgress(models.Model):
                 instance=self
             )
 
+    def log_status_time(self) -> None:
+        """Log the time the benchmark reached its current status on the
+        benchmark. The benchmark is not saved.
+        """
+        if self.status == self.StatusChoices.PROVISIONING:
+            self.benchmark.started_on = timezone.now()
+        elif self.status == self.StatusChoices.SCHEDULING:
+            self.benchmark.scheduled_on = timezone.now()
+        elif self.status == self.StatusChoices.COMPLETED:
+            self.benchmark.completed_on = timezone.now()
+
     def set_completed(self) -> None:
         """Set the benchmark progress to completed."""
         self.status = self.StatusChoices.COMPLETED
@@ -177,3 +256,113 @@ class BenchmarkProgress(models.Model):
         self.benchmark.site.last_benchmarked = self.benchmark.completed_on
         self.benchmark.site.save()
         self.save()
+
+
+class BenchmarkTimeSeries(models.Model):
+    """Represents the throughput of a benchmark across all of its servers for
+    a single second of the run.
+    """
+    benchmark = models.ForeignKey(
+        Benchmark,
+        on_delete=models.CASCADE,
+        related_name='timeseries'
+    )
+    timestamp = models.DateTimeField()
+    requests = models.PositiveIntegerField(
+        default=0,
+        help_text='Number of responses received during the second.'
+    )
+    errors = models.PositiveIntegerField(
+        default=0,
+        help_text='Number of requests which failed during the second.'
+    )
+    latency_sum = models.PositiveBigIntegerField(
+        default=0,
+        help_text='Sum of the response times in microseconds.'
+    )
+
+    class Meta:
+        ordering = ['benchmark', 'timestamp']
+        unique_together = ('benchmark', 'timestamp')
+        verbose_name = 'Benchmark Time Series'
+        verbose_name_plural = 'Benchmark Time Series'
+
+    def __str__(self):
+        return f'[{self.timestamp.strftime("%H:%M:%S")}] {self.benchmark}'
+
+    @property
+    def mean_time(self) -> _t.Optional[float]:
+        """Mean response time in milliseconds for the second."""
+        if not self.requests:
+            return None
+        return self.latency_sum / self.requests / 1000
+
+    @classmethod
+    def replace_for_benchmark(
+        cls,
+        benchmark: Benchmark,
+        start: int,
+        requests: _t.List[int],
+        errors: _t.List[int],
+        latency_sum: _t.List[int],
+    ) -> _t.List['BenchmarkTimeSeries']:
+        """Replace the time series for a benchmark.
+
+        Args:
+            benchmark (Benchmark): The benchmark the series belongs to.
+            start (int): Epoch second of the first value in each list.
+            requests (List[int]): Responses received each second.
+            errors (List[int]): Failed requests each second.
+            latency_sum (List[int]): Sum of the response times each second in
+                microseconds.
+        Returns:
+            List[BenchmarkTimeSeries]: The created records.
+        """
+        start_on = datetime.fromtimestamp(start, tz=timezone.utc)
+        records = [
+            cls(
+                benchmark=benchmark,
+                timestamp=start_on + timedelta(seconds=second),
+                requests=num_requests,
+                errors=num_errors,
+                latency_sum=total_latency,
+            )
+            for second, (num_requests, num_errors, total_latency)
+            in enumerate(zip(requests, errors, latency_sum))
+        ]
+        with transaction.atomic():
+            cls.objects.filter(benchmark=benchmark).delete()
+            return cls.objects.bulk_create(records, batch_size=500)
+
+    @classmethod
+    def chart_data(cls, benchmark: Benchmark) -> _t.Dict[str, list]:
+        """Return the time series for a benchmark as parallel lists which can
+        be passed straight to a chart.
+        """
+        data = {
+            'labels': [],
+            'timestamps': [],
+            'requests': [],
+            'errors': [],
+            'mean_time': [],
+        }
+        rows = cls.objects.filter(benchmark=benchmark).values_list(
+            'timestamp',
+            'requests',
+            'errors',
+            'latency_sum',
+        )
+        start_on = None
+        for timestamp, num_requests, num_errors, total_latency in rows:
+            if start_on is None:
+                start_on = timestamp
+            data['labels'].append(int((timestamp - start_on).total_seconds()))
+            data['timestamps'].append(timestamp.isoformat())
+            data['requests'].append(num_requests)
+            data['errors'].append(num_errors)
+            data['mean_time'].append(
+                num_requests
+                and round(total_latency / num_requests / 1000, 2)
+                or None
+            )
+        return data
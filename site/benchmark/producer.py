@@ -7,14 +7,38 @@ from . import models as benchmark_models
 
 _connection = redis.Redis(**settings.EVENT_BUS)
 
+# Messages are added to Redis streams, which keep them until a controller has
+# acknowledged them, so none are lost while the controllers are down. Each
+# stream is capped at roughly this many messages.
+STREAM_MAX_LENGTH = 10000
+
+# Set by the controllers while their queue is full.
+BACKPRESSURE_KEY = 'benchmark.backpressure'
+
 
 def publish_message(channel: str, message: dict) -> None:
     """Publish a message to the event bus.
     Args:
-        channel: The channel to publish to.
+        channel: The stream to add the message to.
         message: The message to publish.
     """
-    _connection.publish(channel, json.dumps(message))
+    _connection.xadd(
+        channel,
+        {'data': json.dumps(message)},
+        maxlen=STREAM_MAX_LENGTH,
+        approximate=True
+    )
+
+
+def controllers_busy() -> bool:
+    """Return whether the controllers have asked for no more benchmarks to
+    be sent until their queue has drained. If the event bus cannot be reached
+    the benchmark is accepted, as it will be sent once the bus is back.
+    """
+    try:
+        return bool(_connection.exists(BACKPRESSURE_KEY))
+    except redis.RedisError:
+        return False
 
 
 def new_benchmark(benchmark: benchmark_models.Benchmark) -> None:
@@ -22,6 +46,11 @@ def new_benchmark(benchmark: benchmark_models.Benchmark) -> None:
     Args:
         benchmark: The benchmark to publish.
     """
+    estimated_runtime = benchmark_models.Benchmark.estimated_runtime(
+        benchmark.site,
+        benchmark.num_requests
+    )
+    package = benchmark.requested_by.package
     publish_message(
         'benchmark_new',
         {
@@ -29,5 +58,11 @@ def new_benchmark(benchmark: benchmark_models.Benchmark) -> None:
             'domain': benchmark.site.domain,
             'num_servers': benchmark.num_servers,
             'num_requests': benchmark.num_requests,
+            'estimated_runtime': (
+                estimated_runtime and estimated_runtime.total_seconds()
+            ),
+            'priority': package.queue_priority,
+            'account_id': benchmark.requested_by_id,
+            'weight': package.queue_weight,
         }
     )
@@ -1,8 +1,8 @@
-from django.db import models
-from django.utils import timezone
+from django.db import models, transaction
+from accounts import models as account_models
 from . import producer as benchmark_producer
 from . import models as benchmark_models
-from . import consumers as benchmark_consumers
+from .fanout import fanout, DATETIME_FORMAT
 
 
 def on_new_benchmark(
@@ -10,8 +10,9 @@ def on_new_benchmark(
     instance: benchmark_models.Benchmark,
     **kwargs
 ) -> None:
-    """Publish a new benchmark to the event bus and created a benchmark
-    progress record.
+    """Publish a new benchmark to the event bus, created a benchmark
+    progress record and count the benchmark against the quota of the account
+    which requested it.
 
     Args:
         instance: The benchmark to publish.
@@ -19,7 +20,13 @@ def on_new_benchmark(
     benchmark_models.BenchmarkProgress.objects.create(
         benchmark=instance
     ).save()
-    benchmark_producer.new_benchmark(instance)
+    account_models.QuotaCounter.record_benchmark(
+        instance.requested_by_id,
+        instance.created_on
+    )
+    # Only publish once the benchmark is committed, so that the controller
+    # never hears of a benchmark which does not exist yet.
+    transaction.on_commit(lambda: benchmark_producer.new_benchmark(instance))
 
 
 def on_benchmark_progress_update(
@@ -27,39 +34,38 @@ def on_benchmark_progress_update(
     instance: benchmark_models.BenchmarkProgress,
     **kwargs
 ) -> None:
-    status_choices = benchmark_models.BenchmarkProgress.StatusChoices
-
     # Update the benchmark time logs.
-    loggable_statues = (
-        status_choices.PROVISIONING,
-        status_choices.SCHEDULING,
-        status_choices.COMPLETED,
-    )
-    if instance.status not in loggable_statues:
-        pass
-    if instance.status == status_choices.PROVISIONING:
-        instance.benchmark.started_on = timezone.now()
-    elif instance.status == status_choices.SCHEDULING:
-        instance.benchmark.scheduled_on = timezone.now()
-    elif instance.status == status_choices.COMPLETED:
-        instance.benchmark.completed_on = timezone.now()
+    instance.log_status_time()
     instance.benchmark.save()
+    transaction.on_commit(lambda: send_status_update(instance))
 
-    # Send notification with new status.
-    benchmark_consumers.BenchmarkProgressConsumer.send_status_update(
-        site_id=instance.benchmark.site_id,
-        benchmark_id=instance.benchmark_id,
-        status=instance.get_status_display(),
-        num_servers=instance.benchmark.num_servers,
-        num_requests=instance.benchmark.num_requests,
-        completed_requests=instance.benchmark.completed_requests,
-        failed_requests=instance.benchmark.failed_requests,
-        created_on=instance.benchmark.created_on,
-        scheduled_on=instance.benchmark.scheduled_on,
-        min_time=instance.benchmark.min_time,
-        mean_time=instance.benchmark.mean_time,
-        max_time=instance.benchmark.max_time,
-    )
+
+def send_status_update(
+    instance: benchmark_models.BenchmarkProgress
+) -> None:
+    """Send a notification with the new status of a benchmark. Only the
+    fields which change with the status are sent.
+
+    Args:
+        instance: The progress of the benchmark.
+    """
+    status_choices = benchmark_models.BenchmarkProgress.StatusChoices
+    benchmark = instance.benchmark
+    fields = {'status': instance.get_status_display()}
+    if instance.status == status_choices.SCHEDULING and benchmark.scheduled_on:
+        fields['scheduled_on'] = benchmark.scheduled_on.strftime(
+            DATETIME_FORMAT
+        )
+    elif instance.status == status_choices.COMPLETED:
+        fields.update({
+            'completed_requests': benchmark.completed_requests,
+            'failed_requests': benchmark.failed_requests,
+            'min_time': benchmark.min_time,
+            'mean_time': benchmark.mean_time,
+            'max_time': benchmark.max_time,
+            'p99_time': benchmark.p99_time,
+        })
+    fanout.publish(benchmark.site_id, benchmark.id, fields)
 
 
 benchmark_models.NEW_BENCHMARK.connect(
@@ -0,0 +1,86 @@
+import threading
+from unittest import mock
+from django.test import TestCase
+from .. import fanout as benchmark_fanout
+from .. import models as benchmark_models
+from .test_models import get_benchmark
+
+
+class StubChannelLayer:
+    """Records the messages sent to each group."""
+
+    def __init__(self):
+        self.messages = []
+        self.sent = threading.Event()
+
+    async def group_send(self, group: str, message: dict) -> None:
+        self.messages.append((group, message))
+        self.sent.set()
+
+
+class TestFanout(TestCase):
+    """Tests the `Fanout` class."""
+
+    def setUp(self):
+        self.channel_layer = StubChannelLayer()
+        self.fanout = benchmark_fanout.Fanout(
+            window=0.05,
+            channel_layer=self.channel_layer
+        )
+
+    def test_coalesces_updates(self):
+        """Test that updates to a site within the window are sent in one
+        message holding the latest value of each field.
+        """
+        self.fanout.publish(1, 10, {'status': 'Provisioning servers'})
+        self.fanout.publish(1, 10, {'status': 'Scheduling benchmark'})
+        self.fanout.publish(1, 11, {'throughput': {'rps': 50}})
+        self.fanout.publish(1, 11, {'throughput': {'rps': 60}})
+        self.fanout.publish(2, 12, {'status': 'Completed'})
+        self.fanout.flush()
+
+        self.assertEqual(self.channel_layer.messages, [
+            ('site_1', {
+                'type': 'benchmark_updates',
+                'updates': [
+                    {'benchmark_id': 10, 'status': 'Scheduling benchmark'},
+                    {'benchmark_id': 11, 'throughput': {'rps': 60}},
+                ],
+            }),
+            ('site_2', {
+                'type': 'benchmark_updates',
+                'updates': [{'benchmark_id': 12, 'status': 'Completed'}],
+            }),
+        ])
+
+    def test_sends_after_window(self):
+        """Test that the updates are sent once the window has passed."""
+        self.fanout.publish(1, 10, {'status': 'Completed'})
+        self.assertTrue(self.channel_layer.sent.wait(5))
+        self.assertEqual(len(self.channel_layer.messages), 1)
+
+
+class TestSendStatusUpdate(TestCase):
+    """Tests the `send_status_update` function."""
+
+    def test_sends_changed_fields(self):
+        """Test that only the fields which change with the status are sent,
+        once the transaction has committed.
+        """
+        benchmark = get_benchmark()
+        progress = benchmark.progress
+        status_choices = benchmark_models.BenchmarkProgress.StatusChoices
+        with mock.patch.object(benchmark_fanout.fanout, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                progress.status = status_choices.SCHEDULING
+                progress.save()
+                publish.assert_not_called()
+
+        publish.assert_called_once()
+        site_id, benchmark_id, fields = publish.call_args[0]
+        self.assertEqual(site_id, benchmark.site_id)
+        self.assertEqual(benchmark_id, benchmark.id)
+        self.assertEqual(
+            set(fields),
+            {'status', 'scheduled_on'}
+        )
@@ -1,10 +1,12 @@
 import typing as _t
+from unittest import mock
 from django.test import TestCase
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from accounts import models as account_models
 from sites import models as site_models
 from .. import forms as benchmark_forms
+from .. import producer as benchmark_producer
 
 User = get_user_model()
 
@@ -157,8 +159,30 @@ class TestNewBenchmarkForm(TestCase):
         package_history.package.quota = 0
         package_history.package.save()
 
-        form = self.sample_form(1, {'site': site})
+        # `sample_form` tops up the quota, so the form is made directly.
+        form = benchmark_forms.NewBenchmarkForm(
+            data={'site': site, 'num_requests': 1, 'num_servers': 1},
+            account=account,
+            site=site
+        )
         self.assertFalse(form.is_valid(), form.errors)
+        self.assertIn('quota', str(form.errors))
+
+    def test_clean_capacity(self):
+        """Test that a benchmark is not accepted while the controllers have
+        asked for no more benchmarks.
+        """
+        site = get_site(1)
+        account = get_account(1)
+        site.add_account(account, site_models.SiteAccess.AuthLevels.ADMIN)
+
+        with mock.patch.object(
+            benchmark_producer,
+            'controllers_busy',
+            return_value=True
+        ):
+            form = self.sample_form(1, {'site': site})
+            self.assertFalse(form.is_valid())
 
     def test_setup_site_fields(self):
         """Test that an account is only shown sites which they are allowed
@@ -0,0 +1,87 @@
+import json
+from unittest import mock
+from django.test import TestCase
+from .. import live_metrics
+from .test_models import get_benchmark
+
+
+def get_metrics(benchmark_id: int, rps: float) -> dict:
+    """Return the live metrics for a benchmark as sent by the controller."""
+    return {
+        'benchmark_id': benchmark_id,
+        'time': 0,
+        'rps': rps,
+        'error_rate': 0.01,
+        'p50_time': 12,
+        'p99_time': 80,
+    }
+
+
+class TestMetricsRelay(TestCase):
+    """Tests the `MetricsRelay` class."""
+
+    def setUp(self):
+        self.publish = mock.Mock()
+        self.relay = live_metrics.MetricsRelay(
+            interval=1,
+            publish=self.publish
+        )
+        self.benchmark = get_benchmark()
+
+    def test_downsamples(self):
+        """Test that the metrics of a benchmark are sent at most once per
+        interval, keeping the latest.
+        """
+        self.relay.add([get_metrics(self.benchmark.id, 10)])
+        self.assertEqual(self.relay.send_due(now=100), 1)
+
+        self.relay.add([
+            get_metrics(self.benchmark.id, 20),
+            get_metrics(self.benchmark.id, 30),
+        ])
+        self.assertEqual(self.relay.send_due(now=100.5), 0)
+        self.assertEqual(self.relay.next_due(now=100.5), 0.5)
+        self.assertEqual(self.relay.send_due(now=101), 1)
+
+        self.assertEqual(
+            [call.args[2]['live']['rps'] for call in self.publish.mock_calls],
+            [10, 30]
+        )
+        self.publish.assert_called_with(
+            self.benchmark.site_id,
+            self.benchmark.id,
+            {'live': {
+                'rps': 30,
+                'error_rate': 0.01,
+                'p50_time': 12,
+                'p99_time': 80,
+            }}
+        )
+
+    def test_site_ids_cached(self):
+        """Test that the site of each benchmark is only looked up once and
+        metrics for unknown benchmarks are dropped.
+        """
+        self.relay.add([get_metrics(self.benchmark.id, 10)])
+        self.relay.send_due(now=100)
+        self.relay.add([
+            get_metrics(self.benchmark.id, 10),
+            get_metrics(0, 10),
+        ])
+        with self.assertNumQueries(1):
+            self.relay.send_due(now=101)
+        self.assertEqual(self.publish.call_count, 2)
+
+    def test_read(self):
+        """Test that the metrics added to the stream are read."""
+        connection = live_metrics._connection
+        connection.delete(live_metrics.METRICS_STREAM)
+        self.addCleanup(connection.delete, live_metrics.METRICS_STREAM)
+        message_id = connection.xadd(
+            live_metrics.METRICS_STREAM,
+            {'data': json.dumps(get_metrics(self.benchmark.id, 10))}
+        )
+
+        self.assertEqual(self.relay.read('0', 1), message_id)
+        self.relay.send_due()
+        self.publish.assert_called_once()
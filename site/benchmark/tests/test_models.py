@@ -176,6 +176,42 @@ class TestBenchmark(TestCase):
         results = benchmark_models.Benchmark.avg_completion_time()
         self.assertEqual(results, timedelta(seconds=7))
 
+    def test_estimated_runtime(self):
+        site = get_site()
+        now = timezone.now()
+        for seed, seconds, num_requests, benchmark_site in (
+            (1, 10, 100, site),
+            (2, 20, 100, site),
+            (3, 90, 100, get_site(3)),
+            (4, 600, 5000, site),
+        ):
+            benchmark = get_benchmark(seed, site=benchmark_site)
+            benchmark.num_requests = num_requests
+            benchmark.started_on = now - timedelta(seconds=seconds)
+            benchmark.completed_on = now
+            benchmark.save()
+
+        # Benchmarks for the same site are preferred.
+        self.assertEqual(
+            benchmark_models.Benchmark.estimated_runtime(site, 100),
+            timedelta(seconds=15)
+        )
+        # Otherwise benchmarks with the same number of requests are used.
+        self.assertEqual(
+            benchmark_models.Benchmark.estimated_runtime(get_site(5), 100),
+            timedelta(seconds=40)
+        )
+        # Otherwise the average of all benchmarks is used.
+        self.assertEqual(
+            benchmark_models.Benchmark.estimated_runtime(site, 1),
+            timedelta(seconds=180)
+        )
+
+    def test_estimated_runtime_no_history(self):
+        self.assertIsNone(
+            benchmark_models.Benchmark.estimated_runtime(get_site(), 100)
+        )
+
 
 class BenchmarkProgress(TestCase):
 
@@ -192,3 +228,38 @@ class BenchmarkProgress(TestCase):
             benchmark_progress.status,
             benchmark_models.BenchmarkProgress.StatusChoices.COMPLETED
         )
+
+
+class TestBenchmarkTimeSeries(TestCase):
+
+    def test_replace_for_benchmark(self):
+        benchmark = get_benchmark()
+        benchmark_models.BenchmarkTimeSeries.replace_for_benchmark(
+            benchmark, 1000, [1, 2], [0, 0], [1000, 2000]
+        )
+        records = benchmark_models.BenchmarkTimeSeries.replace_for_benchmark(
+            benchmark, 1000, [5, 10, 0], [1, 0, 0], [5000, 40000, 0]
+        )
+
+        self.assertEqual(len(records), 3)
+        self.assertEqual(benchmark.timeseries.count(), 3)
+        first, second, third = benchmark.timeseries.all()
+        self.assertEqual(
+            second.timestamp - first.timestamp,
+            timedelta(seconds=1)
+        )
+        self.assertEqual(second.mean_time, 4)
+        self.assertIsNone(third.mean_time)
+
+    def test_chart_data(self):
+        benchmark = get_benchmark()
+        benchmark_models.BenchmarkTimeSeries.replace_for_benchmark(
+            benchmark, 1000, [5, 10, 0], [1, 0, 0], [5000, 40000, 0]
+        )
+
+        data = benchmark_models.BenchmarkTimeSeries.chart_data(benchmark)
+        self.assertEqual(data['labels'], [0, 1, 2])
+        self.assertEqual(data['requests'], [5, 10, 0])
+        self.assertEqual(data['errors'], [1, 0, 0])
+        self.assertEqual(data['mean_time'], [1, 4, None])
+        self.assertEqual(len(data['timestamps']), 3)
@@ -0,0 +1,192 @@
+"""Holds the events from the controller which could not be applied yet.
+
+An event can arrive before its benchmark is visible to the site, for example
+while the transaction creating the benchmark has not committed. Rather than
+waiting for it inside the request, the event is added to a Redis sorted set
+scored by when it should next be tried, and the endpoint returns straight
+away. The `drain_deferred_events` management command applies the events as
+they fall due, backing off each time the benchmark is still missing. Events
+which are still missing after `MAX_ATTEMPTS` tries are logged and moved to a
+dead letter list, where they can be inspected.
+"""
+
+import typing as _t
+import json
+import logging
+import time
+import uuid
+import redis
+from django.conf import settings
+from . import ingest
+
+logger = logging.getLogger(__name__)
+
+_connection = redis.Redis(**settings.EVENT_BUS)
+
+DEFERRED_KEY = 'internal_api.deferred'
+# Events which were dropped, newest first.
+DEAD_LETTER_KEY = 'internal_api.dead_letter'
+# Number of dropped events kept in the dead letter list.
+MAX_DEAD_LETTERS = 1000
+# Seconds before the first retry, doubled on each retry after that.
+RETRY_DELAY = 2
+MAX_RETRY_DELAY = 60
+# Number of times an event is tried before it is dropped.
+MAX_ATTEMPTS = 10
+
+
+def retry_delay(attempts: int) -> float:
+    """Return the seconds to wait before the next try of an event.
+
+    Args:
+        attempts: Number of times the event has been tried.
+    """
+    return min(RETRY_DELAY * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def defer(
+    progress: _t.List[dict],
+    results: _t.List[dict],
+    timeseries: _t.Optional[_t.List[dict]] = None,
+    attempts: int = 1,
+    now: _t.Optional[float] = None,
+) -> int:
+    """Defer events to be tried again later.
+
+    Args:
+        progress: Progress events to defer.
+        results: Results events to defer.
+        timeseries: Time series events to defer.
+        attempts: Number of times the events have been tried.
+        now: Epoch time to schedule the retry from.
+
+    Returns:
+        int: The number of events deferred.
+    """
+    events = [('progress', event) for event in progress]
+    events += [('results', event) for event in results]
+    events += [('timeseries', event) for event in timeseries or []]
+    return _defer_events(
+        [(kind, event, attempts) for kind, event in events],
+        now
+    )
+
+
+def _defer_events(
+    events: _t.List[_t.Tuple[str, dict, int]],
+    now: _t.Optional[float],
+) -> int:
+    """Defer events, each given as its kind, the event and the number of
+    times it has been tried. Events tried `MAX_ATTEMPTS` times are moved to
+    the dead letter list instead.
+    """
+    now = time.time() if now is None else now
+    retries = {}
+    dropped = []
+    for kind, event, attempts in events:
+        entry = json.dumps({
+            # Keeps identical events apart in the set.
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'event': event,
+            'attempts': attempts,
+        })
+        if attempts >= MAX_ATTEMPTS:
+            logger.error(
+                'Dropping %s event for benchmark %s after %d attempts',
+                kind,
+                event['benchmark_id'],
+                attempts
+            )
+            dropped.append(entry)
+        else:
+            retries[entry] = now + retry_delay(attempts)
+
+    if retries:
+        _connection.zadd(DEFERRED_KEY, retries)
+    if dropped:
+        pipe = _connection.pipeline()
+        pipe.lpush(DEAD_LETTER_KEY, *dropped)
+        pipe.ltrim(DEAD_LETTER_KEY, 0, MAX_DEAD_LETTERS - 1)
+        pipe.execute()
+    return len(retries)
+
+
+def pending() -> int:
+    """Return the number of deferred events."""
+    return _connection.zcard(DEFERRED_KEY)
+
+
+def dead_letters() -> _t.List[dict]:
+    """Return the events which were dropped, newest first, each with its
+    kind and the number of times it was tried.
+    """
+    return [
+        json.loads(entry)
+        for entry in _connection.lrange(DEAD_LETTER_KEY, 0, -1)
+    ]
+
+
+def drain(now: _t.Optional[float] = None, limit: int = 500) -> int:
+    """Apply the deferred events which are due. Events whose benchmark is
+    still missing, or which could not be applied, are deferred again.
+
+    Args:
+        now: Epoch time to take events due by.
+        limit: Maximum number of events to take.
+
+    Returns:
+        int: The number of events applied.
+    """
+    now = time.time() if now is None else now
+    members = _connection.zrangebyscore(
+        DEFERRED_KEY,
+        '-inf',
+        now,
+        start=0,
+        num=limit
+    )
+    # Another drainer may take the same events, so only keep the events this
+    # drainer removed.
+    taken = []
+    for member in members:
+        if _connection.zrem(DEFERRED_KEY, member):
+            taken.append(json.loads(member))
+    if not taken:
+        return 0
+
+    events = {'progress': [], 'results': [], 'timeseries': []}
+    for deferred in taken:
+        events[deferred['kind']].append(deferred['event'])
+    # The events were removed from the set before being applied, so if
+    # applying them fails, e.g. on a deadlock, they are all tried again.
+    try:
+        missing = ingest.apply_events(events['progress'], events['results'])
+    except Exception:
+        logger.exception('Failed to apply deferred events')
+        missing = {
+            'progress': events['progress'],
+            'results': events['results'],
+        }
+    try:
+        missing['timeseries'] = ingest.apply_timeseries(
+            events['timeseries']
+        )
+    except Exception:
+        logger.exception('Failed to apply deferred time series')
+        missing['timeseries'] = events['timeseries']
+
+    # The missing events are the ones which were taken, so each is matched
+    # to its own entry even if another entry is for the same benchmark.
+    attempts = {
+        id(deferred['event']): deferred['attempts'] for deferred in taken
+    }
+    _defer_events(
+        [
+            (kind, event, attempts[id(event)] + 1)
+            for kind, kind_events in missing.items()
+            for event in kind_events
+        ],
+        now
+    )
+    return len(taken) - sum(len(events) for events in missing.values())
@@ -0,0 +1,144 @@
+"""Applies batches of progress, results and time series events sent by the
+controller.
+
+A batch is applied in a single transaction with one bulk update per table,
+rather than a `get` and a `save` for every event. Events for benchmarks which
+are not visible yet are not applied and are handed back to be deferred, see
+the `deferred` module.
+"""
+
+import typing as _t
+from django.db import transaction
+from benchmark import models as benchmark_models
+from benchmark import signals as benchmark_signals
+from sites import models as site_models
+
+
+# Maps the fields of a results event to the fields of the benchmark.
+RESULT_FIELDS = {
+    'min_time': 'min_time',
+    'max_time': 'max_time',
+    'avg_time': 'mean_time',
+    'p50_time': 'p50_time',
+    'p90_time': 'p90_time',
+    'p99_time': 'p99_time',
+    'p999_time': 'p999_time',
+    'start_skew_ms': 'start_skew_ms',
+    'complete_requests': 'completed_requests',
+    'failed_requests': 'failed_requests',
+    'sys_error_requests': 'sys_error_requests',
+}
+# Fields of the benchmark which are set by a status change.
+STATUS_TIME_FIELDS = ['started_on', 'scheduled_on', 'completed_on']
+
+
+def apply_events(
+    progress: _t.List[dict],
+    results: _t.List[dict],
+) -> _t.Dict[str, _t.List[dict]]:
+    """Applies progress and results events.
+
+    Args:
+        progress: Progress events, each with a `benchmark_id` and `status`.
+            Where there are several for a benchmark the last is applied.
+        results: Results events, in the format of the `benchmark_results`
+            endpoint. The benchmark is completed by its results.
+
+    Returns:
+        dict: The `progress` and `results` events for benchmarks which do
+            not exist yet.
+    """
+    status_choices = benchmark_models.BenchmarkProgress.StatusChoices
+    statuses = {event['benchmark_id']: event['status'] for event in progress}
+    results_by_id = {event['benchmark_id']: event for event in results}
+    for benchmark_id in results_by_id:
+        statuses[benchmark_id] = status_choices.COMPLETED
+
+    with transaction.atomic():
+        progresses = {
+            instance.benchmark_id: instance
+            for instance in benchmark_models.BenchmarkProgress.objects
+            .select_for_update()
+            .select_related('benchmark__site')
+            .filter(benchmark_id__in=statuses)
+        }
+        changed = []
+        benchmarks = []
+        sites = {}
+        for benchmark_id, instance in progresses.items():
+            benchmark = instance.benchmark
+            event = results_by_id.get(benchmark_id)
+            if event is not None:
+                for key, field in RESULT_FIELDS.items():
+                    setattr(benchmark, field, event.get(key))
+            # Events can arrive out of order once deferred, so the status
+            # only ever moves forward.
+            if instance.status < statuses[benchmark_id]:
+                instance.status = statuses[benchmark_id]
+                # Keep the status the instance was loaded with in step, as
+                # the status changed signal is not sent by a bulk update.
+                instance._status = instance.status
+                instance.log_status_time()
+                changed.append(instance)
+            if event is not None:
+                benchmark.site.last_benchmarked = benchmark.completed_on
+                sites[benchmark.site_id] = benchmark.site
+            if event is not None or instance in changed:
+                benchmarks.append(benchmark)
+
+        benchmark_models.BenchmarkProgress.objects.bulk_update(
+            changed,
+            ['status']
+        )
+        benchmark_models.Benchmark.objects.bulk_update(
+            benchmarks,
+            list(RESULT_FIELDS.values()) + STATUS_TIME_FIELDS
+        )
+        site_models.Site.objects.bulk_update(
+            sites.values(),
+            ['last_benchmarked']
+        )
+        transaction.on_commit(lambda: [
+            benchmark_signals.send_status_update(instance)
+            for instance in changed
+        ])
+
+    return {
+        'progress': [
+            event for event in progress
+            if event['benchmark_id'] not in progresses
+        ],
+        'results': [
+            event for event in results
+            if event['benchmark_id'] not in progresses
+        ],
+    }
+
+
+def apply_timeseries(timeseries: _t.List[dict]) -> _t.List[dict]:
+    """Applies time series events, replacing the series of each benchmark.
+
+    Args:
+        timeseries: Time series events, in the format of the
+            `benchmark_timeseries` endpoint.
+
+    Returns:
+        list: The events for benchmarks which do not exist yet.
+    """
+    benchmarks = benchmark_models.Benchmark.objects.in_bulk(
+        {event['benchmark_id'] for event in timeseries}
+    )
+    missing = []
+    for event in timeseries:
+        benchmark = benchmarks.get(event['benchmark_id'])
+        if benchmark is None:
+            missing.append(event)
+            continue
+        benchmark_models.BenchmarkTimeSeries.replace_for_benchmark(
+            benchmark,
+            start=event['start'],
+            requests=event['requests'],
+            errors=event['errors'],
+            latency_sum=event['latency_sum'],
+        )
+    return missing
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from ... import deferred
+
+
+class Command(BaseCommand):
+    help = (
+        'Applies the events from the controller which were deferred as '
+        'their benchmark was not visible yet.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to wait between each drain.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the events which are due once and exit.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            applied = deferred.drain()
+            if applied:
+                self.stdout.write(f'Applied {applied} deferred events')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,103 @@
+from django.test import TestCase
+from internal_api import deferred
+from django.urls import reverse
+from benchmark import models as benchmark_models
+from benchmark.tests.test_models import get_benchmark
+from .test_benchmark_results import post_token
+
+
+status_choices = benchmark_models.BenchmarkProgress.StatusChoices
+
+
+class TestBenchmarkBatch(TestCase):
+    """Tests the `benchmark_batch` endpoint."""
+
+    def setUp(self):
+        deferred._connection.delete(deferred.DEFERRED_KEY)
+        self.addCleanup(deferred._connection.delete, deferred.DEFERRED_KEY)
+
+    def results(self, benchmark_id: int) -> dict:
+        """Returns a sample results event."""
+        return {
+            'benchmark_id': benchmark_id,
+            'min_time': 1,
+            'max_time': 900,
+            'avg_time': 12,
+            'p99_time': 300,
+            'complete_requests': 100,
+            'failed_requests': 2,
+            'sys_error_requests': 0,
+        }
+
+    def test_applies_progress(self):
+        """Test that the progress of each benchmark in the batch is updated
+        and the events for unknown benchmarks are deferred.
+        """
+        first = get_benchmark()
+        second = get_benchmark(2)
+        unknown = {'benchmark_id': 0, 'status': status_choices.SCHEDULING}
+        response = post_token(
+            self.client,
+            reverse('benchmark_batch'),
+            {'progress': [
+                {
+                    'benchmark_id': first.id,
+                    'status': status_choices.PROVISIONING,
+                },
+                {
+                    'benchmark_id': second.id,
+                    'status': status_choices.SCHEDULING,
+                },
+                unknown,
+            ]}
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['deferred'], 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.progress.status, status_choices.PROVISIONING)
+        self.assertIsNotNone(first.started_on)
+        self.assertEqual(second.progress.status, status_choices.SCHEDULING)
+        self.assertIsNotNone(second.scheduled_on)
+
+    def test_applies_results(self):
+        """Test that results complete their benchmark."""
+        benchmark = get_benchmark()
+        response = post_token(
+            self.client,
+            reverse('benchmark_batch'),
+            {
+                'progress': [{
+                    'benchmark_id': benchmark.id,
+                    'status': status_choices.RESULTS,
+                }],
+                'results': [self.results(benchmark.id)],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.progress.status, status_choices.COMPLETED)
+        self.assertEqual(benchmark.mean_time, 12)
+        self.assertEqual(benchmark.p99_time, 300)
+        self.assertEqual(benchmark.completed_requests, 100)
+        self.assertIsNotNone(benchmark.completed_on)
+        self.assertEqual(
+            benchmark.site.last_benchmarked,
+            benchmark.completed_on
+        )
+
+    def test_constant_queries(self):
+        """Test that the number of queries does not grow with the size of
+        the batch.
+        """
+        benchmarks = [get_benchmark(seed) for seed in range(1, 6)]
+        with self.assertNumQueries(6):
+            post_token(
+                self.client,
+                reverse('benchmark_batch'),
+                {'results': [
+                    self.results(benchmark.id) for benchmark in benchmarks
+                ]}
+            )
@@ -0,0 +1,90 @@
+import json
+import jwt
+from django.conf import settings
+from django.test import TestCase
+from django.urls import reverse
+from benchmark.tests.test_models import get_benchmark
+
+
+def post_token(client, url: str, payload: dict):
+    """Posts a JWT signed payload to an internal API endpoint."""
+    token = jwt.encode(
+        payload,
+        settings.JWT['JWT_SECRET_KEY'],
+        algorithm=settings.JWT['JWT_ALGORITHM']
+    )
+    return client.post(
+        url,
+        json.dumps({'token': token}),
+        content_type='application/json'
+    )
+
+
+class TestBenchmarkResults(TestCase):
+    """Tests the `benchmark_results` endpoint."""
+
+    def payload(self, benchmark_id: int, **kwargs) -> dict:
+        """Returns a sample results payload."""
+        return {
+            'benchmark_id': benchmark_id,
+            'min_time': 1,
+            'max_time': 900,
+            'avg_time': 12,
+            'complete_requests': 100,
+            'failed_requests': 2,
+            'sys_error_requests': 0,
+        } | kwargs
+
+    def test_saves_results(self):
+        """Test that the results and percentiles are saved on the benchmark
+        and the benchmark is marked as completed.
+        """
+        benchmark = get_benchmark()
+        response = post_token(
+            self.client,
+            reverse('benchmark_results'),
+            self.payload(
+                benchmark.id,
+                p50_time=10,
+                p90_time=20,
+                p99_time=300,
+                p999_time=800,
+                start_skew_ms=3,
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.mean_time, 12)
+        self.assertEqual(benchmark.completed_requests, 100)
+        self.assertEqual(benchmark.p50_time, 10)
+        self.assertEqual(benchmark.p90_time, 20)
+        self.assertEqual(benchmark.p99_time, 300)
+        self.assertEqual(benchmark.p999_time, 800)
+        self.assertEqual(benchmark.start_skew_ms, 3)
+        self.assertIsNotNone(benchmark.completed_on)
+
+    def test_percentiles_optional(self):
+        """Test that results without percentiles are still accepted."""
+        benchmark = get_benchmark()
+        response = post_token(
+            self.client,
+            reverse('benchmark_results'),
+            self.payload(benchmark.id)
+        )
+        self.assertEqual(response.status_code, 200)
+
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.mean_time, 12)
+        self.assertIsNone(benchmark.p99_time)
+        self.assertIsNone(benchmark.start_skew_ms)
+
+    def test_invalid_token(self):
+        """Test that a payload signed with the wrong key is rejected."""
+        token = jwt.encode({'benchmark_id': 1}, 'wrong', algorithm='HS256')
+        response = self.client.post(
+            reverse('benchmark_results'),
+            json.dumps({'token': token}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,64 @@
+from django.test import TestCase
+from django.urls import reverse
+from benchmark.tests.test_models import get_benchmark
+from internal_api import deferred
+from .test_benchmark_results import post_token
+
+
+class TestBenchmarkTimeSeries(TestCase):
+    """Tests the `benchmark_timeseries` endpoint."""
+
+    def test_saves_timeseries(self):
+        """Test that a row is created for each second of the series."""
+        benchmark = get_benchmark()
+        response = post_token(
+            self.client,
+            reverse('benchmark_timeseries'),
+            {
+                'benchmark_id': benchmark.id,
+                'start': 1000,
+                'requests': [10, 20, 30],
+                'errors': [0, 1, 2],
+                'latency_sum': [1000, 2000, 3000],
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(benchmark.timeseries.values_list('requests', flat=True)),
+            [10, 20, 30]
+        )
+
+    def test_missing_benchmark(self):
+        """Test that the series for a benchmark which is not visible is
+        deferred rather than failing, and saved once the benchmark exists.
+        """
+        deferred._connection.delete(deferred.DEFERRED_KEY)
+        self.addCleanup(deferred._connection.delete, deferred.DEFERRED_KEY)
+        event = {
+            'benchmark_id': 0,
+            'start': 1000,
+            'requests': [10],
+            'errors': [0],
+            'latency_sum': [1000],
+        }
+        response = post_token(
+            self.client,
+            reverse('benchmark_timeseries'),
+            event
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(deferred.pending(), 1)
+        deferred._connection.delete(deferred.DEFERRED_KEY)
+
+        benchmark = get_benchmark()
+        deferred.defer(
+            [],
+            [],
+            [{**event, 'benchmark_id': benchmark.id}],
+            now=0
+        )
+        self.assertEqual(deferred.drain(now=deferred.RETRY_DELAY), 1)
+        self.assertEqual(
+            list(benchmark.timeseries.values_list('requests', flat=True)),
+            [10]
+        )
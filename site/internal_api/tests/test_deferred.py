@@ -0,0 +1,154 @@
+import time
+from unittest import mock
+from django.test import TestCase
+from django.urls import reverse
+from benchmark import models as benchmark_models
+from benchmark.tests.test_models import get_benchmark
+from internal_api import deferred, ingest
+from .test_benchmark_results import post_token
+
+
+status_choices = benchmark_models.BenchmarkProgress.StatusChoices
+
+
+class TestDeferred(TestCase):
+    """Tests deferring the events for benchmarks which are not visible."""
+
+    def setUp(self):
+        keys = (deferred.DEFERRED_KEY, deferred.DEAD_LETTER_KEY)
+        deferred._connection.delete(*keys)
+        self.addCleanup(deferred._connection.delete, *keys)
+
+    def test_progress_not_blocking(self):
+        """Test that progress for a missing benchmark is deferred and the
+        request returns without waiting.
+        """
+        with mock.patch('time.sleep', side_effect=AssertionError):
+            started = time.monotonic()
+            response = post_token(
+                self.client,
+                reverse('benchmark_progress'),
+                {'benchmark_id': 0, 'status': status_choices.SCHEDULING}
+            )
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(deferred.pending(), 1)
+
+    def test_progress_applied(self):
+        """Test that progress for an existing benchmark is applied straight
+        away.
+        """
+        benchmark = get_benchmark()
+        response = post_token(
+            self.client,
+            reverse('benchmark_progress'),
+            {
+                'benchmark_id': benchmark.id,
+                'status': status_choices.PROVISIONING,
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(deferred.pending(), 0)
+        benchmark.refresh_from_db()
+        self.assertEqual(
+            benchmark.progress.status,
+            status_choices.PROVISIONING
+        )
+
+    def test_drain(self):
+        """Test that a deferred event is applied once its benchmark exists
+        and it is due.
+        """
+        benchmark = get_benchmark()
+        deferred.defer(
+            [{'benchmark_id': benchmark.id, 'status': status_choices.RESULTS}],
+            [],
+            now=1000
+        )
+        self.assertEqual(deferred.drain(now=1000), 0)
+        self.assertEqual(deferred.drain(now=1000 + deferred.RETRY_DELAY), 1)
+        self.assertEqual(deferred.pending(), 0)
+
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.progress.status, status_choices.RESULTS)
+
+    def test_drain_backs_off(self):
+        """Test that an event whose benchmark is still missing is tried again
+        with a growing delay until it is dropped.
+        """
+        now = 1000
+        deferred.defer([], [{'benchmark_id': 0}], now=now)
+        for attempt in range(1, deferred.MAX_ATTEMPTS):
+            self.assertEqual(deferred.pending(), 1)
+            now += deferred.retry_delay(attempt)
+            self.assertEqual(deferred.drain(now=now - 0.1), 0)
+            self.assertEqual(deferred.pending(), 1)
+            if attempt == deferred.MAX_ATTEMPTS - 1:
+                with self.assertLogs(deferred.logger, 'ERROR'):
+                    deferred.drain(now=now)
+            else:
+                deferred.drain(now=now)
+        self.assertEqual(deferred.pending(), 0)
+        dropped, = deferred.dead_letters()
+        self.assertEqual(dropped['kind'], 'results')
+        self.assertEqual(dropped['event'], {'benchmark_id': 0})
+        self.assertEqual(dropped['attempts'], deferred.MAX_ATTEMPTS)
+
+    def test_drain_attempts_per_event(self):
+        """Test that events for the same benchmark keep their own number of
+        attempts.
+        """
+        deferred.defer([], [{'benchmark_id': 0}], now=0)
+        deferred.defer(
+            [],
+            [{'benchmark_id': 0}],
+            attempts=deferred.MAX_ATTEMPTS - 1,
+            now=0
+        )
+        with self.assertLogs(deferred.logger, 'ERROR'):
+            deferred.drain(now=deferred.MAX_RETRY_DELAY)
+        self.assertEqual(deferred.pending(), 1)
+        self.assertEqual(len(deferred.dead_letters()), 1)
+
+    def test_drain_apply_fails(self):
+        """Test that events are deferred again rather than lost when
+        applying them fails.
+        """
+        benchmark = get_benchmark()
+        deferred.defer(
+            [{'benchmark_id': benchmark.id, 'status': status_choices.RESULTS}],
+            [],
+            now=0
+        )
+        with mock.patch.object(
+            ingest,
+            'apply_events',
+            side_effect=RuntimeError
+        ), self.assertLogs(deferred.logger, 'ERROR'):
+            self.assertEqual(deferred.drain(now=deferred.RETRY_DELAY), 0)
+        self.assertEqual(deferred.pending(), 1)
+
+        self.assertEqual(deferred.drain(now=deferred.MAX_RETRY_DELAY), 1)
+        self.assertEqual(deferred.pending(), 0)
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.progress.status, status_choices.RESULTS)
+
+    def test_stale_progress(self):
+        """Test that a deferred status older than the current status is not
+        applied.
+        """
+        benchmark = get_benchmark()
+        benchmark.progress.status = status_choices.RESULTS
+        benchmark.progress.save()
+        deferred.defer(
+            [{
+                'benchmark_id': benchmark.id,
+                'status': status_choices.PROVISIONING,
+            }],
+            [],
+            now=0
+        )
+        deferred.drain(now=deferred.MAX_RETRY_DELAY)
+
+        benchmark.refresh_from_db()
+        self.assertEqual(benchmark.progress.status, status_choices.RESULTS)
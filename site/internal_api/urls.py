@@ -12,4 +12,14 @@ urlpatterns = [
         views.benchmark_results,
         name='benchmark_results'
     ),
+    path(
+        'benchmark-batch/',
+        views.benchmark_batch,
+        name='benchmark_batch'
+    ),
+    path(
+        'benchmark-timeseries/',
+        views.benchmark_timeseries,
+        name='benchmark_timeseries'
+    ),
 ]
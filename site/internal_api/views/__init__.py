@@ -1,4 +1,6 @@
 # flake8: noqa
 
+from .benchmark_batch import benchmark_batch
 from .benchmark_progress import benchmark_progress
 from .benchmark_results import benchmark_results
+from .benchmark_timeseries import benchmark_timeseries
@@ -0,0 +1,22 @@
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from ..decorators import validate_jwt_payload
+from .. import deferred, ingest
+
+
+@validate_jwt_payload
+def benchmark_batch(request: HttpRequest, payload: dict) -> HttpResponse:
+    """API endpoint for applying a batch of progress and results events in
+    one go. Events for benchmarks which are not yet visible are deferred and
+    applied later.
+    """
+    missing = ingest.apply_events(
+        payload.get('progress', []),
+        payload.get('results', []),
+    )
+    num_deferred = deferred.defer(**missing)
+    if num_deferred:
+        return JsonResponse(
+            {'success': True, 'deferred': num_deferred},
+            status=202
+        )
+    return JsonResponse({'success': True})
@@ -0,0 +1,14 @@
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from ..decorators import validate_jwt_payload
+from .. import deferred, ingest
+
+
+@validate_jwt_payload
+def benchmark_timeseries(request: HttpRequest, payload: dict) -> HttpResponse:
+    """API endpoint for saving the per-second throughput of a benchmark. The
+    series is deferred if the benchmark is not yet visible.
+    """
+    missing = ingest.apply_timeseries([payload])
+    if deferred.defer([], [], missing):
+        return JsonResponse({'success': True, 'deferred': 1}, status=202)
+    return JsonResponse({'success': True})
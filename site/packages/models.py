@@ -10,6 +10,14 @@ class Package(models.Model):
     """Represents a package."""
 
     ALL_PACKAGES_CACHE_KEY = 'all_packages'
+    # Dropped whenever a package changes so that the packages kept with the
+    # accounts in the sessions are reloaded.
+    VERSION_CACHE_KEY = 'package_version'
+    # Priority classes the controller queues benchmarks in, from the highest
+    # to the lowest.
+    QUEUE_PRIORITY_PAID = 0
+    QUEUE_PRIORITY_FREE = 1
+
     stripe_product_id = models.CharField(
         max_length=100,
         unique=True,
@@ -50,7 +58,10 @@ class Package(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        cache.delete(self.ALL_PACKAGES_CACHE_KEY)
+        cache.delete_many([
+            self.ALL_PACKAGES_CACHE_KEY,
+            self.VERSION_CACHE_KEY,
+        ])
         price_changed = (
             self._old_price is not None
             and self.price != self._old_price
@@ -59,6 +70,26 @@ class Package(models.Model):
         if price_changed:
             PACKAGE_PRICE_UPDATED.send(sender=self.__class__, instance=self)
 
+    @property
+    def queue_priority(self) -> int:
+        """Returns the priority class benchmarks requested under this package
+        are queued in. Benchmarks for paid packages are run before any
+        benchmarks for free packages.
+        """
+        if self.price > 0:
+            return self.QUEUE_PRIORITY_PAID
+        return self.QUEUE_PRIORITY_FREE
+
+    @property
+    def queue_weight(self) -> int:
+        """Returns the share of the queue an account on this package is
+        entitled to relative to other accounts in the same priority class.
+        The share is in proportion to the number of instances the package
+        allows per benchmark, so that a benchmark using all of them takes up
+        the same share whichever the package.
+        """
+        return max(self.instances, 1)
+
     @ classmethod
     def free_package(cls):
         """Returns the free package."""
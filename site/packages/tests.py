@@ -1,3 +1,37 @@
 from django.test import TestCase
+from . import models as package_models
 
-# Create your tests here.
+
+class TestPackage(TestCase):
+    """Tests the `Package` model."""
+
+    def package(self, price: int, instances: int) -> package_models.Package:
+        """Returns an unsaved package."""
+        return package_models.Package(
+            name=f'Package {price}',
+            price=price,
+            instances=instances,
+            requests=100,
+            refresh_period=30,
+            quota=10,
+        )
+
+    def test_queue_priority(self):
+        """Test that paid packages are queued ahead of free packages."""
+        self.assertEqual(
+            self.package(10, 4).queue_priority,
+            package_models.Package.QUEUE_PRIORITY_PAID
+        )
+        self.assertEqual(
+            self.package(0, 1).queue_priority,
+            package_models.Package.QUEUE_PRIORITY_FREE
+        )
+        self.assertEqual(
+            package_models.Package.free_package().queue_priority,
+            package_models.Package.QUEUE_PRIORITY_FREE
+        )
+
+    def test_queue_weight(self):
+        """Test that the weight is the number of instances per benchmark."""
+        self.assertEqual(self.package(10, 4).queue_weight, 4)
+        self.assertEqual(self.package(0, 0).queue_weight, 1)
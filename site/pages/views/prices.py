@@ -4,7 +4,7 @@ from packages import models as packages_models
 
 def prices(request):
 
-    if request.account is not None:
+    if request.account:
         owned_packages = set(
             request.account.package_history.active().values_list(
                 'package_id',
@@ -1,17 +1,29 @@
 import { BuildURL } from '../../../core_functions/ts/build_url';
 
-interface WSResponseData {
+/**Metrics of a running benchmark over the last second. */
+interface LiveMetrics {
+  rps: number;
+  error_rate: number;
+  p50_time: number | null;
+  p99_time: number | null;
+}
+
+/**An update to a benchmark. Only the fields which changed are sent. */
+interface BenchmarkUpdate {
   benchmark_id: number;
-  status: string;
-  num_servers: number;
-  num_requests: number;
-  completed_requests: number;
-  failed_requests: number;
-  created_on: string;
-  scheduled_on: string | null;
-  min_time: string | null;
-  mean_time: string | null;
-  max_time: string | null;
+  status?: string;
+  completed_requests?: number;
+  failed_requests?: number;
+  scheduled_on?: string;
+  min_time?: number | null;
+  mean_time?: number | null;
+  max_time?: number | null;
+  p99_time?: number | null;
+  live?: LiveMetrics;
+}
+
+interface WSResponseData {
+  updates: BenchmarkUpdate[];
 }
 
 /**
@@ -51,15 +63,7 @@ const benchmarkProgress = () => {
 
   ws.onmessage = (event) => {
     const data = JSON.parse(event.data) as WSResponseData;
-    console.log(data);
-
-    const row = document.querySelector(
-      `[data-benchmark-id="${data.benchmark_id}"]`
-    );
-    console.log(row);
-    if (!row) return;
-    updateRow(data);
-
+    data.updates.forEach(updateRow);
   }
 
   ws.onclose = (_) => {
@@ -80,77 +84,78 @@ const benchmarkProgress = () => {
   }
 
   /**
-   * Updates a row in the table with new data.
-   * @param benchmarkID - The benchmark ID.
-   * @param data - The data to update the row with.
+   * Sets the text of a cell in a row.
+   * @param row - The row of the benchmark.
+   * @param type - The type of the cell.
+   * @param value - The new value of the cell.
    */
-  const updateRow = (data: WSResponseData) => {
+  const setCell = (
+    row: HTMLTableRowElement,
+    type: string,
+    value: string | number,
+  ) => {
+    row.querySelector(`[data-type="${type}"]`)!.textContent = value.toString();
+  }
+
+  /**
+   * Updates a row in the table with the fields which changed.
+   * @param data - The update to apply to the row.
+   */
+  const updateRow = (data: BenchmarkUpdate) => {
     const row = document.querySelector(
       `[data-benchmark-id="${data.benchmark_id}"]`
-    ) as HTMLTableRowElement;
-
-    // Created on
-    row.querySelector(
-      '[data-type="created-on"]'
-    )!.textContent = data.created_on;
+    ) as HTMLTableRowElement | null;
+    if (!row) return;
 
-    // Scheduled on
     if (data.scheduled_on) {
-      row.querySelector(
-        '[data-type="scheduled-on"]'
-      )!.textContent = data.scheduled_on;
+      setCell(row, 'scheduled-on', data.scheduled_on);
     }
 
-    // Status
-    const statusInnerContainer = row.querySelector(
-      '[data-type="status"] .benchmark-table__inner-container'
-    ) as HTMLElement;
-    statusInnerContainer.querySelector('span')!.textContent = data.status;
-    if (data.status === 'Completed') {
-      statusInnerContainer.querySelector('.spinner')?.remove();
+    if (data.status) {
+      const statusInnerContainer = row.querySelector(
+        '[data-type="status"] .benchmark-table__inner-container'
+      ) as HTMLElement;
+      statusInnerContainer.querySelector('span')!.textContent = data.status;
+      if (data.status === 'Completed') {
+        statusInnerContainer.querySelector('.spinner')?.remove();
+        setCell(row, 'live', '');
+      }
     }
 
-    // Number of servers
-    row.querySelector(
-      '[data-type="num-servers"]'
-    )!.textContent = data.num_servers.toString();
-
-    // Number of requests
-    row.querySelector(
-      '[data-type="num-requests"]'
-    )!.textContent = data.num_requests.toString();
-
-    // Min response time
-    if (data.min_time && data.min_time != '0') {
-      row.querySelector(
-        '[data-type="min-time"]'
-      )!.textContent = data.min_time;
+    // Metrics relayed after the benchmark completed are out of date.
+    if (data.live && row.querySelector('.spinner')) {
+      const live = data.live;
+      const times = live.p50_time === null
+        ? ''
+        : ` · p50 ${live.p50_time} ms · p99 ${live.p99_time} ms`;
+      setCell(
+        row,
+        'live',
+        `${Math.round(live.rps)} req/s · `
+        + `${(live.error_rate * 100).toFixed(1)}% errors${times}`,
+      );
     }
 
-    // Mean response time
-    if (data.mean_time && data.mean_time != '0') {
-      row.querySelector(
-        '[data-type="mean-time"]'
-      )!.textContent = data.mean_time;
-    }
+    // Response times
+    const times: [keyof BenchmarkUpdate, string][] = [
+      ['min_time', 'min-time'],
+      ['mean_time', 'mean-time'],
+      ['max_time', 'max-time'],
+      ['p99_time', 'p99-time'],
+    ];
+    times.forEach(([field, type]) => {
+      const value = data[field];
+      if (value) {
+        setCell(row, type, value);
+      }
+    });
 
-    // Max response time
-    if (data.max_time && data.max_time != '0') {
-      row.querySelector(
-        '[data-type="max-time"]'
-      )!.textContent = data.max_time;
+    if (data.completed_requests !== undefined) {
+      setCell(row, 'completed-requests', data.completed_requests);
+    }
+    if (data.failed_requests !== undefined) {
+      setCell(row, 'failed-requests', data.failed_requests);
     }
-
-    // Completed requests
-    row.querySelector(
-      '[data-type="completed-requests"]'
-    )!.textContent = data.completed_requests.toString();
-
-    // Failed requests
-    row.querySelector(
-      '[data-type="failed-requests"]'
-    )!.textContent = data.failed_requests.toString();
-
   }
 }
 
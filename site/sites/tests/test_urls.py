@@ -32,3 +32,12 @@ class TestUrls(SimpleTestCase):
             )).func,
             views.verification_check_api
         )
+
+    def test_benchmark_timeseries_api(self):
+        self.assertEquals(
+            resolve(reverse(
+                'benchmark_timeseries_api',
+                args=[1, 'test-site', 1]
+            )).func,
+            views.benchmark_timeseries_api
+        )
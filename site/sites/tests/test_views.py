@@ -2,6 +2,7 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from accounts import models as account_models
+from benchmark import models as benchmark_models
 from .. import models as site_models
 
 
@@ -48,6 +49,55 @@ class TestNewSiteView(TestCase):
         )
         self.assertTemplateUsed(response, 'sites/site.html')
         self.assertEqual(response.status_code, 200)
+
+    def test_benchmark_timeseries_api(self):
+        """Test that the time series for a benchmark is returned as chart
+        data.
+        """
+        site = site_models.Site.objects.create(
+            name='Test Site',
+            domain='iamsalaah.com',
+        )
+        site.add_account(self.account, 0)
+        benchmark = benchmark_models.Benchmark.objects.create(
+            site=site,
+            requested_by=self.account,
+        )
+        benchmark_models.BenchmarkTimeSeries.replace_for_benchmark(
+            benchmark, 1000, [5, 10], [0, 1], [5000, 20000]
+        )
+
+        response = self.client.get(reverse(
+            'benchmark_timeseries_api',
+            args=[site.id, site.slug, benchmark.id]
+        ))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['requests'], [5, 10])
+        self.assertEqual(data['mean_time'], [1, 2])
+
+    def test_benchmark_timeseries_api_other_site(self):
+        """Test that a benchmark for another site is not returned."""
+        site = site_models.Site.objects.create(
+            name='Test Site',
+            domain='iamsalaah.com',
+        )
+        site.add_account(self.account, 0)
+        other_site = site_models.Site.objects.create(
+            name='Other Site',
+            domain='example.com',
+        )
+        benchmark = benchmark_models.Benchmark.objects.create(
+            site=other_site,
+            requested_by=self.account,
+        )
+
+        response = self.client.get(reverse(
+            'benchmark_timeseries_api',
+            args=[site.id, site.slug, benchmark.id]
+        ))
+        self.assertEqual(response.status_code, 404)
+
     def test_post_new_site(self):
         """Test that a new site can be created."""
         response = self.client.post(
@@ -9,4 +9,6 @@ urlpatterns = [
     path('new/', views.NewSite.as_view(), name='new_site'),
     path(f'{site_uri}/verification-check/', views.verification_check_api,
          name='verification_check_api'),
+    path(f'{site_uri}/benchmarks/<int:benchmark_id>/timeseries/',
+         views.benchmark_timeseries_api, name='benchmark_timeseries_api'),
 ]
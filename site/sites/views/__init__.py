@@ -3,3 +3,4 @@ from .dashboard import dashboard
 from .site import site
 from .new_site import NewSite
 from .verification_check_api import verification_check_api
+from .benchmark_timeseries_api import benchmark_timeseries_api
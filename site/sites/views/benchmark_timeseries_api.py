@@ -0,0 +1,34 @@
+from django.http import HttpRequest, JsonResponse
+from benchmark import models as benchmark_models
+from ..decorators import required_site_access
+from .. import models as site_models
+
+
+@required_site_access
+def benchmark_timeseries_api(
+    request: HttpRequest,
+    site: site_models.Site,
+    site_access: site_models.SiteAccess,
+    benchmark_id: int,
+) -> JsonResponse:
+    """API endpoint returning the per-second throughput of a benchmark in a
+    format which can be passed straight to a chart.
+    Args:
+        request (HttpRequest): The request object.
+        site (site_models.Site): The site object.
+        site_access (site_models.SiteAccess): The site access object.
+        benchmark_id (int): The benchmark ID.
+    """
+    benchmark = benchmark_models.Benchmark.for_site(site).filter(
+        id=benchmark_id
+    ).first()
+    if benchmark is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Benchmark not found.'
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'data': benchmark_models.BenchmarkTimeSeries.chart_data(benchmark)
+    })